@@ -0,0 +1,32 @@
+"""
+Statement-level deletes for the bulk write paths.
+
+QuerySet.delete() loads the rows and sends pre/post_delete for each of them
+whenever a receiver is connected, while the imports, the checkout and the
+cart API delete many child rows at once and refresh the counters, totals
+and indexes those signals maintain once for the whole batch. delete_rows()
+selects the primary keys of a queryset and removes them with plain DELETE
+statements through a cursor: no signals and no cascades, so it is only for
+models nothing else points at.
+"""
+from django.db import connections
+
+# Primary keys per DELETE statement, well under SQLite's parameter limit
+CHUNK_SIZE = 500
+
+
+def delete_rows(queryset):
+    """Delete the rows of a queryset without loading them, returns how many went"""
+    model = queryset.model
+    connection = connections[queryset.db]
+    pks = list(queryset.values_list('pk', flat=True))
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    deleted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), CHUNK_SIZE):
+            chunk = pks[start:start + CHUNK_SIZE]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', chunk)
+            deleted += cursor.rowcount
+    return deleted
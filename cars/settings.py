@@ -41,15 +41,19 @@ INSTALLED_APPS = [
     'products',
     'customers',
     'orders',
+    'diagnostics',
 
 ]
 
 MIDDLEWARE = [
+    'diagnostics.query_stats.QueryStatsMiddleware',
+    'diagnostics.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'orders.guest_cart.GuestCartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,10 +89,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so concurrent checkouts
+            # wait their turn instead of failing with "database is locked"
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+
+# Must be shared by every worker process: the catalog index, vehicle tree,
+# category tree and product detail caches announce their invalidations through
+# it, and the per-process default (LocMemCache) would leave the other workers
+# serving stale data until restarted. The file cache is shared by all processes
+# on this host, which are all the processes that can open the SQLite database;
+# once the database is shared between hosts, point this at Redis
+# (django.core.cache.backends.redis.RedisCache) instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
+
+# Tests get a private in-memory cache instead
+TEST_RUNNER = 'cars.testing.TestRunner'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -133,3 +168,12 @@ STATIC_ROOT = BASE_DIR / "staticfiles"  # For collectstatic (production)
 # Media files (user uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / "media"
+
+# Share of requests whose SQL is timed and checked for repeats (see diagnostics/query_stats.py)
+QUERY_STATS_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+
+# Share of requests run under cProfile, see diagnostics/profiling.py; a single
+# request is profiled by sending the header that `manage.py profile_report --token`
+# prints, and `manage.py profile_report` summarizes the dumps per view
+PROFILING_SAMPLE_RATE = 0
+PROFILING_DIR = BASE_DIR / 'profiles'
@@ -0,0 +1,200 @@
+"""
+Query budgets for the admin changelists.
+
+ChangelistQueryBudgetMixin renders every changelist registered for an app
+twice: once with a single row per model and once with more rows than fit on
+a page. The second render must issue exactly as many queries as the first
+(anything per row, a __str__ following a foreign key or a .count() in a
+list_display method, makes it grow) and no more than the model's budget.
+Pages are shrunk to PAGE_SIZE rows so a full page stays cheap to build.
+
+TestRunner (the project's TEST_RUNNER) swaps the shared cache for a private
+in-memory one, so a test run neither reads nor overwrites what the running
+site has cached. CatalogTestCase also forgets what each process keeps in
+module globals (the catalog index, the vehicle tree, decoded VINs), and the
+make_* builders create the smallest rows the storefront tests need.
+"""
+import itertools
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.text import slugify
+
+PAGE_SIZE = 5
+
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests',
+    }
+}
+
+_sequence = itertools.count(1)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = override_settings(CACHES=TEST_CACHES)
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+def create_sample_rows(count):
+    """count more rows of every model the admin lists, each with its own related rows"""
+    from customers.models import Address, Customer, CustomerVehicle
+    from orders.models import Cart, CartItem, Order, OrderItem, StockReservation
+    from products.models import (
+        Category, Manufacturer, Product, ProductDocument, ProductFitment, ProductSpecification,
+    )
+    from vehicles.models import Make, Model, Vehicle
+
+    for _ in range(count):
+        n = next(_sequence)
+        make = Make.objects.create(name=f'Make {n}', slug=f'make-{n}')
+        model = Model.objects.create(make=make, name=f'Model {n}', slug=f'model-{n}')
+        vehicle = Vehicle.objects.create(model=model, year=2000 + n % 25, trim=f'Trim {n}', body_type='Sedan')
+
+        parent = Category.objects.create(name=f'Category {n}', slug=f'category-{n}')
+        category = Category.objects.create(name=f'Subcategory {n}', slug=f'subcategory-{n}', parent=parent)
+        manufacturer = Manufacturer.objects.create(name=f'Manufacturer {n}', slug=f'manufacturer-{n}')
+        product = Product.objects.create(
+            title=f'Part {n}', sku=f'SKU-{n}', description='', unit_price=Decimal('10.00'),
+            category=category, manufacturer=manufacturer, part_number=f'P-{n}', oem_part_number=f'OEM-{n}',
+        )
+        ProductSpecification.objects.create(product=product, name='Weight', value='1.5', unit='kg')
+        ProductFitment.objects.create(product=product, vehicle=vehicle, position='Front')
+        ProductDocument.objects.create(product=product, document_type='INSTALL', title='Installation')
+
+        user = User.objects.create_user(f'customer{n}', first_name='Sample', last_name=f'Customer {n}')
+        customer = Customer.objects.create(user=user, email=f'customer{n}@example.com')
+        address = Address.objects.create(customer=customer, street=f'{n} Main St', city='Springfield')
+        CustomerVehicle.objects.create(customer=customer, vehicle=vehicle)
+
+        cart = Cart.objects.create(customer=customer)
+        CartItem.objects.create(cart=cart, product=product, quantity=1, unit_price=product.unit_price)
+        StockReservation.objects.create(
+            cart=cart, product=product, quantity=1, expires_at=timezone.now() + timedelta(minutes=15),
+        )
+        order = Order.objects.create(customer=customer, shipping_address=address, order_number=f'SAMPLE-{n}')
+        OrderItem.objects.create(order=order, product=product, quantity=1, unit_price=product.unit_price)
+
+
+def reset_process_caches():
+    """Forget what the shared cache and this process remember about the catalog"""
+    from products.catalog_index import catalog_index
+    from vehicles import vehicle_tree, vin
+
+    cache.clear()
+    catalog_index.reset()
+    vehicle_tree._tree = None
+    vin._decode_prefix.cache_clear()
+
+
+class CatalogTestCase(TestCase):
+    """TestCase starting every test with empty caches, see reset_process_caches()"""
+
+    def setUp(self):
+        super().setUp()
+        reset_process_caches()
+
+
+def make_vehicle(make='Toyota', model='Camry', year=2018, trim='LE', **fields):
+    from vehicles.models import Make, Model, Vehicle
+
+    make, _ = Make.objects.get_or_create(name=make, defaults={'slug': slugify(make)})
+    model, _ = Model.objects.get_or_create(make=make, name=model, defaults={'slug': slugify(model)})
+    return Vehicle.objects.create(model=model, year=year, trim=trim, **fields)
+
+
+def make_category(name, parent=None):
+    from products.models import Category
+
+    return Category.objects.create(name=name, slug=slugify(name), parent=parent)
+
+
+def make_product(title, category, price='10.00', inventory=10, **fields):
+    from products.models import Product
+
+    fields.setdefault('sku', slugify(title).upper())
+    fields.setdefault('description', '')
+    return Product.objects.create(
+        title=title, category=category, unit_price=Decimal(price), inventory=inventory, **fields,
+    )
+
+
+def make_customer(username='shopper', password='secret'):
+    from customers.models import Customer
+
+    user = User.objects.create_user(username, f'{username}@example.com', password)
+    return Customer.objects.create(user=user, email=user.email)
+
+
+class ChangelistQueryBudgetMixin:
+    """
+    Mix into a TestCase with app_label set. query_budgets overrides
+    default_budget per model name.
+    """
+    app_label = None
+    default_budget = 8
+    query_budgets = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.superuser = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.superuser)
+
+    def registered_models(self):
+        return [model for model in admin.site._registry if model._meta.app_label == self.app_label]
+
+    def changelist_queries(self, model):
+        """Queries captured while rendering the model's changelist, PAGE_SIZE rows per page"""
+        url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+        with mock.patch.object(admin.site._registry[model], 'list_per_page', PAGE_SIZE):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, f'{url} returned {response.status_code}')
+        return queries
+
+    def test_changelists_within_query_budget(self):
+        models = self.registered_models()
+        self.assertTrue(models, f'no models of {self.app_label!r} are registered with the admin')
+
+        create_sample_rows(1)
+        for model in models:
+            # Warm up anything cached per process
+            self.changelist_queries(model)
+        single_row = {model: len(self.changelist_queries(model)) for model in models}
+
+        create_sample_rows(PAGE_SIZE + 1)
+        for model in models:
+            name = model._meta.model_name
+            with self.subTest(model=name):
+                queries = self.changelist_queries(model)
+                sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+                self.assertEqual(
+                    len(queries), single_row[model],
+                    f'{name} changelist queries grow with the rows on the page:\n{sql}',
+                )
+                budget = self.query_budgets.get(name, self.default_budget)
+                self.assertLessEqual(
+                    len(queries), budget,
+                    f'{name} changelist takes {len(queries)} queries, its budget is {budget}:\n{sql}',
+                )
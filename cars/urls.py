@@ -29,6 +29,7 @@ urlpatterns = [
     path('vehicles/', include('vehicles.urls')),  # Vehicle selection
     path('customers/', include('customers.urls')),  # Customer management
     path('cart/', include('orders.urls')),        # Shopping cart
+    path('diagnostics/', include('diagnostics.urls')),  # Staff-only performance data
 ]
 
 if settings.DEBUG:
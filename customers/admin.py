@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Count
 from django.utils.html import format_html
 from .models import Customer, Address, CustomerVehicle
 
@@ -24,6 +25,7 @@ class CustomerAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'email', 'phone')
     autocomplete_fields = ['user']
     inlines = [AddressInline, CustomerVehicleInline]
+    list_select_related = ['user']
     
     fieldsets = (
         ('User Information', {
@@ -42,14 +44,21 @@ class CustomerAdmin(admin.ModelAdmin):
     get_full_name.short_description = 'Name'
     
     def get_vehicle_count(self, obj):
-        count = obj.vehicles.count()
-        return format_html('<span style="color: #0066cc;">{}</span>', count)
+        return format_html('<span style="color: #0066cc;">{}</span>', obj.vehicle_count)
     get_vehicle_count.short_description = 'Vehicles'
+    get_vehicle_count.admin_order_field = 'vehicle_count'
     
     def get_address_count(self, obj):
-        count = obj.addresses.count()
-        return format_html('<span style="color: #0066cc;">{}</span>', count)
+        return format_html('<span style="color: #0066cc;">{}</span>', obj.address_count)
     get_address_count.short_description = 'Addresses'
+    get_address_count.admin_order_field = 'address_count'
+    
+    def get_queryset(self, request):
+        # Both counts in the page query; distinct since the two joins multiply rows
+        return super().get_queryset(request).annotate(
+            vehicle_count=Count('vehicles', distinct=True),
+            address_count=Count('addresses', distinct=True),
+        )
 
 
 @admin.register(Address)
@@ -58,6 +67,7 @@ class AddressAdmin(admin.ModelAdmin):
     list_filter = ('city', 'is_default')
     search_fields = ('customer__user__username', 'customer__user__first_name', 'customer__user__last_name', 'street', 'city')
     autocomplete_fields = ['customer']
+    list_select_related = ['customer__user']
     
     fieldsets = (
         ('Customer', {
@@ -74,10 +84,11 @@ class CustomerVehicleAdmin(admin.ModelAdmin):
     list_display = ('customer', 'vehicle', 'nickname', 'is_primary', 'vin', 'mileage', 'added_at')
     list_filter = ('is_primary', 'added_at')
     search_fields = ('customer__user__username', 'customer__user__first_name', 'customer__user__last_name', 
-                    'vehicle__make__name', 'vehicle__model__name', 'nickname', 'vin')
+                    'vehicle__label', 'nickname', 'vin')
     autocomplete_fields = ['customer', 'vehicle']
     readonly_fields = ('added_at',)
     date_hierarchy = 'added_at'
+    list_select_related = ['customer__user', 'vehicle']
     
     fieldsets = (
         ('Customer & Vehicle', {
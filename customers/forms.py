@@ -1,7 +1,7 @@
 # customers/forms.py
 from django import forms
 from django.contrib.auth.models import User
-from .models import Customer
+from .models import Address, Customer
 
 class UserRegistrationForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput)
@@ -15,4 +15,9 @@ class UserRegistrationForm(forms.ModelForm):
         cd = self.cleaned_data
         if cd['password'] != cd['password2']:
             raise forms.ValidationError('Passwords do not match.')
-        return cd['password2']
\ No newline at end of file
+        return cd['password2']
+
+class AddressForm(forms.ModelForm):
+    class Meta:
+        model = Address
+        fields = ['street', 'city', 'is_default']
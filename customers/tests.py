@@ -1,3 +1,7 @@
 from django.test import TestCase
 
-# Create your tests here.
+from cars.testing import ChangelistQueryBudgetMixin
+
+
+class ChangelistQueryBudgetTests(ChangelistQueryBudgetMixin, TestCase):
+    app_label = 'customers'
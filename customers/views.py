@@ -4,8 +4,9 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.utils.http import url_has_allowed_host_and_scheme
 from .models import Customer, Address, CustomerVehicle
-from .forms import UserRegistrationForm
+from .forms import AddressForm, UserRegistrationForm
 
 def register(request):
     if request.method == 'POST':
@@ -56,11 +57,35 @@ def logout_view(request):
 def profile(request):
     customer = request.user.customer
     addresses = customer.addresses.all()
-    vehicles = customer.vehicles.select_related('vehicle__model__make').all()
+    vehicles = customer.vehicles.select_related('vehicle').all()
 
     context = {
         'customer': customer,
         'addresses': addresses,
         'vehicles': vehicles,
     }
-    return render(request, 'customers/profile.html', context)
\ No newline at end of file
+    return render(request, 'customers/profile.html', context)
+
+@login_required
+def add_address(request):
+    """Add a shipping address, then go back to where the customer came from"""
+    customer = request.user.customer
+    next_url = request.GET.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = None
+    
+    if request.method == 'POST':
+        form = AddressForm(request.POST)
+        if form.is_valid():
+            address = form.save(commit=False)
+            address.customer = customer
+            if address.is_default or not customer.addresses.exists():
+                customer.addresses.update(is_default=False)
+                address.is_default = True
+            address.save()
+            messages.success(request, 'Address saved.')
+            return redirect(next_url) if next_url else redirect('customers:profile')
+    else:
+        form = AddressForm()
+    
+    return render(request, 'customers/address_form.html', {'form': form})
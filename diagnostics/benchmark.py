@@ -0,0 +1,189 @@
+"""
+Storefront load benchmark over the real URL routes.
+
+Simulated shoppers each hold a django.test.Client (their own session and
+cookies) and run in threads of this process, so a run needs no web server.
+Every shopper has picked a popular vehicle and, when logged in, has a
+customer account with an address and a cart line, so every route in the
+mix can be requested at any time. A shopper draws each request's route from
+the mix with its own seeded random.Random.
+
+Each request records its latency and the number of queries it ran on the
+thread's connection. summarize() turns the samples into per-route
+throughput, latency percentiles and queries per request; compare() lines a
+run up against a stored baseline. The process runs the whole stack (and
+the GIL), so the numbers are for comparing runs on one machine rather than
+for sizing production.
+"""
+import random
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+# Route -> relative weight in the default mix
+DEFAULT_MIX = {
+    'home': 10,
+    'product_list': 15,
+    'product_list_vehicle': 20,
+    'product_detail': 25,
+    'vehicle_selector': 10,
+    'add_to_cart': 8,
+    'cart_detail': 8,
+    'checkout': 4,
+}
+
+# Routes only a logged-in shopper can request
+LOGIN_ROUTES = {'checkout'}
+
+# Distinct products a shopper puts in the cart before it only raises quantities
+MAX_CART_LINES = 5
+
+PERCENTILES = (50, 95, 99)
+
+# Queries per request a route may gain before compare() reports it; which
+# shopper misses a cache first depends on thread timing
+QUERY_SLACK = 0.5
+
+
+def parse_mix(value):
+    """'home=10,product_detail=30' -> {route: weight}, ValueError for unknown routes"""
+    mix = {}
+    for part in filter(None, (part.strip() for part in value.split(','))):
+        route, _, weight = part.partition('=')
+        if route not in DEFAULT_MIX:
+            raise ValueError(f"unknown route {route!r}, choose from {', '.join(DEFAULT_MIX)}")
+        mix[route] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError('the mix needs at least one route with a weight above 0')
+    return mix
+
+
+class Shopper:
+    """One simulated visitor: a client, a vehicle, and the products they come across"""
+
+    def __init__(self, number, seed, host, vehicle, products, user=None):
+        self.rng = random.Random(f'{seed}:{number}')
+        self.client = Client(HTTP_HOST=host)
+        self.vehicle_id, self.model_id, self.make_id, self.year = vehicle
+        self.products = products
+        self.user = user
+        self.cart = []
+        self.selector_step = 0
+        if user is not None:
+            self.client.force_login(user)
+        self.client.post(reverse('vehicles:select_vehicle'), {'vehicle_id': self.vehicle_id})
+
+    def pick(self, routes, weights):
+        while True:
+            route = self.rng.choices(routes, weights)[0]
+            if self.user is not None or route not in LOGIN_ROUTES:
+                return route
+
+    def request(self, route):
+        """Run one request of the route, (status, seconds, queries)"""
+        method, url, data = getattr(self, route)()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(url, data)
+            elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, len(queries)
+
+    # ==================== ROUTES ====================
+    def home(self):
+        return 'get', reverse('products:home'), None
+
+    def product_list(self):
+        # fit=all lists the catalog as if no vehicle were selected
+        return 'get', reverse('products:product_list'), {'fit': 'all'}
+
+    def product_list_vehicle(self):
+        return 'get', reverse('products:product_list'), None
+
+    def product_detail(self):
+        _, slug = self.rng.choice(self.products)
+        return 'get', reverse('products:product_detail', args=[slug]), None
+
+    def vehicle_selector(self):
+        """The selector page, then the JSON lookups it makes on the way to the shopper's vehicle"""
+        step = self.selector_step % 4
+        self.selector_step += 1
+        if step == 0:
+            return 'get', reverse('vehicles:select_vehicle'), None
+        if step == 1:
+            return 'get', reverse('vehicles:api_makes'), {'year': self.year}
+        if step == 2:
+            return 'get', reverse('vehicles:api_models', args=[self.make_id]), {'year': self.year}
+        return 'get', reverse('vehicles:api_vehicles', args=[self.model_id]), {'year': self.year}
+
+    def add_to_cart(self):
+        if len(self.cart) < MAX_CART_LINES:
+            product_id, _ = self.rng.choice(self.products)
+            self.cart.append(product_id)
+        else:
+            product_id = self.rng.choice(self.cart)
+        return 'post', reverse('orders:add_to_cart', args=[product_id]), None
+
+    def cart_detail(self):
+        return 'get', reverse('orders:cart_detail'), None
+
+    def checkout(self):
+        return 'get', reverse('orders:checkout'), None
+
+
+# ==================== RESULTS ====================
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples, wall):
+    """{route: stats} from [(route, status, seconds, queries)], plus an 'all' entry"""
+    by_route = {}
+    for route, status, seconds, queries in samples:
+        by_route.setdefault(route, []).append((status, seconds, queries))
+    by_route['all'] = [(status, seconds, queries) for _, status, seconds, queries in samples]
+
+    results = {}
+    for route, rows in by_route.items():
+        latencies = sorted(seconds for _, seconds, _ in rows)
+        query_counts = [queries for _, _, queries in rows]
+        stats = {
+            'requests': len(rows),
+            'errors': sum(1 for status, _, _ in rows if status >= 400),
+            'throughput': round(len(rows) / wall, 2) if wall else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        }
+        for pct in PERCENTILES:
+            stats[f'p{pct}_ms'] = round(percentile(latencies, pct) * 1000, 2)
+        stats['queries_mean'] = round(sum(query_counts) / len(query_counts), 2)
+        stats['queries_max'] = max(query_counts)
+        results[route] = stats
+    return results
+
+
+def compare(routes, baseline, tolerance):
+    """
+    [(route, metric, baseline value, new value, change)] for every metric that got worse.
+
+    Latency may drift by tolerance (a fraction) before it counts, the mean
+    query count by QUERY_SLACK.
+    """
+    regressions = []
+    for route, stats in routes.items():
+        before = baseline.get(route)
+        if before is None:
+            continue
+        for metric in ('p95_ms', 'p99_ms'):
+            if before[metric] and stats[metric] > before[metric] * (1 + tolerance):
+                regressions.append((route, metric, before[metric], stats[metric],
+                                    stats[metric] / before[metric] - 1))
+        if stats['queries_mean'] > before['queries_mean'] + QUERY_SLACK:
+            change = stats['queries_mean'] / before['queries_mean'] - 1 if before['queries_mean'] else 1.0
+            regressions.append((route, 'queries_mean', before['queries_mean'], stats['queries_mean'], change))
+    return regressions
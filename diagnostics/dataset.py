@@ -0,0 +1,492 @@
+"""
+Reproducible, production-sized datasets for performance work.
+
+A DatasetPlan fixes how many rows of each table to generate (scale 1 is
+roughly production: 100k vehicles, 1M products, 20M fitments, 1M customers,
+5M orders) and which primary keys they get. Every table continues from its
+current highest id, so foreign keys are computed from row numbers instead of
+looked up, and any range of rows can be written without the others.
+
+Each phase is cut into partitions of PARTITION_ROWS driving rows (vehicles,
+products, orders...). A partition draws from its own random.Random seeded
+with (seed, phase, partition) and consumes it row by row, so the same seed
+and sizes give the same rows whatever the batch size or number of worker
+processes. Rows go in with bulk_create, one transaction per batch, which
+skips save() and the model signals: labels, category paths, interchange
+keys and order totals are filled in while the rows are built, and the
+counters, caches and search index are brought up to date once at the end
+(see FINISH_STEPS).
+
+Vehicles, products and customers are drawn with a skew, so a few popular
+vehicles carry most fitments and a few products most order lines, as in
+production.
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from customers.models import Address, Customer, CustomerVehicle
+from orders.models import Cart, CartItem, Order, OrderItem
+from products import search
+from products.catalog_index import catalog_index
+from products.counters import refresh_category_counts
+from products.interchange import normalize_part_number
+from products.models import (
+    Category, InterchangeGroup, Manufacturer, Product, ProductFitment, ProductSpecification,
+)
+from vehicles.counters import refresh_models_counts, refresh_parts_counts, refresh_vehicles_counts
+from vehicles.labels import model_label, vehicle_label
+from vehicles.models import Make, Model, Vehicle
+from vehicles.vehicle_tree import invalidate_vehicle_tree
+
+# Rows of each driving table at scale 1
+SIZES = {
+    'makes': 60,
+    'models': 1_500,
+    'vehicles': 100_000,
+    'categories': 600,
+    'manufacturers': 400,
+    'products': 1_000_000,
+    'fitments': 20_000_000,
+    'customers': 1_000_000,
+    'orders': 5_000_000,
+}
+
+# Driving rows per partition, the unit of work handed to a worker process
+PARTITION_ROWS = 20_000
+
+# Tables whose ids are assigned up front, everything that is referenced
+ID_TABLES = [Make, Model, Vehicle, Category, Manufacturer, InterchangeGroup, Product, User, Customer, Address,
+             Cart, Order]
+
+# Larger means a few rows are picked more often
+SKEW = 2.5
+
+SPECS_PER_PRODUCT = 3
+INTERCHANGE_SHARE = 0.4
+CART_EVERY = 5
+ORDER_HISTORY_DAYS = 730
+
+YEARS = list(range(2026, 1989, -1))
+TRIMS = ['Base', 'LE', 'SE', 'XLE', 'Sport', 'Limited', 'Touring', 'Platinum']
+ENGINES = ['1.5L I4', '2.0L I4', '2.0L I4 Turbo', '2.5L I4', '3.5L V6', '5.0L V8', 'Electric', '2.5L Hybrid']
+BODY_TYPES = ['Sedan', 'SUV', 'Truck', 'Coupe', 'Hatchback', 'Wagon', 'Van']
+PART_NAMES = ['Brake Pad Set', 'Brake Rotor', 'Oil Filter', 'Air Filter', 'Spark Plug', 'Alternator',
+              'Starter', 'Water Pump', 'Radiator', 'Headlight Assembly', 'Wiper Blade', 'Shock Absorber',
+              'Control Arm', 'Wheel Bearing', 'Fuel Pump', 'Ignition Coil', 'Timing Belt Kit', 'Battery']
+PART_GRADES = ['Premium', 'Standard', 'Heavy Duty', 'Performance', 'Economy', 'OE Replacement']
+POSITIONS = ['', '', 'Front', 'Rear', 'Front Left', 'Front Right', 'Rear Left', 'Rear Right']
+# Product type and how often it occurs
+PRODUCT_TYPES = [('AFT', 60), ('OEM', 15), ('PER', 15), ('UNI', 10)]
+FIRST_NAMES = ['James', 'Maria', 'Wei', 'Aisha', 'Carlos', 'Olga', 'Kenji', 'Fatima', 'Liam', 'Priya']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Okafor', 'Silva', 'Ivanova', 'Tanaka', 'Haddad', 'Murphy', 'Patel']
+CITIES = ['Springfield', 'Riverside', 'Franklin', 'Greenville', 'Fairview', 'Madison', 'Georgetown']
+STREETS = ['Main St', 'Oak Ave', 'Maple Dr', 'Cedar Ln', 'Park Rd', 'Lake St', 'Hill Ct']
+MEMBERSHIPS = [('R', 70), ('S', 20), ('G', 8), ('P', 2)]
+ORDER_STATUSES = [('DELIVERED', 70), ('SHIPPED', 10), ('PROCESSING', 8), ('PENDING', 7), ('CANCELLED', 5)]
+SHIPPING = [('Standard', Decimal('0.00')), ('Standard', Decimal('9.99')), ('Express', Decimal('14.99')),
+            ('Next Day', Decimal('19.99'))]
+
+
+class DatasetPlan:
+    """Row counts and first ids of everything a run generates; picklable, so workers get a copy"""
+
+    def __init__(self, seed=1, scale=1.0, batch_size=5000, **sizes):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.sizes = {name: max(1, round(size * scale)) for name, size in SIZES.items()}
+        self.sizes.update({name: size for name, size in sizes.items() if size is not None})
+        self.sizes['roots'] = max(1, self.sizes['categories'] // 10)
+        self.sizes['interchange_groups'] = max(1, self.sizes['products'] // 5)
+        capacity = self.sizes['models'] * len(YEARS) * len(TRIMS)
+        if self.sizes['vehicles'] > capacity:
+            raise ValueError(f"{self.sizes['models']} models have room for at most {capacity} vehicles")
+        self.start = {}
+
+    def reserve_ids(self):
+        """Start every table right after the rows already in it"""
+        for model in ID_TABLES:
+            top = model.objects.aggregate(top=Max('pk'))['top'] or 0
+            self.start[model._meta.label_lower] = top + 1
+
+    def pk(self, model, index):
+        return self.start[model._meta.label_lower] + index
+
+    def partitions(self, phase):
+        """(phase, partition, first row, end row) for every partition of a phase"""
+        total = self.sizes[PHASES[phase]]
+        # A category may reference any root, so the tree goes in as one piece
+        size = total if phase == 'categories' else PARTITION_ROWS
+        return [(phase, n, start, min(start + size, total)) for n, start in enumerate(range(0, total, size))]
+
+    # Price and type are plain functions of the row number, so later phases know them without a query
+    def price(self, product_index):
+        cents = (product_index * 2654435761 + self.seed * 40503) % 49_500 + 499
+        return Decimal(cents).scaleb(-2)
+
+    def product_type(self, product_index):
+        share = (product_index * 2246822519 + self.seed) % 100
+        for product_type, weight in PRODUCT_TYPES:
+            if share < weight:
+                return product_type
+            share -= weight
+
+
+# ==================== HELPERS ====================
+def _skewed(rng, count):
+    """Row number below count, low numbers far more likely"""
+    return min(count - 1, int(count * rng.random() ** SKEW))
+
+
+def _distinct(rng, count, k):
+    """k different skewed row numbers below count"""
+    k = min(k, count)
+    if k > count // 2:
+        return rng.sample(range(count), k)
+    picked = set()
+    while len(picked) < k:
+        picked.add(_skewed(rng, count))
+    return sorted(picked)
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def _make_name(plan, make_index):
+    return f"Make {plan.pk(Make, make_index)}"
+
+
+def _model_name(plan, model_index):
+    return f"Model {plan.pk(Model, model_index)}"
+
+
+def _model_label(plan, model_index):
+    return model_label(_make_name(plan, model_index % plan.sizes['makes']), _model_name(plan, model_index))
+
+
+def _oem_number(plan, group_index):
+    return f"OEM-{plan.pk(InterchangeGroup, group_index)}"
+
+
+@contextmanager
+def _explicit_timestamps(*fields):
+    """Let bulk_create keep the auto_now_add values set on the rows instead of stamping now()"""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+# ==================== BUILDERS ====================
+# Each builder turns a range of row numbers into [(model, rows)] in insert order,
+# consuming the random generator one row at a time.
+
+def _build_makes(plan, rng, rows):
+    makes = []
+    for i in rows:
+        pk = plan.pk(Make, i)
+        makes.append(Make(pk=pk, name=_make_name(plan, i), slug=f'make-{pk}'))
+    return [(Make, makes)]
+
+
+def _build_models(plan, rng, rows):
+    models = []
+    for i in rows:
+        pk = plan.pk(Model, i)
+        models.append(Model(
+            pk=pk, make_id=plan.pk(Make, i % plan.sizes['makes']), name=_model_name(plan, i),
+            slug=f'model-{pk}', label=_model_label(plan, i),
+        ))
+    return [(Model, models)]
+
+
+def _build_vehicles(plan, rng, rows):
+    vehicles = []
+    for i in rows:
+        model_index = i % plan.sizes['models']
+        # Every (model, year, trim) once: newest years first, then the next trim
+        combination = i // plan.sizes['models']
+        year = YEARS[combination % len(YEARS)]
+        trim = TRIMS[combination // len(YEARS)]
+        vehicles.append(Vehicle(
+            pk=plan.pk(Vehicle, i), model_id=plan.pk(Model, model_index), year=year, trim=trim,
+            engine=rng.choice(ENGINES), body_type=rng.choice(BODY_TYPES),
+            label=vehicle_label(year, _model_label(plan, model_index), trim),
+        ))
+    return [(Vehicle, vehicles)]
+
+
+def _build_categories(plan, rng, rows):
+    roots, children = [], []
+    for i in rows:
+        pk = plan.pk(Category, i)
+        if i < plan.sizes['roots']:
+            roots.append(Category(
+                pk=pk, name=f'Category {pk}', slug=f'category-{pk}', path=f'{pk:06d}/', depth=0,
+            ))
+        else:
+            parent = plan.pk(Category, i % plan.sizes['roots'])
+            children.append(Category(
+                pk=pk, name=f'Category {pk}', slug=f'category-{pk}', parent_id=parent,
+                path=f'{parent:06d}/{pk:06d}/', depth=1,
+            ))
+    return [(Category, roots), (Category, children)]
+
+
+def _build_manufacturers(plan, rng, rows):
+    manufacturers = []
+    for i in rows:
+        pk = plan.pk(Manufacturer, i)
+        manufacturers.append(Manufacturer(pk=pk, name=f'Manufacturer {pk}', slug=f'manufacturer-{pk}'))
+    return [(Manufacturer, manufacturers)]
+
+
+def _build_interchange_groups(plan, rng, rows):
+    groups = []
+    for i in rows:
+        groups.append(InterchangeGroup(
+            pk=plan.pk(InterchangeGroup, i), oem_number=normalize_part_number(_oem_number(plan, i)),
+        ))
+    return [(InterchangeGroup, groups)]
+
+
+def _build_products(plan, rng, rows):
+    roots, categories = plan.sizes['roots'], plan.sizes['categories']
+    leaves = categories - roots
+    products, specifications = [], []
+    for i in rows:
+        pk = plan.pk(Product, i)
+        product_type = plan.product_type(i)
+        category = roots + _skewed(rng, leaves) if leaves else _skewed(rng, roots)
+        manufacturer = _skewed(rng, plan.sizes['manufacturers'])
+        price = plan.price(i)
+        product = Product(
+            pk=pk,
+            title=f"{rng.choice(PART_GRADES)} {rng.choice(PART_NAMES)} {pk}",
+            slug=f'part-{pk}',
+            sku=f'GEN-{pk}',
+            description='Generated product for performance testing.',
+            unit_price=price,
+            cost_price=(price * Decimal('0.6')).quantize(Decimal('0.01')),
+            inventory=rng.randint(0, 200),
+            category_id=plan.pk(Category, category),
+            manufacturer_id=plan.pk(Manufacturer, manufacturer),
+            part_number=f'{plan.pk(Manufacturer, manufacturer)}-{pk}',
+            product_type=product_type,
+            is_universal=product_type == 'UNI',
+            warranty_months=rng.choice([0, 6, 12, 24, 36]),
+            is_active=rng.random() < 0.97,
+            is_featured=rng.random() < 0.01,
+        )
+        # OEM parts always carry their OEM number, others replace one now and then
+        if product_type == 'OEM' or rng.random() < INTERCHANGE_SHARE:
+            group = rng.randrange(plan.sizes['interchange_groups'])
+            product.oem_part_number = _oem_number(plan, group)
+            product.interchange_group_id = plan.pk(InterchangeGroup, group)
+        product.part_number_key = normalize_part_number(product.part_number)
+        product.oem_part_number_key = normalize_part_number(product.oem_part_number)
+        products.append(product)
+
+        for name, value, unit in [
+            ('Weight', f'{rng.uniform(0.1, 25):.1f}', 'kg'),
+            ('Length', str(rng.randint(20, 1200)), 'mm'),
+            ('Material', rng.choice(['Steel', 'Aluminum', 'Ceramic', 'Rubber', 'Plastic']), ''),
+        ][:SPECS_PER_PRODUCT]:
+            spec = ProductSpecification(product_id=pk, name=name, value=value, unit=unit)
+            spec.normalize()
+            specifications.append(spec)
+    return [(Product, products), (ProductSpecification, specifications)]
+
+
+def _build_fitments(plan, rng, rows):
+    vehicles = plan.sizes['vehicles']
+    # Universal parts fit everything without fitment rows, the others make up for them
+    universal_share = dict(PRODUCT_TYPES)['UNI'] / 100
+    average = plan.sizes['fitments'] / plan.sizes['products'] / (1 - universal_share)
+    fitments = []
+    for i in rows:
+        if plan.product_type(i) == 'UNI':
+            continue
+        count = min(vehicles, int(rng.expovariate(1 / average))) if average else 0
+        for vehicle in _distinct(rng, vehicles, count):
+            fitments.append(ProductFitment(
+                product_id=plan.pk(Product, i), vehicle_id=plan.pk(Vehicle, vehicle),
+                position=rng.choice(POSITIONS),
+            ))
+    return [(ProductFitment, fitments)]
+
+
+def _build_customers(plan, rng, rows):
+    now = timezone.now()
+    users, customers, addresses, garage, carts, cart_items = [], [], [], [], [], []
+    for i in rows:
+        user_pk, customer_pk = plan.pk(User, i), plan.pk(Customer, i)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        email = f'shopper{user_pk}@example.com'
+        users.append(User(
+            pk=user_pk, username=f'shopper{user_pk}', email=email, first_name=first_name, last_name=last_name,
+            password=UNUSABLE_PASSWORD_PREFIX, date_joined=now - timedelta(days=rng.randrange(ORDER_HISTORY_DAYS)),
+        ))
+        customers.append(Customer(
+            pk=customer_pk, user_id=user_pk, email=email, phone=f'555-{rng.randrange(10_000_000):07d}',
+            membership=_weighted(rng, MEMBERSHIPS),
+        ))
+        addresses.append(Address(
+            pk=plan.pk(Address, i), customer_id=customer_pk,
+            street=f'{rng.randint(1, 9999)} {rng.choice(STREETS)}', city=rng.choice(CITIES), is_default=True,
+        ))
+        for n, vehicle in enumerate(_distinct(rng, plan.sizes['vehicles'], rng.randint(0, 2))):
+            garage.append(CustomerVehicle(
+                customer_id=customer_pk, vehicle_id=plan.pk(Vehicle, vehicle), is_primary=n == 0,
+            ))
+        if i % CART_EVERY == 0:
+            cart = Cart(pk=plan.pk(Cart, i // CART_EVERY), customer_id=customer_pk)
+            for product in _distinct(rng, plan.sizes['products'], rng.randint(1, 4)):
+                item = CartItem(
+                    cart_id=cart.pk, product_id=plan.pk(Product, product),
+                    quantity=rng.randint(1, 3), unit_price=plan.price(product),
+                )
+                cart.items_total += item.subtotal
+                cart.item_count += 1
+                cart_items.append(item)
+            cart.grand_total = cart.items_total
+            carts.append(cart)
+    return [(User, users), (Customer, customers), (Address, addresses), (CustomerVehicle, garage),
+            (Cart, carts), (CartItem, cart_items)]
+
+
+def _build_orders(plan, rng, rows):
+    now = timezone.now()
+    orders, items = [], []
+    for i in rows:
+        pk = plan.pk(Order, i)
+        # Regular customers place most orders
+        customer = _skewed(rng, plan.sizes['customers'])
+        placed_at = now - timedelta(seconds=rng.randrange(ORDER_HISTORY_DAYS * 24 * 60 * 60))
+        status = _weighted(rng, ORDER_STATUSES)
+        shipping_method, shipping_cost = rng.choice(SHIPPING)
+        order = Order(
+            pk=pk, customer_id=plan.pk(Customer, customer), shipping_address_id=plan.pk(Address, customer),
+            order_number=f'GEN-{pk:09d}', placed_at=placed_at, order_status=status,
+            payment_status='C' if status in ('SHIPPED', 'DELIVERED') else rng.choice('PCF'),
+            shipping_method=shipping_method, shipping_cost=shipping_cost,
+        )
+        if status in ('SHIPPED', 'DELIVERED'):
+            order.shipped_at = placed_at + timedelta(days=rng.randint(1, 5))
+            order.tracking_number = f'TRK{pk:010d}'
+        if status == 'DELIVERED':
+            order.delivered_at = order.shipped_at + timedelta(days=rng.randint(1, 7))
+        for product in _distinct(rng, plan.sizes['products'], rng.randint(1, 5)):
+            item = OrderItem(
+                order_id=pk, product_id=plan.pk(Product, product),
+                quantity=rng.randint(1, 3), unit_price=plan.price(product),
+            )
+            order.items_total += item.subtotal
+            order.item_count += 1
+            items.append(item)
+        order.grand_total = order.items_total + shipping_cost
+        orders.append(order)
+    return [(Order, orders), (OrderItem, items)]
+
+
+# Phase -> size that drives it, in foreign key order
+PHASES = {
+    'makes': 'makes',
+    'models': 'models',
+    'vehicles': 'vehicles',
+    'categories': 'categories',
+    'manufacturers': 'manufacturers',
+    'interchange_groups': 'interchange_groups',
+    'products': 'products',
+    'fitments': 'products',
+    'customers': 'customers',
+    'orders': 'orders',
+}
+
+BUILDERS = {
+    'makes': _build_makes,
+    'models': _build_models,
+    'vehicles': _build_vehicles,
+    'categories': _build_categories,
+    'manufacturers': _build_manufacturers,
+    'interchange_groups': _build_interchange_groups,
+    'products': _build_products,
+    'fitments': _build_fitments,
+    'customers': _build_customers,
+    'orders': _build_orders,
+}
+
+
+def write_partition(plan, partition):
+    """Generate and insert one partition, returns the number of rows written"""
+    phase, number, start, stop = partition
+    rng = random.Random(f'{plan.seed}:{phase}:{number}')
+    build = BUILDERS[phase]
+    written = 0
+    with _explicit_timestamps(Order._meta.get_field('placed_at')):
+        for batch_start in range(start, stop, plan.batch_size):
+            tables = build(plan, rng, range(batch_start, min(batch_start + plan.batch_size, stop)))
+            with transaction.atomic():
+                for model, rows in tables:
+                    model.objects.bulk_create(rows, batch_size=plan.batch_size)
+                    written += len(rows)
+    return written
+
+
+# ==================== FINISHING ====================
+def reset_sequences(plan):
+    """Point the id sequences past the explicit ids (PostgreSQL, Oracle; SQLite needs nothing)"""
+    statements = connection.ops.sequence_reset_sql(no_style(), ID_TABLES)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+    return len(statements)
+
+
+def refresh_counters(plan):
+    """The stored counters the skipped signals would have moved"""
+    with transaction.atomic():
+        return (
+            refresh_models_counts() + refresh_vehicles_counts() + refresh_parts_counts()
+            + refresh_category_counts()
+        )
+
+
+def index_products(plan):
+    product_ids = range(plan.pk(Product, 0), plan.pk(Product, plan.sizes['products']))
+    for start in range(0, len(product_ids), PARTITION_ROWS):
+        search.index_products(product_ids[start:start + PARTITION_ROWS])
+    return len(product_ids) if search.is_available() else 0
+
+
+def invalidate_caches(plan):
+    """Drop the shared cache; every process rebuilds its vehicle tree and catalog index on the next request"""
+    # Detail pages, the category tree and facet labels may describe rows that were replaced
+    cache.clear()
+    with transaction.atomic():
+        invalidate_vehicle_tree()
+        catalog_index.invalidate_all()
+    return 0
+
+
+FINISH_STEPS = [
+    ('sequences', reset_sequences),
+    ('counters', refresh_counters),
+    ('search index', index_products),
+    ('caches', invalidate_caches),
+]
+
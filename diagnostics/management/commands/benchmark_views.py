@@ -0,0 +1,235 @@
+# diagnostics/management/commands/benchmark_views.py
+import json
+import platform
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.test.utils import override_settings
+from django.utils import timezone
+from customers.models import Address, Customer
+from diagnostics.benchmark import DEFAULT_MIX, LOGIN_ROUTES, Shopper, compare, parse_mix, summarize
+from orders.models import Cart, CartItem
+from orders.reservations import release_cart
+from products.models import Product, ProductFitment
+from vehicles.models import Vehicle
+
+USERNAME_PREFIX = 'benchmark-shopper-'
+
+# Popular vehicles the shoppers choose from, and products they come across
+VEHICLE_SAMPLE = 200
+PRODUCT_SAMPLE = 2000
+
+# The diagnostics middleware would add its own overhead to every timed request
+QUIET_SETTINGS = {'QUERY_STATS_SAMPLE_RATE': 0, 'PROFILING_SAMPLE_RATE': 0}
+
+
+class Command(BaseCommand):
+    help = ('Runs concurrent simulated shoppers over the storefront routes and reports throughput, '
+            'p50/p95/p99 latency and queries per request for each route')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shoppers', type=int, default=8, help='Concurrent shoppers (threads)')
+        parser.add_argument('--requests', type=int, default=2000, help='Timed requests, split over the shoppers')
+        parser.add_argument('--guests', type=float, default=0.5,
+                            help='Share of shoppers who are not logged in (default: 0.5)')
+        parser.add_argument('--mix', default='',
+                            help='Route weights, e.g. "home=10,product_detail=30" '
+                                 f"(routes: {', '.join(DEFAULT_MIX)}; default: all of them)")
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Untimed rounds of every route per shopper before measuring (default: 1)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--host', default='localhost', help='Host header of the requests')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Results JSON of an earlier run to compare with')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Latency growth over the baseline that still passes (default: 0.1 = 10%%)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when a route regressed against the baseline')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix']) if options['mix'] else dict(DEFAULT_MIX)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        rng = random.Random(options['seed'])
+        vehicles = list(
+            Vehicle.objects.order_by('-parts_count', 'pk')
+            .values_list('pk', 'model_id', 'model__make_id', 'year')[:VEHICLE_SAMPLE]
+        )
+        products = self._sample_products(rng)
+        if not vehicles or not products:
+            raise CommandError("No vehicles or products in stock found! Run 'generate_dataset' first.")
+
+        shoppers = max(1, options['shoppers'])
+        guests = min(shoppers, round(shoppers * options['guests']))
+        if guests and all(route in LOGIN_ROUTES for route, weight in mix.items() if weight):
+            raise CommandError('Guests cannot request any route of this mix, use --guests 0')
+        users = self._make_customers(shoppers - guests, products, rng)
+        try:
+            # Middleware reads its settings when the shoppers' clients load it; the
+            # Host header has to pass ALLOWED_HOSTS or every request is a 400
+            with override_settings(**QUIET_SETTINGS, ALLOWED_HOSTS=[options['host']]):
+                crowd = [
+                    Shopper(number, options['seed'], options['host'], rng.choice(vehicles), products,
+                            users[number - guests] if number >= guests else None)
+                    for number in range(shoppers)
+                ]
+                samples = self._run(crowd, mix, max(1, options['requests']), options['warmup'])
+        finally:
+            self._cleanup()
+
+        results = {
+            'meta': self._meta(options, shoppers, guests, mix),
+            'routes': summarize(samples['rows'], samples['wall']),
+        }
+        self._report(results['routes'], mix)
+        failed = results['routes']['all']['errors']
+        if failed:
+            # Error pages are cheap, a run that got any is no measure of the routes
+            raise CommandError(f'{failed} requests failed, the results are not written or compared')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            self._compare(results['routes'], baseline, options, results['meta'])
+
+    # ==================== SETUP ====================
+    def _sample_products(self, rng):
+        """(id, slug) of up to PRODUCT_SAMPLE random active products with stock to spare"""
+        bounds = Product.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return []
+        ids = range(bounds['low'], bounds['high'] + 1)
+        picked = rng.sample(ids, min(len(ids), PRODUCT_SAMPLE * 2))
+        return list(
+            Product.objects.filter(pk__in=picked, is_active=True, inventory__gte=50)
+            .order_by('pk').values_list('pk', 'slug')[:PRODUCT_SAMPLE]
+        )
+
+    def _make_customers(self, count, products, rng):
+        """Logged-in shoppers: a user, customer, address and a cart with one line each"""
+        self._cleanup()
+        User.objects.bulk_create([User(username=f'{USERNAME_PREFIX}{i}') for i in range(count)])
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk'))
+        Customer.objects.bulk_create([Customer(user=user) for user in users])
+        customers = list(Customer.objects.filter(user__in=users).order_by('user_id'))
+        Address.objects.bulk_create([
+            Address(customer=customer, street='1 Benchmark Way', city='Springfield', is_default=True)
+            for customer in customers
+        ])
+        Cart.objects.bulk_create([Cart(customer=customer) for customer in customers])
+        prices = dict(Product.objects.filter(pk__in=[pk for pk, _ in products]).values_list('pk', 'unit_price'))
+        carts = Cart.objects.filter(customer__in=customers)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product_id=product_id, quantity=1, unit_price=prices[product_id])
+            for cart, (product_id, _) in zip(carts, (rng.choice(products) for _ in customers))
+        ])
+        return users
+
+    def _cleanup(self):
+        carts = Cart.objects.filter(customer__user__username__startswith=USERNAME_PREFIX)
+        for cart in carts.filter(reservations__isnull=False).distinct():
+            release_cart(cart)
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    # ==================== RUN ====================
+    def _run(self, crowd, mix, total, warmup):
+        routes, weights = list(mix), list(mix.values())
+        rows = []
+        lock = threading.Lock()
+
+        for _ in range(warmup):
+            for shopper in crowd:
+                for route in routes:
+                    if shopper.user is not None or route not in LOGIN_ROUTES:
+                        shopper.request(route)
+
+        def shop(shopper, count):
+            try:
+                mine = []
+                for _ in range(count):
+                    route = shopper.pick(routes, weights)
+                    status, seconds, queries = shopper.request(route)
+                    mine.append((route, status, seconds, queries))
+                with lock:
+                    rows.extend(mine)
+            finally:
+                connection.close()
+
+        share, extra = divmod(total, len(crowd))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(crowd)) as pool:
+            futures = [
+                pool.submit(shop, shopper, share + (1 if number < extra else 0))
+                for number, shopper in enumerate(crowd)
+            ]
+            for future in futures:
+                future.result()
+        return {'rows': rows, 'wall': time.perf_counter() - start}
+
+    # ==================== RESULTS ====================
+    def _meta(self, options, shoppers, guests, mix):
+        return {
+            'started_at': timezone.now().isoformat(),
+            'shoppers': shoppers,
+            'guests': guests,
+            'requests': options['requests'],
+            'seed': options['seed'],
+            'mix': mix,
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'settings': QUIET_SETTINGS,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'dataset': {
+                'vehicles': Vehicle.objects.count(),
+                'products': Product.objects.count(),
+                'fitments': ProductFitment.objects.count(),
+            },
+        }
+
+    def _report(self, routes, mix):
+        self.stdout.write(
+            f"{'route':<22}{'requests':>9}{'errors':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+            f"{'p99 ms':>9}{'queries':>9}"
+        )
+        for route in [*mix, 'all']:
+            stats = routes.get(route)
+            if stats is None:
+                continue
+            line = (
+                f"{route:<22}{stats['requests']:>9}{stats['errors']:>7}{stats['throughput']:>9.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['queries_mean']:>9.1f}"
+            )
+            self.stdout.write(self.style.ERROR(line) if stats['errors'] else line)
+
+    def _compare(self, routes, baseline, options, meta):
+        before = baseline.get('meta', {})
+        differing = [key for key in ('shoppers', 'guests', 'requests', 'seed', 'mix') if before.get(key) != meta[key]]
+        if differing:
+            # Another mix of shoppers and routes moves the averages on its own
+            self.stdout.write(self.style.WARNING(
+                f"The baseline ran with different {', '.join(differing)}, expect differences"
+            ))
+        regressions = compare(routes, baseline.get('routes', {}), options['tolerance'])
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"No route regressed against {options['baseline']}"))
+            return
+        for route, metric, before, after, change in regressions:
+            self.stdout.write(self.style.ERROR(f'{route}: {metric} {before} -> {after} ({change:+.0%})'))
+        if options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
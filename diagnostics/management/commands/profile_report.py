@@ -0,0 +1,82 @@
+# diagnostics/management/commands/profile_report.py
+import pstats
+import sysconfig
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from diagnostics.profiling import HEADER, TOKEN_MAX_AGE, area_of, dumps_by_view, make_token, profiling_dir
+
+SORT_COLUMNS = {'tottime': 2, 'cumtime': 3}
+
+# Prefixes cut from file names in the report, most specific first
+SHORTENED_ROOTS = sorted({
+    str(settings.BASE_DIR), sysconfig.get_paths()['purelib'], sysconfig.get_paths()['stdlib'],
+}, key=len, reverse=True)
+
+
+def _location(function):
+    filename, line, name = function
+    if filename == '~':
+        return name
+    for root in SHORTENED_ROOTS:
+        if filename.startswith(root):
+            filename = filename[len(root):].lstrip('/\\')
+            break
+    return f'{name} ({filename}:{line})'
+
+
+class Command(BaseCommand):
+    help = ('Aggregates the request profiles written by ProfilingMiddleware into a top-N hot-function '
+            'report per view, with the time split between templates, ORM, database driver and code')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Directory of .prof dumps (default: PROFILING_DIR)')
+        parser.add_argument('--view', help='Only views whose URL name contains this text')
+        parser.add_argument('--top', type=int, default=15, help='Functions listed per view (default: 15)')
+        parser.add_argument('--sort', choices=sorted(SORT_COLUMNS), default='tottime',
+                            help="Rank by own time or by time including callees (default: tottime)")
+        parser.add_argument('--token', action='store_true',
+                            help=f'Print an {HEADER} header value that gets one request profiled and exit')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(f'{HEADER}: {make_token()}')
+            self.stderr.write(f'Valid for {TOKEN_MAX_AGE // 60} minutes')
+            return
+
+        directory = options['dir'] or profiling_dir()
+        views = dumps_by_view(directory)
+        if options['view']:
+            views = {tag: paths for tag, paths in views.items() if options['view'] in tag}
+        if not views:
+            raise CommandError(f'No profiles found in {directory}')
+
+        column = SORT_COLUMNS[options['sort']]
+        # Views that cost the most in total first
+        reports = []
+        for tag, paths in views.items():
+            stats = pstats.Stats(*map(str, paths))
+            reports.append((stats.total_tt, tag, len(paths), stats))
+        for total, tag, count, stats in sorted(reports, key=lambda report: report[0], reverse=True):
+            self._report_view(tag, count, total, stats, column, options['top'])
+
+    def _report_view(self, tag, count, total, stats, column, top):
+        self.stdout.write(self.style.SUCCESS(
+            f'{tag}: {count} requests, {total * 1000 / count:.1f}ms profiled per request'
+        ))
+        areas = Counter()
+        for function, (_, _, own, _, _) in stats.stats.items():
+            areas[area_of(function)] += own
+        self.stdout.write('  ' + ', '.join(
+            f'{area} {seconds / total:.0%}' for area, seconds in areas.most_common() if total
+        ))
+
+        self.stdout.write(f"  {'calls':>10} {'own ms/req':>11} {'cum ms/req':>11}  function")
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:top]
+        for function, (_, calls, own, cumulative, _) in rows:
+            self.stdout.write(
+                f'  {calls / count:>10.1f} {own * 1000 / count:>11.2f} {cumulative * 1000 / count:>11.2f}'
+                f'  {_location(function)}'
+            )
+        self.stdout.write('')
@@ -0,0 +1,136 @@
+"""
+On-demand cProfile dumps of real requests.
+
+ProfilingMiddleware runs a request under cProfile when it is sampled
+(PROFILING_SAMPLE_RATE, off by default) or when it carries a valid
+X-Profile-Request header, a token signed with the project's SECRET_KEY that
+`profile_report --token` prints. A token profiles one request: the first
+use is recorded in the shared cache and later ones are ignored, and an
+unused token expires after TOKEN_MAX_AGE. The
+stats are written in pstats format to PROFILING_DIR, named after the URL
+pattern that served the request ("products-product_detail__20261018T101500_
+4242_7.prof"), and the response names its dump in an X-Profile-Dump header.
+Each view keeps at most MAX_DUMPS_PER_VIEW files, the oldest go first.
+
+The profile_report command merges the dumps of each view and lists its hot
+functions and how its time splits between templates, the ORM, the
+database driver, this project's code and everything else (see AREAS).
+"""
+import cProfile
+import itertools
+import os
+import random
+import re
+import secrets
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+HEADER = 'X-Profile-Request'
+TOKEN_SALT = 'diagnostics.profiling'
+TOKEN_MAX_AGE = 60 * 60
+USED_TOKEN_KEY = 'profiling:used:{}'
+
+MAX_DUMPS_PER_VIEW = 200
+
+# Separates the view tag from the rest of a dump's file name
+TAG_SEPARATOR = '__'
+
+# Where a function's own time is counted, first match wins; the database
+# driver shows up as built-in methods of its cursor and connection objects
+AREAS = [
+    ('database', ('sqlite3.', 'psycopg', 'MySQLdb', 'oracledb')),
+    ('orm', (os.sep.join(['django', 'db', '']),)),
+    ('templates', (os.sep.join(['django', 'template', '']), os.sep.join(['django', 'templatetags', '']))),
+    ('app', (str(settings.BASE_DIR) + os.sep,)),
+]
+OTHER_AREA = 'other'
+
+_sequence = itertools.count(1)
+
+
+def profiling_dir():
+    return Path(getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles'))
+
+
+def make_token():
+    """Value for the X-Profile-Request header, good for one request within TOKEN_MAX_AGE seconds"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(secrets.token_urlsafe(16))
+
+
+def claim_token(value):
+    """Whether the token is genuine, unexpired and used for the first time"""
+    try:
+        nonce = signing.TimestampSigner(salt=TOKEN_SALT).unsign(value, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    # add() fails when the key exists, so only one request gets to use the token
+    return cache.add(USED_TOKEN_KEY.format(nonce), True, TOKEN_MAX_AGE)
+
+
+def view_tag(request):
+    """File-name-safe name of the URL pattern that served the request"""
+    match = request.resolver_match
+    name = match.view_name if match and match.view_name else 'unresolved'
+    return re.sub(r'[^\w.-]+', '-', name.replace(':', '-'))
+
+
+def area_of(function):
+    """Area of a pstats function key (file, line, name)"""
+    filename, _, name = function
+    location = name if filename == '~' else filename
+    for area, markers in AREAS:
+        if any(marker in location for marker in markers):
+            return area
+    return OTHER_AREA
+
+
+def dumps_by_view(directory):
+    """{view tag: [dump paths, oldest first]} of the dumps in a directory"""
+    views = {}
+    for path in sorted(Path(directory).glob('*.prof'), key=lambda path: path.stat().st_mtime):
+        tag = path.name.partition(TAG_SEPARATOR)[0]
+        views.setdefault(tag, []).append(path)
+    return views
+
+
+class ProfilingMiddleware:
+    """Profiles sampled or explicitly requested requests, see the module docstring"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.directory = profiling_dir()
+
+    def __call__(self, request):
+        requested = HEADER in request.headers and claim_token(request.headers[HEADER])
+        if not requested and not (self.sample_rate and random.random() < self.sample_rate):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (a debugger, a profiled test run) already owns this thread
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+
+        tag = view_tag(request)
+        name = f"{tag}{TAG_SEPARATOR}{time.strftime('%Y%m%dT%H%M%S')}_{os.getpid()}_{next(_sequence)}.prof"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.directory / name)
+        self._prune(tag)
+        if requested:
+            response.headers['X-Profile-Dump'] = name
+        return response
+
+    def _prune(self, tag):
+        dumps = sorted(self.directory.glob(f'{tag}{TAG_SEPARATOR}*.prof'), key=lambda path: path.stat().st_mtime)
+        for path in dumps[:-MAX_DUMPS_PER_VIEW]:
+            path.unlink(missing_ok=True)
@@ -0,0 +1,199 @@
+"""
+Per-request SQL statistics.
+
+QueryStatsMiddleware picks a sample of requests (QUERY_STATS_SAMPLE_RATE,
+all of them under DEBUG in cars/settings.py) and installs a QueryRecorder
+as an execute wrapper on every database connection for the duration of
+the request. The recorder counts and times each statement and notices two
+signs of an N+1 problem: the very same statement run more than once
+(duplicates) and one SQL shape run over and over with different parameters
+(similar, e.g. a lookup per row of a listing).
+
+A sampled response carries the totals in a Server-Timing header, which
+browser dev tools show next to the request, and the request is offered to
+worst_requests, an in-process log of the slowest recent requests with
+their heaviest statements (staff can read it at diagnostics:query_stats).
+A request that is not sampled costs one random() call.
+"""
+import heapq
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Share of requests sampled when the settings do not say, the production rate
+DEFAULT_SAMPLE_RATE = 0.01
+
+# Statements kept per request, and the longest SQL text shown for one
+SLOWEST_KEPT = 5
+SQL_PREVIEW = 500
+
+# A statement shape run this often in one request is reported as similar
+SIMILAR_THRESHOLD = 5
+
+# Requests kept in the log and how long one stays there
+WORST_KEPT = 50
+WORST_WINDOW = 60 * 60
+
+
+class QueryRecorder:
+    """execute_wrapper that times and tallies the statements of one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+        self.identical = Counter()
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            self.shapes[sql] += 1
+            if not many:
+                self.identical[(sql, repr(params))] += 1
+            # Min-heap of the slowest, the fastest of them is dropped first
+            entry = (duration, self.count, sql)
+            if len(self.slowest) < SLOWEST_KEPT:
+                heapq.heappush(self.slowest, entry)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    @property
+    def duplicates(self):
+        """{sql: extra runs} for statements run more than once with the same parameters"""
+        repeated = Counter()
+        for (sql, _), times in self.identical.items():
+            if times > 1:
+                repeated[sql] += times - 1
+        return repeated
+
+    @property
+    def similar(self):
+        return Counter({sql: times for sql, times in self.shapes.items() if times >= SIMILAR_THRESHOLD})
+
+    def server_timing(self, total):
+        """Server-Timing value: SQL time and count, repeats, and the whole request"""
+        return (
+            f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries", '
+            f'dup;desc="{sum(self.duplicates.values())} repeated", '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+    def summary(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.duration * 1000, 2),
+            'slowest': [
+                {'ms': round(duration * 1000, 2), 'sql': sql[:SQL_PREVIEW]}
+                for duration, _, sql in sorted(self.slowest, reverse=True)
+            ],
+            'duplicates': [
+                {'extra_runs': runs, 'sql': sql[:SQL_PREVIEW]}
+                for sql, runs in self.duplicates.most_common(SLOWEST_KEPT)
+            ],
+            'similar': [
+                {'times': times, 'sql': sql[:SQL_PREVIEW]} for sql, times in self.similar.most_common(SLOWEST_KEPT)
+            ],
+        }
+
+
+class WorstRequests:
+    """The WORST_KEPT slowest requests of the last WORST_WINDOW seconds in this process"""
+
+    def __init__(self, size=WORST_KEPT, window=WORST_WINDOW):
+        self.size = size
+        self.window = window
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def qualifies(self, duration):
+        """Whether a request this slow would make the log, checked before building its entry"""
+        entries = self._entries
+        return len(entries) < self.size or duration > entries[0][0]
+
+    def add(self, duration, entry):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if not self.qualifies(duration):
+                return
+            item = (duration, now, id(entry), entry)
+            if len(self._entries) < self.size:
+                heapq.heappush(self._entries, item)
+            else:
+                heapq.heapreplace(self._entries, item)
+
+    def snapshot(self):
+        """Logged requests, slowest first"""
+        with self._lock:
+            self._expire(time.monotonic())
+            return [entry for _, _, _, entry in sorted(self._entries, key=lambda item: item[0], reverse=True)]
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+
+    def _expire(self, now):
+        fresh = [item for item in self._entries if now - item[1] <= self.window]
+        if len(fresh) != len(self._entries):
+            heapq.heapify(fresh)
+            self._entries = fresh
+
+
+worst_requests = WorstRequests()
+
+
+class QueryStatsMiddleware:
+    """Records the SQL of a sample of requests, see the module docstring"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'QUERY_STATS_SAMPLE_RATE', DEFAULT_SAMPLE_RATE)
+
+    def __call__(self, request):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        response.headers['Server-Timing'] = recorder.server_timing(total)
+        if worst_requests.qualifies(total):
+            match = request.resolver_match
+            worst_requests.add(total, {
+                'at': timezone.now().isoformat(),
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else '',
+                'status': response.status_code,
+                'ms': round(total * 1000, 2),
+                **recorder.summary(),
+            })
+        # A repeat or two is normal (the admin counts its changelist twice), a
+        # statement run SIMILAR_THRESHOLD times is not; repeats count as similar too
+        if recorder.similar:
+            logger.warning(
+                'Possible N+1 in %s %s: %d queries, %d repeated, most frequent statement run %d times',
+                request.method, request.path, recorder.count, sum(recorder.duplicates.values()),
+                recorder.shapes.most_common(1)[0][1],
+            )
+        return response
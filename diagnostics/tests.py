@@ -0,0 +1,387 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from cars.testing import (
+    CatalogTestCase, make_category, make_customer, make_product, make_vehicle, reset_process_caches,
+)
+from diagnostics.benchmark import QUERY_SLACK, Shopper, compare, parse_mix, percentile, summarize
+from diagnostics import profiling
+from diagnostics.query_stats import (
+    DEFAULT_SAMPLE_RATE, SIMILAR_THRESHOLD, QueryRecorder, QueryStatsMiddleware, worst_requests,
+)
+from orders.models import Cart, Order
+from orders.totals import refresh_cart_totals, refresh_order_totals
+from products import search
+from products.models import Category, Product, ProductFitment
+from vehicles.labels import vehicle_label
+from vehicles.models import Vehicle
+
+# A dataset small enough to generate in every test
+TINY = [
+    '--makes', '3', '--models', '6', '--vehicles', '40', '--categories', '12', '--manufacturers', '4',
+    '--products', '60', '--fitments', '300', '--customers', '15', '--orders', '25',
+]
+
+
+# ==================== DATASET ====================
+class GenerateDatasetTests(CatalogTestCase):
+    def generate(self, *args):
+        stdout = StringIO()
+        call_command('generate_dataset', *TINY, *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def snapshot(self):
+        """Everything generated that does not depend on the clock"""
+        return {
+            'vehicles': list(Vehicle.objects.order_by('pk').values_list('pk', 'model_id', 'year', 'trim', 'engine')),
+            'products': list(Product.objects.order_by('pk').values_list(
+                'pk', 'title', 'unit_price', 'inventory', 'category_id', 'interchange_group_id', 'is_active',
+            )),
+            'fitments': sorted(ProductFitment.objects.values_list('product_id', 'vehicle_id', 'position')),
+            'orders': list(
+                Order.objects.order_by('pk').values_list('pk', 'customer_id', 'order_status', 'grand_total')
+            ),
+        }
+
+    def test_same_seed_gives_the_same_rows_whatever_the_batch_size(self):
+        snapshots = []
+        for batch_size in ('7', '1000'):
+            with transaction.atomic():
+                self.generate('--seed', '3', '--batch-size', batch_size)
+                snapshots.append(self.snapshot())
+                transaction.set_rollback(True)
+        self.assertEqual(snapshots[0], snapshots[1])
+        self.assertEqual(len(snapshots[0]['products']), 60)
+
+        with transaction.atomic():
+            self.generate('--seed', '4')
+            self.assertNotEqual(self.snapshot()['products'], snapshots[0]['products'])
+            transaction.set_rollback(True)
+
+    def test_rows_are_added_after_the_existing_ones(self):
+        self.generate()
+        first = Product.objects.order_by('-pk').values_list('pk', flat=True).first()
+        output = self.generate()
+        self.assertEqual(Product.objects.count(), 120)
+        self.assertEqual(Product.objects.filter(pk__gt=first).count(), 60)
+        self.assertIn('Generating 40 vehicles, 60 products', output)
+
+    def test_derived_columns_match_what_the_signals_would_write(self):
+        self.generate()
+        stdout = StringIO()
+        call_command('recount_counters', stdout=stdout)
+        self.assertNotIn('corrected', stdout.getvalue())
+
+        for vehicle in Vehicle.objects.select_related('model__make'):
+            model_label = f'{vehicle.model.make.name} {vehicle.model.name}'
+            self.assertEqual(vehicle.label, vehicle_label(vehicle.year, model_label, vehicle.trim))
+        for category in Category.objects.select_related('parent'):
+            parent_path = category.parent.path if category.parent else ''
+            self.assertEqual(category.path, f'{parent_path}{category.pk:06d}/')
+
+        order_totals = Order.objects.order_by('pk').values_list('items_total', 'grand_total', 'item_count')
+        cart_totals = Cart.objects.order_by('pk').values_list('items_total', 'grand_total', 'item_count')
+        generated = list(order_totals), list(cart_totals)
+        refresh_order_totals(Order.objects.values('pk'))
+        refresh_cart_totals(Cart.objects.values('pk'))
+        self.assertEqual((list(order_totals), list(cart_totals)), generated)
+
+        product = Product.objects.filter(is_active=True).first()
+        self.assertIn(product.pk, search.search(product.sku)[0])
+
+    def test_impossible_sizes_are_refused(self):
+        with self.assertRaisesMessage(CommandError, 'have room for at most'):
+            call_command('generate_dataset', '--models', '1', '--vehicles', '1000', stdout=StringIO())
+
+
+# ==================== BENCHMARK ====================
+class BenchmarkResultsTests(CatalogTestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('home=10, product_detail=2.5,cart_detail'),
+                         {'home': 10.0, 'product_detail': 2.5, 'cart_detail': 1.0})
+        with self.assertRaisesMessage(ValueError, "unknown route 'nowhere'"):
+            parse_mix('nowhere=1')
+        with self.assertRaisesMessage(ValueError, 'at least one route'):
+            parse_mix('home=0')
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_summarize_per_route_and_all(self):
+        samples = [('home', 200, 0.010, 3), ('home', 200, 0.030, 5), ('checkout', 302, 0.020, 4),
+                   ('checkout', 500, 0.040, 6)]
+        results = summarize(samples, wall=2)
+        self.assertEqual(results['home']['requests'], 2)
+        self.assertEqual(results['home']['errors'], 0)
+        self.assertEqual(results['home']['mean_ms'], 20.0)
+        self.assertEqual(results['home']['p50_ms'], 10.0)
+        self.assertEqual(results['home']['p99_ms'], 30.0)
+        self.assertEqual(results['home']['queries_mean'], 4.0)
+        self.assertEqual(results['checkout']['errors'], 1)
+        self.assertEqual(results['all']['requests'], 4)
+        self.assertEqual(results['all']['throughput'], 2.0)
+        self.assertEqual(results['all']['queries_max'], 6)
+
+    def test_compare_reports_only_what_got_worse(self):
+        baseline = {'home': {'p95_ms': 10.0, 'p99_ms': 20.0, 'queries_mean': 4.0}}
+        within = {'home': {'p95_ms': 10.9, 'p99_ms': 15.0, 'queries_mean': 4.0 + QUERY_SLACK}}
+        self.assertEqual(compare(within, baseline, tolerance=0.1), [])
+
+        worse = {'home': {'p95_ms': 12.0, 'p99_ms': 20.0, 'queries_mean': 6.0},
+                 'checkout': {'p95_ms': 99.0, 'p99_ms': 99.0, 'queries_mean': 99.0}}
+        regressions = compare(worse, baseline, tolerance=0.1)
+        self.assertEqual([(route, metric) for route, metric, *_ in regressions],
+                         [('home', 'p95_ms'), ('home', 'queries_mean')])
+        self.assertAlmostEqual(regressions[0][4], 0.2)
+        self.assertAlmostEqual(regressions[1][4], 0.5)
+
+
+class BenchmarkShopperTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.vehicle = make_vehicle()
+        self.product = make_product('Brake Pad', make_category('Brakes'), inventory=50)
+        self.products = [(self.product.pk, self.product.slug)]
+        self.key = (self.vehicle.pk, self.vehicle.model_id, self.vehicle.model.make_id, self.vehicle.year)
+
+    def test_guests_never_pick_a_login_route(self):
+        shopper = Shopper(0, 1, 'testserver', self.key, self.products)
+        picks = {shopper.pick(['home', 'checkout'], [1, 100]) for _ in range(20)}
+        self.assertEqual(picks, {'home'})
+
+    def test_every_route_answers(self):
+        user = make_customer().user
+        shopper = Shopper(0, 1, 'testserver', self.key, self.products, user=user)
+        for route in ('home', 'product_list', 'product_list_vehicle', 'product_detail',
+                      'vehicle_selector', 'vehicle_selector', 'vehicle_selector', 'vehicle_selector',
+                      'add_to_cart', 'cart_detail'):
+            with self.subTest(route=route):
+                status, seconds, queries = shopper.request(route)
+                self.assertLess(status, 400)
+                self.assertGreater(seconds, 0)
+        self.assertEqual(shopper.cart, [self.product.pk])
+
+    def test_same_seed_draws_the_same_routes(self):
+        draws = []
+        for _ in range(2):
+            shopper = Shopper(3, 7, 'testserver', self.key, self.products)
+            draws.append([shopper.pick(['home', 'product_detail', 'cart_detail'], [1, 1, 1]) for _ in range(10)])
+        self.assertEqual(draws[0], draws[1])
+
+
+class BenchmarkRunTests(TransactionTestCase):
+    """The shoppers run in threads with connections of their own, so the dataset is committed"""
+
+    def setUp(self):
+        reset_process_caches()
+        call_command('generate_dataset', *TINY, stdout=StringIO())
+        self.output = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'results.json'
+
+    def benchmark(self, *args):
+        stdout = StringIO()
+        call_command('benchmark_views', '--shoppers', '2', '--requests', '30', '--warmup', '0',
+                     '--output', str(self.output), *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_run_writes_results_for_every_route(self):
+        self.benchmark()
+        results = json.loads(self.output.read_text(encoding='utf-8'))
+        self.assertEqual(results['routes']['all']['requests'], 30)
+        self.assertEqual(results['routes']['all']['errors'], 0)
+        self.assertFalse(User.objects.filter(username__startswith='benchmark-shopper-').exists())
+
+        output = self.benchmark('--baseline', str(self.output), '--tolerance', '100')
+        self.assertIn('No route regressed', output)
+
+    def test_any_failed_request_fails_the_run(self):
+        def missing(shopper):
+            return 'get', reverse('products:product_detail', args=['no-such-product']), None
+
+        with mock.patch.object(Shopper, 'product_detail', missing):
+            with self.assertRaisesMessage(CommandError, 'requests failed'):
+                self.benchmark('--mix', 'product_detail=1')
+        self.assertFalse(self.output.exists())
+
+
+class BenchmarkCommandTests(CatalogTestCase):
+    def test_needs_a_dataset(self):
+        with self.assertRaisesMessage(CommandError, "Run 'generate_dataset' first"):
+            call_command('benchmark_views', '--requests', '1', stdout=StringIO())
+
+    def test_unknown_route_in_the_mix(self):
+        with self.assertRaisesMessage(CommandError, 'unknown route'):
+            call_command('benchmark_views', '--mix', 'nowhere=1', stdout=StringIO())
+
+
+# ==================== QUERY STATS ====================
+def run_queries(*params):
+    with connection.cursor() as cursor:
+        for value in params:
+            cursor.execute('SELECT %s', [value])
+
+
+class QueryRecorderTests(CatalogTestCase):
+    def record(self, *params):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            run_queries(*params)
+        return recorder
+
+    def test_counts_and_repeats(self):
+        recorder = self.record(1, 1, 1, 2)
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(recorder.duplicates, {'SELECT %s': 2})
+        self.assertFalse(recorder.similar)
+        self.assertIn('desc="4 queries"', recorder.server_timing(0.01))
+        self.assertIn('desc="2 repeated"', recorder.server_timing(0.01))
+
+    def test_one_shape_with_different_parameters_is_similar(self):
+        recorder = self.record(*range(SIMILAR_THRESHOLD))
+        self.assertFalse(recorder.duplicates)
+        self.assertEqual(recorder.similar, {'SELECT %s': SIMILAR_THRESHOLD})
+        summary = recorder.summary()
+        self.assertEqual(summary['queries'], SIMILAR_THRESHOLD)
+        self.assertEqual(len(summary['slowest']), 5)
+        self.assertEqual(summary['similar'], [{'times': SIMILAR_THRESHOLD, 'sql': 'SELECT %s'}])
+
+
+class QueryStatsMiddlewareTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        worst_requests.clear()
+        self.addCleanup(worst_requests.clear)
+
+    def handle(self, *params):
+        def view(request):
+            run_queries(*params)
+            return HttpResponse()
+        return QueryStatsMiddleware(view)(RequestFactory().get('/somewhere/'))
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=1)
+    def test_sampled_request_gets_a_header_and_a_log_entry(self):
+        response = self.client.get(reverse('products:home'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", ')
+        [entry] = worst_requests.snapshot()
+        self.assertEqual(entry['view'], 'products:home')
+        self.assertEqual(entry['status'], 200)
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=0)
+    def test_unsampled_request_is_left_alone(self):
+        response = self.client.get(reverse('products:home'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(worst_requests.snapshot(), [])
+
+    @override_settings(DEBUG=True)
+    def test_without_the_setting_the_production_rate_applies(self):
+        del settings.QUERY_STATS_SAMPLE_RATE
+        self.assertEqual(QueryStatsMiddleware(HttpResponse).sample_rate, DEFAULT_SAMPLE_RATE)
+        self.assertEqual(DEFAULT_SAMPLE_RATE, 0.01)
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=1)
+    def test_warns_about_a_possible_n_plus_one(self):
+        with self.assertNoLogs('diagnostics.query_stats'):
+            self.handle(1, 1, 2)
+        with self.assertLogs('diagnostics.query_stats', 'WARNING') as logs:
+            self.handle(*range(SIMILAR_THRESHOLD))
+        self.assertIn('Possible N+1 in GET /somewhere/', logs.output[0])
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=1)
+    def test_staff_read_and_clear_the_log(self):
+        url = reverse('diagnostics:query_stats')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        staff = User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        self.client.get(reverse('products:home'))
+        views = [entry['view'] for entry in self.client.get(url).json()['requests']]
+        self.assertIn('products:home', views)
+
+        self.assertEqual(self.client.post(url, {'clear': '1'}).json(), {'requests': []})
+
+
+# ==================== PROFILING ====================
+class ProfilingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def dumps(self):
+        return sorted(path.name for path in self.directory.glob('*.prof'))
+
+    def test_a_token_is_good_for_one_request(self):
+        token = profiling.make_token()
+        self.assertTrue(profiling.claim_token(token))
+        self.assertFalse(profiling.claim_token(token))
+        self.assertFalse(profiling.claim_token(profiling.make_token() + 'x'))
+        self.assertFalse(profiling.claim_token('not-a-token'))
+
+    def test_tagged_dump_for_a_requested_profile(self):
+        token = profiling.make_token()
+        response = self.client.get(reverse('products:home'), headers={profiling.HEADER: token})
+        [name] = self.dumps()
+        self.assertTrue(name.startswith('products-home__'))
+        self.assertEqual(response['X-Profile-Dump'], name)
+
+        response = self.client.get(reverse('products:home'), headers={profiling.HEADER: token})
+        self.assertNotIn('X-Profile-Dump', response)
+        self.assertEqual(len(self.dumps()), 1)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_keep_the_newest_dumps_per_view(self):
+        with mock.patch.object(profiling, 'MAX_DUMPS_PER_VIEW', 2):
+            for _ in range(3):
+                response = self.client.get(reverse('products:home'))
+        self.assertNotIn('X-Profile-Dump', response)
+        self.assertEqual(len(self.dumps()), 2)
+        self.assertEqual(list(profiling.dumps_by_view(self.directory)), ['products-home'])
+
+    def test_area_of(self):
+        self.assertEqual(profiling.area_of(('~', 0, "<method 'execute' of 'sqlite3.Cursor' objects>")), 'database')
+        self.assertEqual(profiling.area_of((str(Path('django', 'db', 'models', 'query.py')), 1, 'get')), 'orm')
+        self.assertEqual(profiling.area_of((str(Path('django', 'template', 'base.py')), 1, 'render')), 'templates')
+        self.assertEqual(profiling.area_of((str(Path(profiling.__file__)), 1, 'area_of')), 'app')
+        self.assertEqual(profiling.area_of(('~', 0, '<built-in method builtins.len>')), 'other')
+
+    def test_profile_report(self):
+        with self.assertRaisesMessage(CommandError, 'No profiles found'):
+            call_command('profile_report', stdout=StringIO())
+
+        for url in (reverse('products:home'), reverse('products:home'), reverse('vehicles:select_vehicle')):
+            self.client.get(url, headers={profiling.HEADER: profiling.make_token()})
+        stdout = StringIO()
+        call_command('profile_report', '--top', '3', stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn('products-home: 2 requests', output)
+        self.assertIn('vehicles-select_vehicle: 1 requests', output)
+        self.assertIn('own ms/req', output)
+
+        stdout = StringIO()
+        call_command('profile_report', '--view', 'vehicles', stdout=stdout)
+        self.assertNotIn('products-home', stdout.getvalue())
+
+    def test_profile_report_token(self):
+        stdout = StringIO()
+        call_command('profile_report', '--token', stdout=stdout, stderr=StringIO())
+        header, _, token = stdout.getvalue().strip().partition(': ')
+        self.assertEqual(header, profiling.HEADER)
+        self.assertTrue(profiling.claim_token(token))
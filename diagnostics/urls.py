@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'diagnostics'
+
+urlpatterns = [
+    path('queries/', views.query_stats, name='query_stats'),
+]
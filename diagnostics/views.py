@@ -0,0 +1,12 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from .query_stats import worst_requests
+
+@never_cache
+@staff_member_required
+def query_stats(request):
+    """Slowest recent requests of this worker with their SQL statistics"""
+    if request.method == 'POST' and request.POST.get('clear'):
+        worst_requests.clear()
+    return JsonResponse({'requests': worst_requests.snapshot()})
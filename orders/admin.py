@@ -1,6 +1,6 @@
 # orders/admin.py
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderItem
+from .models import Cart, CartItem, Order, OrderItem, StockReservation
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
@@ -10,26 +10,33 @@ class CartItemInline(admin.TabularInline):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['customer', 'created_at', 'updated_at', 'item_count', 'total']
+    list_display = ['customer', 'created_at', 'updated_at', 'item_count', 'grand_total']
     list_select_related = ['customer__user']
     search_fields = ['customer__user__username', 'customer__user__first_name', 'customer__user__last_name']
-    readonly_fields = ['total']
+    readonly_fields = ['items_total', 'grand_total', 'item_count']
     inlines = [CartItemInline]
 
-    @admin.display(description="Items")
-    def item_count(self, obj):
-        return obj.items.count()
-
-    def get_queryset(self, request):
-        # Optimize DB queries
-        return super().get_queryset(request).prefetch_related('items__product')
-
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ['subtotal']
     fields = ['product', 'quantity', 'unit_price', 'subtotal']
 
+class OrderValueFilter(admin.SimpleListFilter):
+    title = 'order value'
+    parameter_name = 'value'
+    BANDS = [('0-50', 0, 50), ('50-200', 50, 200), ('200-500', 200, 500), ('500-', 500, None)]
+
+    def lookups(self, request, model_admin):
+        return [(key, f"${low}+" if high is None else f"${low} - ${high}") for key, low, high in self.BANDS]
+
+    def queryset(self, request, queryset):
+        for key, low, high in self.BANDS:
+            if self.value() == key:
+                queryset = queryset.filter(grand_total__gte=low)
+                return queryset if high is None else queryset.filter(grand_total__lt=high)
+        return queryset
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -39,12 +46,13 @@ class OrderAdmin(admin.ModelAdmin):
         'order_status',
         'payment_status',
         'shipping_method',
-        'total',
+        'grand_total',
         'item_count'
     ]
     list_filter = [
         'order_status',
         'payment_status',
+        OrderValueFilter,
         'placed_at',
         'shipped_at',
         'delivered_at'
@@ -59,7 +67,9 @@ class OrderAdmin(admin.ModelAdmin):
     readonly_fields = [
         'order_number',
         'placed_at',
-        'total',
+        'items_total',
+        'grand_total',
+        'item_count',
         'shipped_at',
         'delivered_at'
     ]
@@ -67,19 +77,11 @@ class OrderAdmin(admin.ModelAdmin):
     date_hierarchy = 'placed_at'
     ordering = ['-placed_at']
 
-    @admin.display(description="Items")
-    def item_count(self, obj):
-        return obj.items.count()
-
-    @admin.display(description="Total")
-    def total(self, obj):
-        return f"${obj.total:.2f}"
-
     def get_queryset(self, request):
         # Reduce database queries
         return super().get_queryset(request).select_related(
             'customer__user', 'shipping_address'
-        ).prefetch_related('items__product')
+        )
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -87,9 +89,18 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_filter = ['order__order_status']
     search_fields = ['order__order_number', 'product__title']
     readonly_fields = ['subtotal']
+    list_select_related = ['order', 'product']
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ['cart', 'product', 'quantity', 'unit_price', 'subtotal']
     search_fields = ['cart__customer__user__username', 'product__title']
-    readonly_fields = ['subtotal']
\ No newline at end of file
+    readonly_fields = ['subtotal']
+    list_select_related = ['cart__customer__user', 'product']
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['cart', 'product', 'quantity', 'expires_at']
+    list_select_related = ['cart__customer__user', 'product']
+    search_fields = ['cart__customer__user__username', 'product__sku', 'product__title']
+    date_hierarchy = 'expires_at'
@@ -0,0 +1,133 @@
+"""
+Changing cart lines in batches.
+
+A batch is a list of operations, {"op": "add" | "set" | "remove",
+"product": id, "quantity": n}, applied to one cart in one transaction.
+Nothing is read, modified and written back: additions insert missing lines
+with ON CONFLICT DO NOTHING on (cart, product) and then raise every
+quantity with one UPDATE ... SET quantity = quantity + CASE ..., quantities
+that are set go in one upsert, and removals and lines that dropped to zero
+go in one DELETE. Two tabs clicking "add" at the same time both count.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+from cars.bulk import delete_rows
+from products.models import Product
+
+from .models import Cart, CartItem
+from .totals import refresh_cart_totals
+
+OPERATIONS = ('add', 'set', 'remove')
+
+MAX_OPERATIONS = 100
+
+
+class InvalidOperation(Exception):
+    pass
+
+
+def parse_operations(data):
+    """[(op, product id, quantity)] from the decoded JSON body, InvalidOperation if malformed"""
+    if not isinstance(data, list) or not data:
+        raise InvalidOperation('operations must be a non-empty list')
+    if len(data) > MAX_OPERATIONS:
+        raise InvalidOperation(f'at most {MAX_OPERATIONS} operations per request')
+    operations = []
+    for index, entry in enumerate(data):
+        if not isinstance(entry, dict) or entry.get('op') not in OPERATIONS:
+            raise InvalidOperation(f'operation {index}: op must be one of {", ".join(OPERATIONS)}')
+        product_id, quantity = entry.get('product'), entry.get('quantity', 1 if entry['op'] == 'add' else 0)
+        if not isinstance(product_id, int) or not isinstance(quantity, int) or isinstance(quantity, bool):
+            raise InvalidOperation(f'operation {index}: product and quantity must be integers')
+        if entry['op'] == 'set' and quantity < 0:
+            raise InvalidOperation(f'operation {index}: quantity cannot be negative')
+        operations.append((entry['op'], product_id, quantity))
+    return operations
+
+
+def fold_operations(operations):
+    """
+    Collapse the batch to one change per product, in order: {product id: (kind, quantity)}.
+
+    kind is 'add' (a relative change) or 'set'; a removal is a set to 0.
+    """
+    changes = {}
+    for op, product_id, quantity in operations:
+        kind, current = changes.get(product_id, ('add', 0))
+        if op == 'add':
+            changes[product_id] = (kind, current + quantity)
+        else:
+            changes[product_id] = ('set', quantity if op == 'set' else 0)
+    return changes
+
+
+def apply_operations(cart, operations):
+    """
+    Apply [(op, product id, quantity)] to a customer's Cart.
+
+    Unknown and inactive products are ignored. Returns {product id: quantity}
+    for the products the batch touched, 0 for lines no longer in the cart.
+    """
+    changes = fold_operations(operations)
+    prices = dict(
+        Product.objects.filter(pk__in=changes, is_active=True).values_list('pk', 'unit_price')
+    )
+    adds = {pk: quantity for pk, (kind, quantity) in changes.items() if kind == 'add' and pk in prices and quantity}
+    sets = {pk: quantity for pk, (kind, quantity) in changes.items() if kind == 'set' and pk in prices and quantity > 0}
+    removes = [pk for pk, (kind, quantity) in changes.items() if kind == 'set' and quantity <= 0]
+
+    with transaction.atomic():
+        if adds:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=pk, quantity=0, unit_price=prices[pk]) for pk in adds],
+                ignore_conflicts=True,
+            )
+            CartItem.objects.filter(cart=cart, product_id__in=adds).update(
+                quantity=F('quantity') + Case(
+                    *[When(product_id=pk, then=Value(quantity)) for pk, quantity in adds.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+            )
+        if sets:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=pk, quantity=quantity, unit_price=prices[pk])
+                 for pk, quantity in sets.items()],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+        # Removed lines, and lines an addition of a negative quantity took to zero or below
+        if removes or adds:
+            delete_rows(CartItem.objects.filter(
+                Q(product_id__in=removes) | Q(product_id__in=adds, quantity__lte=0), cart=cart,
+            ))
+        # The bulk statements skip the CartItem signals
+        refresh_cart_totals([cart.pk])
+        quantities = dict(
+            CartItem.objects.filter(cart=cart, product_id__in=changes).values_list('product_id', 'quantity')
+        )
+    return {pk: quantities.get(pk, 0) for pk in changes}
+
+
+def apply_guest_operations(guest_cart, operations):
+    """Apply [(op, product id, quantity)] to a GuestCart, {product id: quantity} like apply_operations()"""
+    for product_id, (kind, quantity) in fold_operations(operations).items():
+        if kind == 'add':
+            guest_cart.add(product_id, quantity)
+        else:
+            guest_cart.set(product_id, quantity)
+    return {pk: guest_cart.items.get(pk, 0) for _, pk, _ in operations}
+
+
+def cart_totals(cart):
+    """The stored totals of a Cart, read without touching its lines"""
+    return Cart.objects.filter(pk=cart.pk).values('items_total', 'grand_total', 'item_count').get()
+
+
+def guest_cart_totals(guest_cart):
+    """The same totals for a GuestCart, priced at the current product prices"""
+    lines = guest_cart.lines()
+    items_total = sum(item.subtotal for item in lines)
+    return {'items_total': items_total, 'grand_total': items_total, 'item_count': len(lines)}
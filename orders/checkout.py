@@ -0,0 +1,81 @@
+"""
+Turning a cart into an order.
+
+place_order() runs in one transaction and issues the same handful of
+queries whatever the size of the cart: read the cart lines with their
+products (the prices charged are locked from that read), settle the stock
+holds, insert the order and all its lines in one bulk insert, refresh the
+stored totals and empty the cart with one DELETE. Order numbers come from
+OrderSequence, an auto-increment table, so concurrent checkouts never
+produce the same number and nothing has to be retried.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from cars.bulk import delete_rows
+
+from .models import CartItem, Order, OrderItem, OrderSequence
+from .reservations import consume_cart, return_stock, stock_changed, take_stock_many
+from .totals import refresh_cart_totals, refresh_order_totals
+
+SHIPPING_METHOD = 'Standard'
+SHIPPING_COST = Decimal('10.00')
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def next_order_number(when=None):
+    """'ORD-20261018-000042', unique across processes without locking or retrying"""
+    sequence = OrderSequence.objects.create()
+    return f"ORD-{(when or timezone.now()):%Y%m%d}-{sequence.pk:06d}"
+
+
+def place_order(cart, address, customer_notes='', shipping_method=SHIPPING_METHOD, shipping_cost=SHIPPING_COST):
+    """
+    Create an Order from the cart and empty it.
+
+    Stock held by reserve_cart() is used as is, anything not (or no longer)
+    held is taken now; InsufficientStock rolls the whole order back.
+    """
+    with transaction.atomic():
+        items = list(cart.items.select_related('product'))
+        if not items:
+            raise EmptyCart()
+
+        held = consume_cart(cart)
+        missing, surplus = {}, {}
+        for item in items:
+            delta = item.quantity - held.pop(item.product_id, 0)
+            if delta > 0:
+                missing[item.product_id] = delta
+            elif delta < 0:
+                surplus[item.product_id] = -delta
+        take_stock_many(missing)
+        # Holds left over from lines removed after the checkout page was opened
+        surplus.update(held)
+        return_stock(surplus)
+
+        order = Order.objects.create(
+            customer=cart.customer,
+            shipping_address=address,
+            order_number=next_order_number(),
+            shipping_method=shipping_method,
+            shipping_cost=shipping_cost,
+            customer_notes=customer_notes,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item.product, quantity=item.quantity, unit_price=item.product.unit_price)
+            for item in items
+        ])
+        # bulk_create and delete_rows skip the item signals, refresh the stored totals once
+        refresh_order_totals([order.pk])
+        order.refresh_from_db(fields=['items_total', 'grand_total', 'item_count'])
+        delete_rows(CartItem.objects.filter(cart=cart))
+        refresh_cart_totals([cart.pk])
+
+        stock_changed(missing, surplus)
+    return order
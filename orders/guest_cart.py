@@ -0,0 +1,143 @@
+"""
+Carts for visitors who are not logged in.
+
+A guest cart is just {product id: quantity}, kept in a signed cookie
+("12:1,40:3") so adding, changing and removing lines costs no database
+write and no session row. GuestCartMiddleware loads it onto
+request.guest_cart and writes the cookie back only when it changed. On login
+merge_guest_cart() adds it to the customer's Cart with one bulk upsert and
+the cookie is dropped.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from products.models import Product
+
+from .models import Cart, CartItem
+from .totals import refresh_cart_totals
+
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'orders.guest_cart'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+
+# Keeps the cookie well under the 4 KB browsers accept
+MAX_LINES = 100
+MAX_QUANTITY = 999
+
+
+class GuestCart:
+    def __init__(self, items=None):
+        self.items = dict(items or {})
+        self.modified = False
+
+    @classmethod
+    def from_request(cls, request):
+        value = request.get_signed_cookie(COOKIE_NAME, default='', salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE)
+        return cls(cls.decode(value))
+
+    @staticmethod
+    def decode(value):
+        items = {}
+        for line in value.split(','):
+            product_id, _, quantity = line.partition(':')
+            if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+                items[int(product_id)] = min(int(quantity), MAX_QUANTITY)
+        return items
+
+    def encode(self):
+        return ','.join(f'{product_id}:{quantity}' for product_id, quantity in self.items.items())
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    @property
+    def count(self):
+        return sum(self.items.values())
+
+    def lines(self):
+        """Unsaved CartItems for the cart page, priced at the current product prices"""
+        products = Product.objects.filter(pk__in=self.items, is_active=True).select_related('category')
+        return [
+            CartItem(product=product, quantity=self.items[product.pk], unit_price=product.unit_price)
+            for product in products
+        ]
+
+    def add(self, product_id, quantity=1):
+        self.set(product_id, self.items.get(product_id, 0) + quantity)
+
+    def set(self, product_id, quantity):
+        if quantity <= 0:
+            self.remove(product_id)
+            return
+        if product_id not in self.items and len(self.items) >= MAX_LINES:
+            return
+        self.items[product_id] = min(quantity, MAX_QUANTITY)
+        self.modified = True
+
+    def remove(self, product_id):
+        if self.items.pop(product_id, None) is not None:
+            self.modified = True
+
+    def clear(self):
+        if self.items:
+            self.items = {}
+            self.modified = True
+
+    def save(self, response):
+        """Write the cookie back if anything changed"""
+        if not self.modified:
+            return
+        if self.items:
+            response.set_signed_cookie(
+                COOKIE_NAME, self.encode(), salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True, samesite='Lax',
+            )
+        else:
+            response.delete_cookie(COOKIE_NAME, samesite='Lax')
+
+
+class GuestCartMiddleware:
+    """Puts the visitor's cookie cart on request.guest_cart"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.guest_cart = GuestCart.from_request(request)
+        response = self.get_response(request)
+        request.guest_cart.save(response)
+        return response
+
+
+def merge_guest_cart(guest_cart, customer):
+    """
+    Add the guest cart's lines to the customer's Cart and empty the guest cart.
+
+    Quantities of products already in the cart are added together. All
+    lines are written with one INSERT ... ON CONFLICT DO UPDATE, whatever
+    the size of the guest cart.
+    """
+    if not guest_cart:
+        return
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(customer=customer)
+        prices = dict(
+            Product.objects.filter(pk__in=guest_cart.items, is_active=True).values_list('pk', 'unit_price')
+        )
+        existing = dict(
+            CartItem.objects.filter(cart=cart, product_id__in=prices).values_list('product_id', 'quantity')
+        )
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, unit_price=price,
+                      quantity=min(existing.get(product_id, 0) + guest_cart.items[product_id], MAX_QUANTITY))
+             for product_id, price in prices.items()],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'unit_price'],
+        )
+        # bulk_create skips the CartItem signals
+        refresh_cart_totals([cart.pk])
+    guest_cart.clear()
@@ -0,0 +1,36 @@
+# orders/management/commands/backfill_order_totals.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from orders.models import Cart, Order
+from orders.totals import refresh_cart_totals, refresh_order_totals
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored items_total, grand_total and item_count of every order and cart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows updated per statement (default: 1000)')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        for model, refresh in ((Order, refresh_order_totals), (Cart, refresh_cart_totals)):
+            start = time.perf_counter()
+            updated = 0
+            last_pk = 0
+            while True:
+                # Walk the primary key so each batch is an index range, not an OFFSET
+                pks = list(
+                    model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+                )
+                if not pks:
+                    break
+                with transaction.atomic():
+                    updated += refresh(pks)
+                last_pk = pks[-1]
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                self.style.SUCCESS(f'Backfilled {updated} {model._meta.verbose_name_plural} in {elapsed:.1f}s')
+            )
@@ -0,0 +1,128 @@
+# orders/management/commands/benchmark_reservations.py
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from cars.bulk import delete_rows
+from customers.models import Customer
+from orders.models import Cart, CartItem, StockReservation
+from orders.reservations import InsufficientStock, reserve_cart
+from products.models import Category, Product
+
+USERNAME_PREFIX = 'reservation-benchmark-'
+
+# The contended SKUs are made for the run, the real catalog's stock is never touched
+SKU_PREFIX = 'RESERVATION-BENCHMARK-'
+
+
+class Command(BaseCommand):
+    help = 'Runs many concurrent simulated checkouts against the same few SKUs and checks nothing is oversold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=200, help='Number of simulated checkouts')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent threads')
+        parser.add_argument('--products', type=int, default=3, help='Number of contended SKUs')
+        parser.add_argument('--stock', type=int, default=100, help='Units of each SKU on the shelf')
+        parser.add_argument('--max-quantity', type=int, default=3, help='Largest quantity per cart line')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        category = Category.objects.order_by('pk').first()
+        if category is None:
+            self.stdout.write(self.style.ERROR("No categories found! Run 'seed_products' first."))
+            return
+
+        rng = random.Random(options['seed'])
+        self._cleanup()
+        products = self._make_products(category, max(1, options['products']), options['stock'])
+        carts = self._make_carts(products, options['checkouts'], options['max_quantity'], rng)
+
+        outcomes = {'held': 0, 'short': 0, 'error': 0}
+        latencies = []
+        lock = threading.Lock()
+
+        def checkout(cart):
+            start = time.perf_counter()
+            try:
+                reserve_cart(cart)
+                outcome = 'held'
+            except InsufficientStock:
+                outcome = 'short'
+            except OperationalError:
+                # e.g. SQLite "database is locked" under heavy write contention
+                outcome = 'error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(elapsed)
+
+        def run(cart):
+            try:
+                checkout(cart)
+            finally:
+                connection.close()
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                list(pool.map(run, carts))
+            wall = time.perf_counter() - start
+            self._report(products, options['stock'], outcomes, latencies, wall)
+        finally:
+            self._cleanup()
+
+    def _make_products(self, category, count, stock):
+        """Inactive products, so no listing, search or counter ever shows them"""
+        Product.objects.bulk_create([
+            Product(sku=f'{SKU_PREFIX}{i}', title=f'Reservation benchmark {i}', slug=f'reservation-benchmark-{i}',
+                    description='', category=category, unit_price=10, inventory=stock, is_active=False)
+            for i in range(count)
+        ])
+        return list(Product.objects.filter(sku__startswith=SKU_PREFIX).order_by('pk'))
+
+    def _cleanup(self):
+        # The carts, their lines and holds go with the users; then nothing points at the products
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        delete_rows(Product.objects.filter(sku__startswith=SKU_PREFIX))
+
+    def _make_carts(self, products, count, max_quantity, rng):
+        User.objects.bulk_create([User(username=f'{USERNAME_PREFIX}{i}') for i in range(count)])
+        users = User.objects.filter(username__startswith=USERNAME_PREFIX)
+        Customer.objects.bulk_create([Customer(user=user) for user in users])
+        customers = Customer.objects.filter(user__username__startswith=USERNAME_PREFIX)
+        Cart.objects.bulk_create([Cart(customer=customer) for customer in customers])
+        carts = list(Cart.objects.filter(customer__user__username__startswith=USERNAME_PREFIX))
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=rng.randint(1, max_quantity), unit_price=product.unit_price)
+            for cart in carts
+            for product in rng.sample(products, rng.randint(1, len(products)))
+        ])
+        return carts
+
+    def _report(self, products, stock, outcomes, latencies, wall):
+        total = sum(outcomes.values())
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(
+            f"{total} checkouts in {wall:.2f}s ({total / wall:.0f}/s): "
+            f"{outcomes['held']} held, {outcomes['short']} out of stock, {outcomes['error']} errors"
+        )
+        self.stdout.write(
+            f"latency p50 {statistics.median(latencies) * 1000:.1f}ms, p95 {p95 * 1000:.1f}ms"
+        )
+
+        oversold = False
+        for product in Product.objects.filter(pk__in=[product.pk for product in products]):
+            held = sum(StockReservation.objects.filter(product=product).values_list('quantity', flat=True))
+            self.stdout.write(f"  {product.sku}: {held} held, {product.inventory} left of {stock}")
+            if product.inventory < 0 or held + product.inventory != stock:
+                oversold = True
+        if oversold:
+            self.stdout.write(self.style.ERROR('Inventory does not add up, stock was oversold or lost!'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Held plus remaining stock matches the shelf for every SKU'))
@@ -0,0 +1,21 @@
+# orders/management/commands/release_expired_reservations.py
+import time
+
+from django.core.management.base import BaseCommand
+from orders.reservations import RELEASE_BATCH_SIZE, release_expired
+
+
+class Command(BaseCommand):
+    help = 'Returns the stock of expired checkout reservations to inventory (run every minute or so)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RELEASE_BATCH_SIZE,
+                            help=f'Reservations released per transaction (default: {RELEASE_BATCH_SIZE})')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        released = release_expired(batch_size=max(1, options['batch_size']))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(f'Released {released} expired reservations in {elapsed:.2f}s')
+        )
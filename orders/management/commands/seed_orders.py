@@ -1,6 +1,7 @@
 # orders/management/commands/seed_orders.py
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from orders.checkout import next_order_number
 from orders.models import Order, OrderItem
 from customers.models import Customer, Address
 from products.models import Product
@@ -39,11 +40,11 @@ class Command(BaseCommand):
                 # Fallback: skip if no address (shouldn't happen if seeded properly)
                 continue
 
-            # Generate unique order number
-            order_number = f"ORD-{timezone.now().strftime('%Y%m%d')}-{1000 + i}"
-
             # Random dates
             placed_at = timezone.now() - timedelta(days=random.randint(0, 90))  # up to 3 months ago
+
+            # Unique order number, safe across re-runs
+            order_number = next_order_number(placed_at)
             shipped_at = None
             delivered_at = None
 
@@ -7,12 +7,17 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Maintained from the items (see totals.py); shipping is only added on the order
+    items_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    grand_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    
     def __str__(self):
         return f"Cart for {self.customer}"
     
     @property
     def total(self):
-        return sum(item.subtotal for item in self.items.all())
+        return self.grand_total
 
 
 class CartItem(models.Model):
@@ -32,6 +37,26 @@ class CartItem(models.Model):
         return f"{self.quantity}x {self.product.title}"
 
 
+class StockReservation(models.Model):
+    """Stock held for a cart during checkout, returned to inventory when it expires"""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['cart', 'product']
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} held for cart {self.cart_id}"
+
+
+class OrderSequence(models.Model):
+    """Order number source, one auto-increment row per number issued (see checkout.py)"""
+    issued_at = models.DateTimeField(auto_now_add=True)
+
+
 class Order(models.Model):
     PAYMENT_STATUS_CHOICES = [
         ('P', 'Pending'),
@@ -68,13 +93,23 @@ class Order(models.Model):
     customer_notes = models.TextField(blank=True)
     admin_notes = models.TextField(blank=True)
     
+    # Totals, maintained from the items (see totals.py)
+    items_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    grand_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False, db_index=True)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    
     def __str__(self):
         return f"Order {self.order_number}"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Recompute in SQL, this instance's totals may predate item changes
+        from .totals import refresh_order_totals
+        refresh_order_totals([self.pk])
+    
     @property
     def total(self):
-        items_total = sum(item.subtotal for item in self.items.all())
-        return items_total + self.shipping_cost
+        return self.grand_total
 
 
 class OrderItem(models.Model):
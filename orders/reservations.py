@@ -0,0 +1,203 @@
+"""
+Inventory reservations for checkout.
+
+Proceeding to checkout holds the cart's quantities for HOLD_TIME by taking
+them off Product.inventory with a conditional UPDATE (inventory >= quantity),
+so two shoppers racing for the last units cannot both get them and nothing
+is read, modified and written back. Only the cart page's POST takes a hold,
+never a GET, so crawlers and link prefetching cannot tie up stock. Holds
+that are not turned into an order expire and are handed back in batches by
+release_expired(), which the release_expired_reservations command runs on a
+schedule.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Min, Q, Value, When
+from django.utils import timezone
+
+from products.catalog_index import catalog_index
+from products.detail_cache import forget_slug
+from products.models import Product
+
+from .models import StockReservation
+
+HOLD_TIME = timedelta(minutes=15)
+
+RELEASE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    """Some cart lines cannot be held, ``products`` lists them"""
+
+    def __init__(self, products):
+        self.products = products
+        super().__init__(', '.join(product.title for product in products))
+
+
+# ==================== STOCK ====================
+def take_stock(product_id, quantity):
+    """Take quantity off the product's inventory if that much is left, True on success"""
+    return bool(
+        Product.objects.filter(pk=product_id, inventory__gte=quantity)
+        .update(inventory=F('inventory') - quantity, last_updated=timezone.now())
+    )
+
+
+def take_stock_many(quantities):
+    """Take {product id: quantity} off the shelf in one UPDATE, all of it or (InsufficientStock) none"""
+    if not quantities:
+        return
+    amount = _per_product(quantities)
+    try:
+        with transaction.atomic():
+            taken = Product.objects.filter(pk__in=quantities, inventory__gte=amount).update(
+                inventory=F('inventory') - amount, last_updated=timezone.now(),
+            )
+            if taken != len(quantities):
+                raise InsufficientStock([])
+    except InsufficientStock:
+        raise InsufficientStock(list(Product.objects.filter(pk__in=quantities, inventory__lt=amount)))
+
+
+def return_stock(quantities):
+    """Put {product id: quantity} back on the shelf with one UPDATE"""
+    if not quantities:
+        return
+    Product.objects.filter(pk__in=quantities).update(
+        inventory=F('inventory') + _per_product(quantities),
+        last_updated=timezone.now(),
+    )
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def stock_changed(taken=(), returned=None):
+    """
+    Refresh the catalog index and detail pages of the products that ran out
+    with the ids ``taken`` from, or came back with {product id: quantity}
+    ``returned``. The storefront only shows whether a part is in stock, so
+    other inventory writes leave both alone. Call it in the transaction of
+    the write, whose row locks keep the stock from moving in between.
+    """
+    if not taken and not returned:
+        return
+    condition = Q(pk__in=list(taken), inventory=0)
+    for pk, quantity in (returned or {}).items():
+        # That much is back, so there was none before
+        condition |= Q(pk=pk, inventory=quantity)
+    products = dict(Product.objects.filter(condition).values_list('pk', 'slug'))
+    if not products:
+        return
+    slugs = list(products.values())
+    catalog_index.invalidate(products=list(products))
+    transaction.on_commit(lambda: forget_slug(*slugs))
+
+
+# ==================== RESERVATIONS ====================
+def reserve_cart(cart, hold=HOLD_TIME):
+    """
+    Hold stock for every line of the cart and return when the hold expires.
+
+    Existing holds are topped up, reduced or extended to match the cart.
+    Either every line is held or nothing changes and InsufficientStock is
+    raised.
+    """
+    items = list(cart.items.select_related('product'))
+    expires_at = timezone.now() + hold
+    with transaction.atomic():
+        held = {
+            reservation.product_id: reservation.quantity
+            for reservation in StockReservation.objects.select_for_update().filter(cart=cart)
+        }
+        short, taken, returned = [], [], Counter()
+        for item in items:
+            delta = item.quantity - held.pop(item.product_id, 0)
+            if delta > 0:
+                if take_stock(item.product_id, delta):
+                    taken.append(item.product_id)
+                else:
+                    short.append(item.product)
+            elif delta < 0:
+                returned[item.product_id] = -delta
+        if short:
+            raise InsufficientStock(short)
+
+        # Lines removed from the cart since the last hold
+        if held:
+            StockReservation.objects.filter(cart=cart, product_id__in=held).delete()
+            returned.update(held)
+        return_stock(returned)
+
+        StockReservation.objects.bulk_create(
+            [StockReservation(cart=cart, product_id=item.product_id, quantity=item.quantity, expires_at=expires_at)
+             for item in items],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+        stock_changed(taken, returned)
+    return expires_at
+
+
+def held_until(cart):
+    """When the cart's earliest live hold expires, or None if nothing is held"""
+    return StockReservation.objects.filter(cart=cart, expires_at__gt=timezone.now()).aggregate(
+        until=Min('expires_at'),
+    )['until']
+
+
+def release_cart(cart):
+    """Give back everything held for the cart"""
+    with transaction.atomic():
+        held = list(
+            StockReservation.objects.select_for_update().filter(cart=cart)
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        if held:
+            _release(held)
+
+
+def consume_cart(cart):
+    """Drop the cart's holds without returning stock (it was sold), {product id: quantity} held"""
+    with transaction.atomic():
+        held = dict(
+            StockReservation.objects.select_for_update().filter(cart=cart)
+            .values_list('product_id', 'quantity')
+        )
+        StockReservation.objects.filter(cart=cart).delete()
+    return held
+
+
+def release_expired(batch_size=RELEASE_BATCH_SIZE, now=None):
+    """Return stock of expired holds, batch_size holds per transaction, and count them"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = StockReservation.objects.filter(expires_at__lte=now).order_by('expires_at')
+            if connection.features.has_select_for_update_skip_locked:
+                # Holds being extended or consumed right now are left for the next run
+                expired = expired.select_for_update(skip_locked=True)
+            batch = list(expired.values_list('pk', 'product_id', 'quantity')[:batch_size])
+            if not batch:
+                return released
+            _release(batch)
+        released += len(batch)
+
+
+def _release(rows):
+    """Delete (pk, product id, quantity) holds and put their stock back"""
+    StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    quantities = Counter()
+    for _, product_id, quantity in rows:
+        quantities[product_id] += quantity
+    return_stock(quantities)
+    stock_changed(returned=quantities)
@@ -0,0 +1,41 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from customers.models import Customer
+
+from .guest_cart import merge_guest_cart
+from .models import Cart, CartItem, OrderItem
+from .reservations import release_cart
+from .totals import refresh_cart_totals, refresh_order_totals
+
+
+# ==================== STOCK RESERVATIONS ====================
+@receiver(pre_delete, sender=Cart)
+def release_cart_stock(sender, instance, **kwargs):
+    """The cascade would drop the holds without putting their stock back"""
+    release_cart(instance)
+
+
+# ==================== STORED TOTALS ====================
+@receiver([post_save, post_delete], sender=OrderItem)
+def refresh_order(sender, instance, **kwargs):
+    refresh_order_totals([instance.order_id])
+
+
+@receiver([post_save, post_delete], sender=CartItem)
+def refresh_cart(sender, instance, **kwargs):
+    refresh_cart_totals([instance.cart_id])
+
+
+# ==================== GUEST CART ====================
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    guest_cart = getattr(request, 'guest_cart', None)
+    if not guest_cart:
+        return
+    try:
+        customer = user.customer
+    except Customer.DoesNotExist:
+        return
+    merge_guest_cart(guest_cart, customer)
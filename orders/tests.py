@@ -1,3 +1,448 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from cars.testing import (
+    CatalogTestCase, ChangelistQueryBudgetMixin, make_category, make_customer, make_product, reset_process_caches,
+)
+from customers.models import Address
+from products.catalog_index import catalog_index
+from products.models import Product
+
+from .cart_operations import MAX_OPERATIONS, apply_operations, fold_operations, parse_operations
+from .checkout import EmptyCart, next_order_number, place_order
+from .guest_cart import COOKIE_NAME, MAX_QUANTITY, GuestCart
+from .models import Cart, CartItem, Order, OrderItem, StockReservation
+from .reservations import (
+    InsufficientStock, held_until, release_cart, release_expired, reserve_cart, take_stock, take_stock_many,
+)
+from .totals import refresh_cart_totals
+
+
+class ChangelistQueryBudgetTests(ChangelistQueryBudgetMixin, TestCase):
+    app_label = 'orders'
+
+
+class CartTestCase(CatalogTestCase):
+    """A customer with an address and an empty cart, and two products"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.address = Address.objects.create(customer=cls.customer, street='1 Main St', city='Springfield')
+        cls.cart = Cart.objects.create(customer=cls.customer)
+        category = make_category('Brakes')
+        cls.pad = make_product('Brake Pad', category, price='25.00', inventory=5)
+        cls.rotor = make_product('Brake Rotor', category, price='60.00', inventory=1)
+
+    def fill(self, cart, **quantities):
+        for name, quantity in quantities.items():
+            product = getattr(self, name)
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity, unit_price=product.unit_price)
+
+    def inventory(self, product):
+        product.refresh_from_db(fields=['inventory'])
+        return product.inventory
+
+
+# ==================== RESERVATIONS ====================
+class ReservationTests(CartTestCase):
+    def other_cart(self, **quantities):
+        cart = Cart.objects.create(customer=make_customer('rival'))
+        self.fill(cart, **quantities)
+        return cart
+
+    def test_take_stock_never_goes_below_zero(self):
+        self.assertTrue(take_stock(self.rotor.pk, 1))
+        self.assertFalse(take_stock(self.rotor.pk, 1))
+        self.assertEqual(self.inventory(self.rotor), 0)
+
+    def test_take_stock_many_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            take_stock_many({self.pad.pk: 2, self.rotor.pk: 2})
+        self.assertEqual(raised.exception.products, [self.rotor])
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (5, 1))
+        take_stock_many({self.pad.pk: 2, self.rotor.pk: 1})
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (3, 0))
+
+    def test_only_one_of_two_carts_gets_the_last_unit(self):
+        self.fill(self.cart, pad=1, rotor=1)
+        rival = self.other_cart(pad=2, rotor=1)
+        reserve_cart(self.cart)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_cart(rival)
+        self.assertEqual(raised.exception.products, [self.rotor])
+        # The rival's pads were not held either
+        self.assertFalse(StockReservation.objects.filter(cart=rival).exists())
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (4, 0))
+
+    def test_reserving_again_follows_the_cart(self):
+        self.fill(self.cart, pad=2, rotor=1)
+        reserve_cart(self.cart)
+        self.cart.items.filter(product=self.pad).update(quantity=4)
+        self.cart.items.filter(product=self.rotor).delete()
+        until = reserve_cart(self.cart)
+
+        self.assertEqual(dict(self.cart.reservations.values_list('product_id', 'quantity')), {self.pad.pk: 4})
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (1, 1))
+        self.assertEqual(held_until(self.cart), until)
+
+    def test_release_gives_the_stock_back(self):
+        self.fill(self.cart, pad=3)
+        reserve_cart(self.cart)
+        release_cart(self.cart)
+        self.assertIsNone(held_until(self.cart))
+        self.assertEqual(self.inventory(self.pad), 5)
+
+        reserve_cart(self.cart)
+        self.cart.delete()
+        self.assertEqual(self.inventory(self.pad), 5)
+
+    def test_expired_holds_are_released_in_batches(self):
+        self.fill(self.cart, pad=2)
+        rival = self.other_cart(pad=1, rotor=1)
+        reserve_cart(self.cart, hold=timedelta(minutes=-1))
+        reserve_cart(rival, hold=timedelta(minutes=-1))
+        self.assertIsNone(held_until(rival))
+
+        self.assertEqual(release_expired(batch_size=1), 3)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (5, 1))
+
+    def test_release_command_keeps_live_holds(self):
+        self.fill(self.cart, pad=2)
+        reserve_cart(self.cart)
+        self.assertEqual(release_expired(), 0)
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(hours=1)), 1)
+        self.assertEqual(self.inventory(self.pad), 5)
+
+    def test_reservations_refresh_the_stock_facet(self):
+        self.fill(self.cart, rotor=1)
+        self.assertEqual(catalog_index.facet_search({}).counts['in_stock'], {True: 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_cart(self.cart)
+        self.assertEqual(catalog_index.facet_search({}).counts['in_stock'], {True: 1, False: 1})
+
+    def test_only_stock_running_out_or_coming_back_refreshes_the_storefront(self):
+        self.fill(self.cart, pad=2, rotor=1)
+        with mock.patch.object(catalog_index, 'invalidate') as invalidate:
+            reserve_cart(self.cart)
+            invalidate.assert_called_once_with(products=[self.rotor.pk])
+            invalidate.reset_mock()
+
+            self.cart.items.filter(product=self.pad).update(quantity=3)
+            reserve_cart(self.cart)
+            invalidate.assert_not_called()
+
+            release_cart(self.cart)
+            invalidate.assert_called_once_with(products=[self.rotor.pk])
+
+
+class BenchmarkReservationsTests(TransactionTestCase):
+    """The checkouts run in threads with connections of their own, so nothing can stay uncommitted"""
+
+    def setUp(self):
+        reset_process_caches()
+        self.product = make_product('Brake Pad', make_category('Brakes'), inventory=7)
+
+    def test_runs_on_products_of_its_own(self):
+        stdout = StringIO()
+        call_command('benchmark_reservations', '--checkouts', '20', '--workers', '2', '--stock', '10',
+                     stdout=stdout)
+        self.assertIn('Held plus remaining stock matches the shelf for every SKU', stdout.getvalue())
+        self.assertIn('RESERVATION-BENCHMARK-0', stdout.getvalue())
+        self.assertEqual(list(Product.objects.values_list('pk', 'inventory')), [(self.product.pk, 7)])
+        self.assertFalse(Cart.objects.exists())
+
+
+class CheckoutHoldTests(CartTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.customer.user)
+        self.fill(self.cart, pad=2, rotor=1)
+
+    def test_showing_checkout_holds_nothing(self):
+        response = self.client.get(reverse('orders:checkout'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['reserved_until'])
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.inventory(self.pad), 5)
+
+    def test_proceeding_to_checkout_holds_the_cart(self):
+        response = self.client.post(reverse('orders:checkout'), {'reserve': '1'})
+        self.assertRedirects(response, reverse('orders:checkout'))
+        self.assertEqual(StockReservation.objects.filter(cart=self.cart).count(), 2)
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (3, 0))
+        self.assertIsNotNone(self.client.get(reverse('orders:checkout')).context['reserved_until'])
+
+    def test_short_stock_sends_the_customer_back_to_the_cart(self):
+        self.cart.items.filter(product=self.rotor).update(quantity=2)
+        response = self.client.post(reverse('orders:checkout'), {'reserve': '1'}, follow=True)
+        self.assertRedirects(response, reverse('orders:cart_detail'))
+        self.assertContains(response, 'Not enough stock left for Brake Rotor')
+        self.assertFalse(StockReservation.objects.exists())
+
+
+# ==================== CHECKOUT ====================
+class PlaceOrderTests(CartTestCase):
+    def test_order_copies_the_cart_and_empties_it(self):
+        self.fill(self.cart, pad=2, rotor=1)
+        order = place_order(self.cart, self.address, customer_notes='Leave at the door')
+
+        self.assertEqual(
+            sorted(order.items.values_list('product__sku', 'quantity', 'unit_price')),
+            [(self.pad.sku, 2, Decimal('25.00')), (self.rotor.sku, 1, Decimal('60.00'))],
+        )
+        self.assertEqual(
+            (order.items_total, order.grand_total, order.item_count), (Decimal('110.00'), Decimal('120.00'), 2),
+        )
+        self.assertEqual(order.customer_notes, 'Leave at the door')
+        self.assertFalse(self.cart.items.exists())
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.grand_total, self.cart.item_count), (0, 0))
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (3, 0))
+
+    def test_held_stock_is_used_and_surplus_returned(self):
+        self.fill(self.cart, pad=3)
+        reserve_cart(self.cart)
+        self.cart.items.filter(product=self.pad).update(quantity=1)
+        place_order(self.cart, self.address)
+        self.assertEqual(self.inventory(self.pad), 4)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_short_stock_rolls_everything_back(self):
+        self.fill(self.cart, pad=2, rotor=2)
+        with self.assertRaises(InsufficientStock):
+            place_order(self.cart, self.address)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+        self.assertEqual((self.inventory(self.pad), self.inventory(self.rotor)), (5, 1))
+
+    def test_empty_cart_is_refused(self):
+        with self.assertRaises(EmptyCart):
+            place_order(self.cart, self.address)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        self.fill(self.cart, pad=1)
+        with CaptureQueriesContext(connection) as one_line:
+            place_order(self.cart, self.address)
+
+        category = self.pad.category
+        for n in range(5):
+            product = make_product(f'Part {n}', category)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=1, unit_price=product.unit_price)
+        with CaptureQueriesContext(connection) as five_lines:
+            place_order(self.cart, self.address)
+        self.assertEqual(len(five_lines), len(one_line))
+
+    def test_order_numbers_are_unique_and_dated(self):
+        numbers = {next_order_number() for _ in range(3)}
+        self.assertEqual(len(numbers), 3)
+        self.assertTrue(all(number.startswith(f'ORD-{timezone.now():%Y%m%d}-') for number in numbers))
+
+    def test_checkout_form_places_the_order(self):
+        self.client.force_login(self.customer.user)
+        self.fill(self.cart, pad=1)
+        url = reverse('orders:checkout')
+        response = self.client.post(url, {'address_id': 0}, follow=True)
+        self.assertContains(response, 'Please choose a shipping address.')
+
+        response = self.client.post(url, {'address_id': self.address.pk}, follow=True)
+        order = Order.objects.get()
+        self.assertContains(response, order.order_number)
+        self.assertFalse(self.cart.items.exists())
+
+
+# ==================== STORED TOTALS ====================
+class StoredTotalsTests(CartTestCase):
+    def totals(self, instance):
+        instance.refresh_from_db(fields=['items_total', 'grand_total', 'item_count'])
+        return instance.items_total, instance.grand_total, instance.item_count
+
+    def test_order_totals_follow_items_and_shipping(self):
+        order = Order.objects.create(
+            customer=self.customer, shipping_address=self.address, order_number='T-1', shipping_cost=Decimal('5.00'),
+        )
+        self.assertEqual(self.totals(order), (0, Decimal('5.00'), 0))
+        item = OrderItem.objects.create(order=order, product=self.pad, quantity=2, unit_price=Decimal('25.00'))
+        OrderItem.objects.create(order=order, product=self.rotor, quantity=1, unit_price=Decimal('60.00'))
+        self.assertEqual(self.totals(order), (Decimal('110.00'), Decimal('115.00'), 2))
+
+        item.delete()
+        order.shipping_cost = Decimal('0.00')
+        order.save()
+        self.assertEqual(self.totals(order), (Decimal('60.00'), Decimal('60.00'), 1))
+
+    def test_cart_totals_follow_items(self):
+        self.fill(self.cart, pad=3)
+        self.assertEqual(self.totals(self.cart), (Decimal('75.00'), Decimal('75.00'), 1))
+        self.cart.items.get().delete()
+        self.assertEqual(self.totals(self.cart), (0, 0, 0))
+
+    def test_refresh_fixes_drifted_totals(self):
+        self.fill(self.cart, pad=1, rotor=1)
+        Cart.objects.filter(pk=self.cart.pk).update(items_total=1, grand_total=1, item_count=9)
+        self.assertEqual(refresh_cart_totals([self.cart.pk]), 1)
+        self.assertEqual(self.totals(self.cart), (Decimal('85.00'), Decimal('85.00'), 2))
+
+    def test_order_list_sorts_on_the_stored_total(self):
+        for number, quantity in [('T-1', 1), ('T-2', 3), ('T-3', 2)]:
+            order = Order.objects.create(customer=self.customer, shipping_address=self.address, order_number=number)
+            OrderItem.objects.create(order=order, product=self.pad, quantity=quantity, unit_price=Decimal('25.00'))
+        with self.assertNumQueries(1):
+            numbers = list(Order.objects.order_by('-grand_total').values_list('order_number', flat=True))
+        self.assertEqual(numbers, ['T-2', 'T-3', 'T-1'])
+
+
+# ==================== GUEST CART ====================
+class GuestCartTests(CartTestCase):
+    def guest_cookie(self):
+        return self.client.cookies[COOKIE_NAME].value
+
+    def test_cookie_round_trip(self):
+        cart = GuestCart({3: 1, 12: 4})
+        self.assertEqual(GuestCart.decode(cart.encode()), {3: 1, 12: 4})
+        self.assertEqual(GuestCart.decode('1:2,x:1,4:0,5:-1,6:5000'), {1: 2, 6: MAX_QUANTITY})
+        self.assertEqual(GuestCart.decode(''), {})
+
+    def test_guest_lines_live_in_a_signed_cookie(self):
+        self.client.post(reverse('orders:add_to_cart', args=[self.pad.pk]))
+        self.client.post(reverse('orders:add_to_cart', args=[self.pad.pk]))
+        self.client.post(reverse('orders:add_to_cart', args=[self.rotor.pk]))
+        self.assertFalse(CartItem.objects.exists())
+        request = RequestFactory().get('/')
+        request.COOKIES[COOKIE_NAME] = self.guest_cookie()
+        self.assertEqual(GuestCart.from_request(request).items, {self.pad.pk: 2, self.rotor.pk: 1})
+
+        response = self.client.get(reverse('orders:cart_detail'))
+        lines = {item.product: item.quantity for item in response.context['cart_items']}
+        self.assertEqual(lines, {self.pad: 2, self.rotor: 1})
+        self.assertEqual(response.context['total'], Decimal('110.00'))
+        self.assertNotIn(COOKIE_NAME, response.cookies)
+
+        self.client.post(reverse('orders:remove_from_cart', args=[self.pad.pk]))
+        self.client.post(reverse('orders:remove_from_cart', args=[self.rotor.pk]))
+        self.assertEqual(self.guest_cookie(), '')
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.post(reverse('orders:add_to_cart', args=[self.pad.pk]))
+        value = self.guest_cookie()
+        self.client.cookies[COOKIE_NAME] = value.replace(f'{self.pad.pk}:1', f'{self.pad.pk}:9')
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(list(response.context['cart_items']), [])
+
+        self.client.cookies[COOKIE_NAME] = f'{self.pad.pk}:9'
+        response = self.client.get(reverse('orders:cart_detail'))
+        self.assertEqual(list(response.context['cart_items']), [])
+
+    def test_login_merges_the_guest_cart(self):
+        self.fill(self.cart, pad=1)
+        retired = make_product('Old Pad', self.pad.category, is_active=False)
+        for product in (self.pad, self.pad, self.rotor, retired):
+            self.client.post(reverse('orders:add_to_cart', args=[product.pk]))
+
+        response = self.client.post(reverse('customers:login'), {'username': 'shopper', 'password': 'secret'})
+        self.assertEqual(response.cookies[COOKIE_NAME]['max-age'], 0)
+        self.assertEqual(
+            dict(self.cart.items.values_list('product_id', 'quantity')), {self.pad.pk: 3, self.rotor.pk: 1},
+        )
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.grand_total, self.cart.item_count), (Decimal('135.00'), 2))
+
+    def test_login_without_a_guest_cart_changes_nothing(self):
+        self.fill(self.cart, pad=1)
+        self.client.post(reverse('customers:login'), {'username': 'shopper', 'password': 'secret'})
+        self.assertEqual(dict(self.cart.items.values_list('product_id', 'quantity')), {self.pad.pk: 1})
+
+
+# ==================== CART API ====================
+class CartApiTests(CartTestCase):
+    def post(self, body):
+        return self.client.post(reverse('orders:cart_api'), json.dumps(body), content_type='application/json')
+
+    def test_operations_fold_per_product(self):
+        operations = parse_operations([
+            {'op': 'add', 'product': 1},
+            {'op': 'add', 'product': 1, 'quantity': 2},
+            {'op': 'set', 'product': 2, 'quantity': 5},
+            {'op': 'add', 'product': 2},
+            {'op': 'remove', 'product': 3},
+        ])
+        self.assertEqual(fold_operations(operations), {1: ('add', 3), 2: ('set', 6), 3: ('set', 0)})
+
+    def test_malformed_batches_are_rejected(self):
+        self.client.force_login(self.customer.user)
+        cases = [
+            {'operations': []},
+            {'operations': [{'op': 'buy', 'product': self.pad.pk}]},
+            {'operations': [{'op': 'add', 'product': str(self.pad.pk)}]},
+            {'operations': [{'op': 'set', 'product': self.pad.pk, 'quantity': -1}]},
+            {'operations': [{'op': 'add', 'product': self.pad.pk, 'quantity': True}]},
+            {'operations': [{'op': 'add', 'product': self.pad.pk}] * (MAX_OPERATIONS + 1)},
+            ['not', 'an', 'object'],
+        ]
+        for body in cases:
+            with self.subTest(body=str(body)[:60]):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        response = self.client.post(reverse('orders:cart_api'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.cart.items.exists())
+
+    def test_batch_is_applied_to_the_customer_cart(self):
+        self.client.force_login(self.customer.user)
+        self.fill(self.cart, rotor=1)
+        retired = make_product('Old Pad', self.pad.category, is_active=False)
+        response = self.post({'operations': [
+            {'op': 'add', 'product': self.pad.pk, 'quantity': 2},
+            {'op': 'add', 'product': self.pad.pk},
+            {'op': 'remove', 'product': self.rotor.pk},
+            {'op': 'add', 'product': retired.pk},
+        ]})
+        self.assertEqual(response.json(), {
+            'items_total': '75.00',
+            'grand_total': '75.00',
+            'item_count': 1,
+            'quantities': {str(self.pad.pk): 3, str(self.rotor.pk): 0, str(retired.pk): 0},
+        })
+        self.assertEqual(dict(self.cart.items.values_list('product_id', 'quantity')), {self.pad.pk: 3})
+
+    def test_batch_cost_does_not_grow_with_its_size(self):
+        self.client.force_login(self.customer.user)
+        products = [make_product(f'Part {n}', self.pad.category) for n in range(6)]
+
+        def queries(batch):
+            with CaptureQueriesContext(connection) as captured:
+                self.post({'operations': [{'op': 'add', 'product': product.pk} for product in batch]})
+            return len(captured)
+
+        queries(products[:1])
+        self.assertEqual(queries(products[1:2]), queries(products[2:]))
+
+    def test_adding_a_negative_quantity_can_drop_a_line(self):
+        self.fill(self.cart, pad=2)
+        apply_operations(self.cart, [('add', self.pad.pk, -1)])
+        self.assertEqual(self.cart.items.get().quantity, 1)
+        self.assertEqual(apply_operations(self.cart, [('add', self.pad.pk, -5)]), {self.pad.pk: 0})
+        self.assertFalse(self.cart.items.exists())
+
+    def test_guests_get_the_same_api_on_their_cookie(self):
+        response = self.post({'operations': [
+            {'op': 'set', 'product': self.pad.pk, 'quantity': 2},
+            {'op': 'add', 'product': self.rotor.pk},
+        ]})
+        data = response.json()
+        self.assertEqual((data['grand_total'], data['item_count']), ('110.00', 2))
+        self.assertIn(COOKIE_NAME, response.cookies)
+        self.assertFalse(CartItem.objects.exists())
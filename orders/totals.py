@@ -0,0 +1,53 @@
+"""
+Stored totals for orders and carts.
+
+items_total, grand_total and item_count live on Order and Cart so lists can
+show, sort and filter on them in SQL. Item signals (see signals.py) and the
+bulk writers call refresh_*_totals(), which recomputes the columns for a set
+of parents in a single UPDATE with correlated subqueries; nothing is summed
+in Python, so concurrent item writes cannot leave a stale total behind.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Cart, CartItem, Order, OrderItem
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _item_sums(item_model, parent_field):
+    items = item_model.objects.filter(**{parent_field: OuterRef('pk')}).order_by().values(parent_field)
+    items_total = Coalesce(
+        Subquery(items.annotate(total=Sum(F('quantity') * F('unit_price'), output_field=MONEY)).values('total')),
+        Value(Decimal('0.00')),
+        output_field=MONEY,
+    )
+    item_count = Coalesce(
+        Subquery(items.annotate(count=Sum(Value(1))).values('count')),
+        Value(0),
+        output_field=IntegerField(),
+    )
+    return items_total, item_count
+
+
+def refresh_order_totals(order_ids):
+    """Recompute the stored totals of the given orders with one UPDATE"""
+    items_total, item_count = _item_sums(OrderItem, 'order')
+    return Order.objects.filter(pk__in=order_ids).update(
+        items_total=items_total,
+        # The SET clauses all see the old row, so grand_total repeats the subquery
+        grand_total=items_total + F('shipping_cost'),
+        item_count=item_count,
+    )
+
+
+def refresh_cart_totals(cart_ids):
+    """Recompute the stored totals of the given carts with one UPDATE"""
+    items_total, item_count = _item_sums(CartItem, 'cart')
+    return Cart.objects.filter(pk__in=cart_ids).update(
+        items_total=items_total,
+        grand_total=items_total,
+        item_count=item_count,
+    )
@@ -6,5 +6,8 @@ app_name = 'orders'
 urlpatterns = [
     path('', views.cart_detail, name='cart_detail'),
     path('add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
+    path('update/<int:product_id>/', views.update_cart, name='update_cart'),
+    path('remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('api/', views.cart_api, name='cart_api'),
     path('checkout/', views.checkout, name='checkout'),
 ]
\ No newline at end of file
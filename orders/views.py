@@ -1,25 +1,73 @@
+import json
+
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from products.models import Product
-from .models import Cart, CartItem
+from .models import Cart
+from .cart_operations import (
+    InvalidOperation, apply_guest_operations, apply_operations, cart_totals, guest_cart_totals, parse_operations,
+)
+from .checkout import SHIPPING_COST, EmptyCart, place_order
+from .reservations import InsufficientStock, held_until, reserve_cart
+
+def _customer_cart(request):
+    cart, created = Cart.objects.get_or_create(customer=request.user.customer)
+    return cart
+
+def _apply(request, operations):
+    """Apply cart operations to the customer's Cart or the guest cart, {product id: quantity}"""
+    if request.user.is_authenticated:
+        return apply_operations(_customer_cart(request), operations)
+    # Guests keep their cart in a cookie, nothing is written to the database
+    return apply_guest_operations(request.guest_cart, operations)
 
+@require_POST
 def add_to_cart(request, product_id):
     """Add product to cart"""
     product = get_object_or_404(Product, id=product_id)
+    _apply(request, [('add', product.id, 1)])
+    return redirect('orders:cart_detail')
+
+@require_POST
+def update_cart(request, product_id):
+    """Increase or decrease the quantity of a cart line"""
+    step = 1 if request.POST.get('action') == 'increase' else -1
+    _apply(request, [('add', product_id, step)])
+    return redirect('orders:cart_detail')
+
+@require_POST
+def remove_from_cart(request, product_id):
+    """Remove a line from the cart"""
+    _apply(request, [('remove', product_id, 0)])
+    return redirect('orders:cart_detail')
+
+@require_POST
+def cart_api(request):
+    """Apply a batch of add / set / remove operations and return the cart totals as JSON"""
+    try:
+        operations = parse_operations(json.loads(request.body).get('operations'))
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'expected a JSON object with an operations list'}, status=400)
+    except InvalidOperation as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
     
     if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(customer=request.user.customer)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={'unit_price': product.unit_price}
-        )
-        
-        if not created:
-            cart_item.quantity += 1
-            cart_item.save()
-    
-    return redirect('orders:cart_detail')
+        cart = _customer_cart(request)
+        quantities = apply_operations(cart, operations)
+        totals = cart_totals(cart)
+    else:
+        quantities = apply_guest_operations(request.guest_cart, operations)
+        totals = guest_cart_totals(request.guest_cart)
+    data = {
+        'items_total': str(totals['items_total']),
+        'grand_total': str(totals['grand_total']),
+        'item_count': totals['item_count'],
+        'quantities': {str(pk): quantity for pk, quantity in quantities.items()},
+    }
+    return JsonResponse(data)
 
 def cart_detail(request):
     """View shopping cart"""
@@ -29,8 +77,11 @@ def cart_detail(request):
     if request.user.is_authenticated:
         cart = Cart.objects.filter(customer=request.user.customer).first()
         if cart:
-            cart_items = cart.items.all()
+            cart_items = cart.items.select_related('product__category')
             total = cart.total
+    else:
+        cart_items = request.guest_cart.lines()
+        total = sum(item.subtotal for item in cart_items)
     
     context = {
         'cart_items': cart_items,
@@ -42,12 +93,42 @@ def cart_detail(request):
 def checkout(request):
     """Checkout page"""
     cart = get_object_or_404(Cart, customer=request.user.customer)
+    addresses = request.user.customer.addresses.all()
+    
+    if request.method == 'POST' and 'reserve' in request.POST:
+        # "Proceed to checkout": hold the stock while the customer fills in the form
+        try:
+            reserve_cart(cart)
+        except InsufficientStock as exc:
+            for product in exc.products:
+                messages.error(request, f"Not enough stock left for {product.title}, please adjust the quantity.")
+            return redirect('orders:cart_detail')
+        return redirect('orders:checkout')
     
     if request.method == 'POST':
-        # Create order logic here
-        pass
+        address = addresses.filter(pk=request.POST.get('address_id')).first()
+        if address is None:
+            messages.error(request, "Please choose a shipping address.")
+            return redirect('orders:checkout')
+        try:
+            order = place_order(cart, address, customer_notes=request.POST.get('customer_notes', ''))
+        except EmptyCart:
+            messages.error(request, "Your cart is empty.")
+            return redirect('orders:cart_detail')
+        except InsufficientStock as exc:
+            for product in exc.products:
+                messages.error(request, f"Not enough stock left for {product.title}, please adjust the quantity.")
+            return redirect('orders:cart_detail')
+        messages.success(request, f"Thank you! Your order {order.order_number} has been placed.")
+        return redirect('customers:profile')
     
+    # Showing the page changes nothing, the stock was held by the POST above
+    total = cart.total
     context = {
         'cart': cart,
+        'addresses': addresses,
+        'reserved_until': held_until(cart),
+        'shipping_cost': SHIPPING_COST,
+        'grand_total': total + SHIPPING_COST,
     }
     return render(request, 'orders/checkout.html', context)
@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.db.models import Count, Q
+from .interchange import normalize_part_number
 from .models import (
     Category, 
+    InterchangeGroup,
     Manufacturer, 
     Product, 
     ProductSpecification, 
@@ -12,10 +15,12 @@ from .models import (
 # ==================== CATEGORY ADMIN ====================
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'parent', 'slug']
+    list_display = ['name', 'parent', 'slug', 'depth', 'product_count']
     list_filter = ['parent']
     search_fields = ['name']
     prepopulated_fields = {'slug': ('name',)}
+    ordering = ['path']
+    list_select_related = ['parent']
 
 
 # ==================== MANUFACTURER ADMIN ====================
@@ -26,6 +31,27 @@ class ManufacturerAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 
+# ==================== INTERCHANGE GROUP ADMIN ====================
+@admin.register(InterchangeGroup)
+class InterchangeGroupAdmin(admin.ModelAdmin):
+    list_display = ['oem_number', 'name', 'product_count']
+    search_fields = ['oem_number', 'name']
+    
+    @admin.display(description='Parts', ordering='product_count')
+    def product_count(self, obj):
+        return obj.product_count
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(product_count=Count('products'))
+    
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        key = normalize_part_number(search_term)
+        if key:
+            results |= queryset.filter(oem_number=key)
+        return results, may_have_duplicates
+
+
 # ==================== INLINE ADMINS ====================
 class ProductSpecificationInline(admin.TabularInline):
     model = ProductSpecification
@@ -70,7 +96,7 @@ class ProductAdmin(admin.ModelAdmin):
     
     prepopulated_fields = {'slug': ('title',)}
     
-    autocomplete_fields = ['category', 'manufacturer']
+    autocomplete_fields = ['category', 'manufacturer', 'interchange_group']
     
     fieldsets = (
         ('Basic Information', {
@@ -83,11 +109,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('unit_price', 'cost_price', 'inventory', 'reorder_level')
         }),
         ('Part Details', {
-            'fields': ('part_number', 'oem_part_number', 'is_universal'),
-            'classes': ('collapse',)
-        }),
-        ('Physical Properties', {
-            'fields': ('weight', 'length', 'width', 'height'),
+            'fields': ('part_number', 'oem_part_number', 'interchange_group', 'is_universal'),
             'classes': ('collapse',)
         }),
         ('Status', {
@@ -101,7 +123,16 @@ class ProductAdmin(admin.ModelAdmin):
     ]
     
     list_per_page = 50
+    list_select_related = ['category', 'manufacturer']
     save_on_top = True
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Part numbers also match their normalized form (indexed, no icontains scan)"""
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        key = normalize_part_number(search_term)
+        if key:
+            results |= queryset.filter(Q(part_number_key=key) | Q(oem_part_number_key=key))
+        return results, may_have_duplicates
 
 
 # ==================== PRODUCT SPECIFICATION ADMIN ====================
@@ -111,6 +142,7 @@ class ProductSpecificationAdmin(admin.ModelAdmin):
     list_filter = ['name']
     search_fields = ['product__title', 'name', 'value']
     autocomplete_fields = ['product']
+    list_select_related = ['product']
 
 
 # ==================== PRODUCT FITMENT ADMIN ====================
@@ -120,7 +152,7 @@ class ProductFitmentAdmin(admin.ModelAdmin):
     list_filter = ['position']
     search_fields = [
         'product__title',
-        'vehicle__model__name',
-        'vehicle__model__make__name'
+        'vehicle__label'
     ]
-    autocomplete_fields = ['product', 'vehicle']
\ No newline at end of file
+    autocomplete_fields = ['product', 'vehicle']
+    list_select_related = ['product', 'vehicle']
\ No newline at end of file
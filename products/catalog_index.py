@@ -0,0 +1,445 @@
+"""
+In-memory catalog index used by the storefront listing.
+
+For every vehicle that has been looked at, the index keeps a sorted array of
+the ids of the products that fit it, and for every active product a small
+row with the attributes the listing filters on. Filtering by vehicle,
+category and is_universal is then an intersection in Python instead of a
+JOIN on ProductFitment followed by a DISTINCT over the catalog; a product
+without a row is inactive.
+
+The rows are also posted under each of their facet values (category,
+manufacturer, product type, price bucket, stock), so unfiltered facet counts
+are just the size of a posting and filtered ones never touch the database.
+
+The rows are loaded on the first read, one query over the active products,
+and cost about 500 bytes per product with its postings: some 500 MB in
+every worker process for a million active products. The vehicle arrays
+take 8 bytes per fitment of the MAX_VEHICLES most recently used vehicles.
+
+Each worker process holds its own copy. Model signals (see signals.py) patch
+the local copy and publish the ids that changed through the cache, so other
+workers replay just those changes instead of rebuilding everything. Changes
+are numbered by CatalogIndexGeneration, a database counter, because incr()
+on the file-based cache is a get and a set and two workers could both get
+the same number. The cache only holds the changes and the number of the
+latest one as a hint: a worker that sees a hint it has not seen before
+reads the counter and replays everything up to it, so requests made while
+nothing changes run no query at all.
+"""
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Number of the last change published, compared for equality only: workers
+# may store it out of order, but each number is stored once
+GENERATION_KEY = 'catalog_index:generation'
+CHANGE_KEY = 'catalog_index:change:{}'
+CHANGE_TIMEOUT = 60 * 60
+
+# Changes older than this are not replayed, the index is rebuilt instead
+MAX_REPLAY = 500
+
+# Per-vehicle arrays kept in memory (least recently used are dropped)
+MAX_VEHICLES = 10000
+
+# Facet search results kept per process until the index changes
+MAX_CACHED_SEARCHES = 256
+
+# Lower bounds of the price facet buckets
+PRICE_BUCKETS = [0, 25, 50, 100, 250]
+
+# Facet name -> ProductRow attribute it is posted under
+FACETS = {
+    'category': 'category_id',
+    'manufacturer': 'manufacturer_id',
+    'product_type': 'product_type',
+    'price': 'price_bucket',
+    'in_stock': 'in_stock',
+}
+
+ProductRow = namedtuple('ProductRow', [
+    'sort_key', 'category_id', 'manufacturer_id', 'product_type',
+    'price', 'price_bucket', 'in_stock', 'is_universal',
+])
+
+FacetResult = namedtuple('FacetResult', ['keys', 'total', 'counts'])
+
+# keys: sort keys of the matching products, newest first
+# by_vehicle: vehicle id -> sort keys of the matching products fitting it
+GarageResult = namedtuple('GarageResult', ['keys', 'by_vehicle'])
+
+PRODUCT_FIELDS = [
+    'id', 'created_at', 'category_id', 'manufacturer_id', 'product_type',
+    'unit_price', 'inventory', 'is_active', 'is_universal',
+]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def sort_key(created_at, pk):
+    """Listing order key: (created_at in whole microseconds, id)"""
+    return ((created_at - EPOCH) // timedelta(microseconds=1), pk)
+
+
+def price_bucket(price):
+    return bisect_right(PRICE_BUCKETS, price) - 1
+
+
+def make_row(pk, created_at, category_id, manufacturer_id, product_type,
+             unit_price, inventory, is_active, is_universal):
+    if not is_active:
+        return None
+    price = float(unit_price)
+    return ProductRow(
+        sort_key(created_at, pk), category_id, manufacturer_id, product_type,
+        price, price_bucket(price), inventory > 0, is_universal,
+    )
+
+
+def product_row(product):
+    """Index row for a Product instance, None for an inactive one (it is not indexed)"""
+    return make_row(*(getattr(product, field) for field in PRODUCT_FIELDS))
+
+
+class CatalogIndex:
+    """Vehicle -> product ids plus per-product filter attributes and facet postings"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._generation = None
+        self._seen = None
+        self._rows = None
+        self._postings = None
+        self._vehicles = OrderedDict()
+        self._searches = OrderedDict()
+
+    # ==================== READING ====================
+    def product_ids(self, vehicle_id, **filters):
+        """Ids of products fitting the vehicle, newest first (Product.Meta.ordering)"""
+        return [pk for _, pk in self.product_keys(vehicle_id, **filters)]
+
+    def product_keys(self, vehicle_id, category_ids=None, is_universal=None):
+        """Sort keys of active products fitting the vehicle, newest first"""
+        self.sync()
+        with self._lock:
+            rows = self._load_rows()
+            result = []
+            for product_id in self._vehicle_products(vehicle_id):
+                row = rows.get(product_id)
+                if row is None:
+                    continue
+                if is_universal is not None and row.is_universal != is_universal:
+                    continue
+                if category_ids is not None and row.category_id not in category_ids:
+                    continue
+                result.append(row.sort_key)
+        result.sort(reverse=True)
+        return result
+
+    def fits(self, product_id, vehicle_id):
+        """True if the product has a fitment row for the vehicle"""
+        self.sync()
+        with self._lock:
+            products = self._vehicle_products(vehicle_id)
+            i = bisect_left(products, product_id)
+            return i < len(products) and products[i] == product_id
+
+    def facet_search(self, selected, vehicle_id=None, min_price=None, max_price=None, product_ids=None,
+                     all_vehicles=False):
+        """
+        Active products matching the facet selections, plus facet counts.
+
+        ``selected`` maps facet names to the set of accepted values. Counts for
+        a facet ignore that facet's own selection, so the sidebar can offer the
+        alternatives. ``keys`` is None when nothing is filtered, the caller can
+        page through the table directly in that case. ``product_ids`` limits
+        the search to a set found elsewhere (specification ranges). With
+        ``all_vehicles`` the vehicle only feeds the fit counts, so the shopper
+        can switch back from the whole catalog to the parts that fit.
+        """
+        self.sync()
+        selected = {name: frozenset(values) for name, values in selected.items() if values}
+        if product_ids is not None:
+            product_ids = frozenset(product_ids)
+        memo_key = (tuple(sorted(selected.items())), vehicle_id, min_price, max_price, product_ids, all_vehicles)
+        with self._lock:
+            if memo_key in self._searches:
+                self._searches.move_to_end(memo_key)
+                return self._searches[memo_key]
+
+            rows = self._load_rows()
+            postings = self._postings
+            active = self._active_count()
+
+            matches = {}
+            for name, values in selected.items():
+                matches[name] = set().union(*(postings[name].get(value, ()) for value in values))
+            if min_price is not None or max_price is not None:
+                low = float('-inf') if min_price is None else min_price
+                high = float('inf') if max_price is None else max_price
+                matches['price_range'] = {
+                    pk for bucket, ids in postings['price'].items()
+                    if (bucket + 1 == len(PRICE_BUCKETS) or PRICE_BUCKETS[bucket + 1] >= low)
+                    and PRICE_BUCKETS[bucket] <= high
+                    for pk in ids if low <= rows[pk].price <= high
+                }
+            if product_ids is not None:
+                matches['product_ids'] = {pk for pk in product_ids if pk in rows}
+            fitting = None
+            if vehicle_id:
+                fitting = {pk for pk in self._vehicle_products(vehicle_id) if pk in rows}
+
+            def restrict(exclude=None, with_vehicle=not all_vehicles):
+                sets = [ids for name, ids in matches.items() if name != exclude]
+                if with_vehicle and fitting is not None:
+                    sets.append(fitting)
+                if not sets:
+                    return None
+                sets.sort(key=len)
+                return sets[0].intersection(*sets[1:])
+
+            counts = {}
+            for name, field in FACETS.items():
+                pool = restrict(exclude=name)
+                if pool is None:
+                    counts[name] = {value: len(ids) for value, ids in postings[name].items() if ids}
+                else:
+                    counts[name] = Counter(getattr(rows[pk], field) for pk in pool)
+            if fitting is not None:
+                pool = restrict(with_vehicle=False)
+                counts['fit'] = {
+                    'vehicle': len(fitting if pool is None else pool & fitting),
+                    'all': active if pool is None else len(pool),
+                }
+
+            result = restrict()
+            if result is None:
+                search = FacetResult(None, active, counts)
+            else:
+                keys = sorted((rows[pk].sort_key for pk in result), reverse=True)
+                search = FacetResult(keys, len(keys), counts)
+
+            self._searches[memo_key] = search
+            if len(self._searches) > MAX_CACHED_SEARCHES:
+                self._searches.popitem(last=False)
+            return search
+
+    def garage_products(self, vehicle_ids, match='any', category_ids=None):
+        """
+        Active products fitting any (or with match='all', every one) of the
+        vehicles, also grouped by the vehicle they fit.
+
+        Fitments of vehicles not in memory yet are read with one query for
+        all of them; the rest is set arithmetic on the per-vehicle arrays.
+        """
+        self.sync()
+        vehicle_ids = list(dict.fromkeys(vehicle_ids))
+        with self._lock:
+            rows = self._load_rows()
+            fitting = {}
+            for vehicle_id, products in self._many_vehicle_products(vehicle_ids).items():
+                fitting[vehicle_id] = {
+                    pk for pk in products
+                    if pk in rows and (category_ids is None or rows[pk].category_id in category_ids)
+                }
+            sets = sorted(fitting.values(), key=len)
+            if not sets:
+                matched = set()
+            elif match == 'all':
+                matched = sets[0].intersection(*sets[1:])
+            else:
+                matched = set().union(*sets)
+            keys = sorted((rows[pk].sort_key for pk in matched), reverse=True)
+            by_vehicle = {
+                vehicle_id: sorted((rows[pk].sort_key for pk in fitting[vehicle_id] & matched), reverse=True)
+                for vehicle_id in vehicle_ids
+            }
+        return GarageResult(keys, by_vehicle)
+
+    def _active_count(self):
+        return sum(len(ids) for ids in self._postings['in_stock'].values())
+
+    def _load_rows(self):
+        if self._rows is None:
+            from .models import Product
+
+            self._rows = {}
+            self._postings = {name: {} for name in FACETS}
+            queryset = Product.objects.filter(is_active=True).order_by().values_list(*PRODUCT_FIELDS)
+            for values in queryset.iterator(chunk_size=5000):
+                self._set_row(values[0], make_row(*values))
+        return self._rows
+
+    def _set_row(self, product_id, row):
+        self._drop_row(product_id)
+        self._rows[product_id] = row
+        for name, field in FACETS.items():
+            self._postings[name].setdefault(getattr(row, field), set()).add(product_id)
+
+    def _drop_row(self, product_id):
+        row = self._rows.pop(product_id, None)
+        if row is not None:
+            for name, field in FACETS.items():
+                self._postings[name][getattr(row, field)].discard(product_id)
+
+    def _vehicle_products(self, vehicle_id):
+        products = self._vehicles.get(vehicle_id)
+        if products is None:
+            from .models import ProductFitment
+
+            products = array('q', ProductFitment.objects.filter(vehicle_id=vehicle_id)
+                             .order_by('product_id').values_list('product_id', flat=True))
+            self._vehicles[vehicle_id] = products
+            if len(self._vehicles) > MAX_VEHICLES:
+                self._vehicles.popitem(last=False)
+        else:
+            self._vehicles.move_to_end(vehicle_id)
+        return products
+
+    def _many_vehicle_products(self, vehicle_ids):
+        """{vehicle id: product id array}, loading every missing vehicle in one query"""
+        missing = [vehicle_id for vehicle_id in vehicle_ids if vehicle_id not in self._vehicles]
+        loaded = {vehicle_id: array('q') for vehicle_id in missing}
+        if missing:
+            from .models import ProductFitment
+
+            rows = (ProductFitment.objects.filter(vehicle_id__in=missing)
+                    .order_by('vehicle_id', 'product_id').values_list('vehicle_id', 'product_id'))
+            for vehicle_id, product_id in rows.iterator(chunk_size=5000):
+                loaded[vehicle_id].append(product_id)
+            self._vehicles.update(loaded)
+            while len(self._vehicles) > MAX_VEHICLES:
+                self._vehicles.popitem(last=False)
+        return {
+            vehicle_id: loaded[vehicle_id] if vehicle_id in loaded else self._vehicle_products(vehicle_id)
+            for vehicle_id in vehicle_ids
+        }
+
+    # ==================== WRITING ====================
+    def product_saved(self, product):
+        row = product_row(product)
+        transaction.on_commit(lambda: self._apply_local(rows={product.pk: row}, products=[product.pk]))
+
+    def product_deleted(self, product_id):
+        transaction.on_commit(lambda: self._apply_local(rows={product_id: None}, products=[product_id]))
+
+    def fitment_added(self, product_id, vehicle_id):
+        transaction.on_commit(lambda: self._apply_local(added=[(product_id, vehicle_id)], vehicles=[vehicle_id]))
+
+    def fitment_removed(self, product_id, vehicle_id):
+        transaction.on_commit(lambda: self._apply_local(removed=[(product_id, vehicle_id)], vehicles=[vehicle_id]))
+
+    def invalidate(self, products=(), vehicles=()):
+        """Reload the given products and vehicles, for bulk writes that skip signals"""
+        products, vehicles = list(products), list(vehicles)
+        transaction.on_commit(lambda: self._apply_local(products=products, vehicles=vehicles, reload=True))
+
+    def invalidate_all(self):
+        """Make every process rebuild its index, for bulk writes too large to list"""
+        transaction.on_commit(self._bump_all)
+
+    def _bump_all(self):
+        # A generation with no change recorded under it cannot be replayed, so sync() resets
+        from .models import CatalogIndexGeneration
+
+        generation = CatalogIndexGeneration.next()
+        cache.set(GENERATION_KEY, generation, None)
+        self.reset(generation)
+
+    def _apply_local(self, rows=None, added=(), removed=(), products=(), vehicles=(), reload=False):
+        with self._lock:
+            self._searches.clear()
+            if reload:
+                self._replay(products, vehicles)
+            if rows and self._rows is not None:
+                for product_id, row in rows.items():
+                    if row is None:
+                        self._drop_row(product_id)
+                    else:
+                        self._set_row(product_id, row)
+            for product_id, vehicle_id in added:
+                vehicle_products = self._vehicles.get(vehicle_id)
+                if vehicle_products is not None:
+                    i = bisect_left(vehicle_products, product_id)
+                    if i == len(vehicle_products) or vehicle_products[i] != product_id:
+                        insort(vehicle_products, product_id)
+            for product_id, vehicle_id in removed:
+                vehicle_products = self._vehicles.get(vehicle_id)
+                if vehicle_products is not None:
+                    i = bisect_left(vehicle_products, product_id)
+                    if i < len(vehicle_products) and vehicle_products[i] == product_id:
+                        del vehicle_products[i]
+            generation = self._publish(products, vehicles)
+            if self._generation == generation - 1:
+                self._generation = generation
+
+    # ==================== CROSS-PROCESS SYNC ====================
+    def _publish(self, products, vehicles):
+        from .models import CatalogIndexGeneration
+
+        generation = CatalogIndexGeneration.next()
+        cache.set(CHANGE_KEY.format(generation), (list(products), list(vehicles)), CHANGE_TIMEOUT)
+        # The hint goes last, a worker that sees it finds the change stored
+        cache.set(GENERATION_KEY, generation, None)
+        return generation
+
+    def sync(self):
+        """Replay changes other processes published since the last call"""
+        hint = cache.get(GENERATION_KEY)
+        with self._lock:
+            if self._generation is not None and hint == self._seen:
+                return
+            from .models import CatalogIndexGeneration
+
+            # Read after the hint, so the counter covers the change behind it
+            generation = CatalogIndexGeneration.current()
+            self._seen = hint
+            if self._generation is None or generation < self._generation:
+                self.reset(generation)
+                return
+            missed = generation - self._generation
+            if not missed:
+                return
+            keys = [CHANGE_KEY.format(g) for g in range(self._generation + 1, generation + 1)]
+            changes = cache.get_many(keys) if missed <= MAX_REPLAY else {}
+            if len(changes) != missed:
+                self.reset(generation)
+                return
+            products, vehicles = set(), set()
+            for changed_products, changed_vehicles in changes.values():
+                products.update(changed_products)
+                vehicles.update(changed_vehicles)
+            self._replay(products, vehicles)
+            self._searches.clear()
+            self._generation = generation
+
+    def _replay(self, products, vehicles):
+        for vehicle_id in vehicles:
+            self._vehicles.pop(vehicle_id, None)
+        if products and self._rows is not None:
+            from .models import Product
+
+            products = list(products)
+            for product_id in products:
+                self._drop_row(product_id)
+            replayed = Product.objects.filter(pk__in=products, is_active=True).order_by()
+            for values in replayed.values_list(*PRODUCT_FIELDS):
+                self._set_row(values[0], make_row(*values))
+
+    def reset(self, generation=None):
+        """Drop everything, it is reloaded lazily on the next read"""
+        with self._lock:
+            self._generation = generation
+            self._rows = None
+            self._postings = None
+            self._vehicles.clear()
+            self._searches.clear()
+
+
+catalog_index = CatalogIndex()
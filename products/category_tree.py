@@ -0,0 +1,69 @@
+"""
+Prebuilt category tree for navigation and subtree filters.
+
+The tree is built from one query ordered by materialized path and cached;
+Category signals drop it so the next request rebuilds it.
+"""
+from django.core.cache import cache
+
+TREE_KEY = 'category_tree'
+TREE_TIMEOUT = 60 * 60
+
+
+class CategoryTree:
+    """Categories by id with their children and subtree ids"""
+
+    def __init__(self, rows):
+        self.nodes = {}
+        self.roots = []
+        for pk, parent_id, name, slug, path, depth, product_count in rows:
+            node = {
+                'id': pk,
+                'parent_id': parent_id,
+                'name': name,
+                'slug': slug,
+                'path': path,
+                'depth': depth,
+                'product_count': product_count,
+                'children': [],
+            }
+            self.nodes[pk] = node
+        for node in sorted(self.nodes.values(), key=lambda node: node['name']):
+            parent = self.nodes.get(node['parent_id'])
+            (parent['children'] if parent else self.roots).append(node)
+        self.by_slug = {node['slug']: node for node in self.nodes.values()}
+
+    def descendant_ids(self, category_id):
+        """The category's id plus every id below it"""
+        ids = []
+        stack = [self.nodes[category_id]] if category_id in self.nodes else []
+        while stack:
+            node = stack.pop()
+            ids.append(node['id'])
+            stack.extend(node['children'])
+        return ids
+
+    def walk(self):
+        """Nodes depth first, in menu order"""
+        stack = list(reversed(self.roots))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node['children']))
+
+
+def get_category_tree():
+    tree = cache.get(TREE_KEY)
+    if tree is None:
+        from .models import Category
+
+        rows = Category.objects.order_by('path').values_list(
+            'pk', 'parent_id', 'name', 'slug', 'path', 'depth', 'product_count',
+        )
+        tree = CategoryTree(list(rows))
+        cache.set(TREE_KEY, tree, TREE_TIMEOUT)
+    return tree
+
+
+def clear_category_tree():
+    cache.delete(TREE_KEY)
@@ -0,0 +1,66 @@
+"""
+Stored product counts for categories.
+
+Category.product_count is the number of active products in the category
+and everything below it, so navigation can show it without a COUNT over
+the catalog. Product signals take one off the old category's ancestors and
+add one to the new category's with an F() UPDATE each; category moves and
+bulk imports recount everything with refresh_category_counts(): one GROUP BY
+of the active products per category, rolled up the paths in Python, and an
+UPDATE for just the categories whose count changed.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from .category_tree import clear_category_tree, get_category_tree
+
+
+def _ancestor_ids(category_id):
+    node = get_category_tree().nodes.get(category_id)
+    if node is None:
+        return [category_id]
+    return [int(part) for part in node['path'].split('/') if part]
+
+
+def move_product(old, new):
+    """Move one product's count from old to new, each (category id, is_active) or None"""
+    old = old if old and old[1] else None
+    new = new if new and new[1] else None
+    if old == new:
+        return
+    from .models import Category
+
+    if old:
+        Category.objects.filter(pk__in=_ancestor_ids(old[0])).update(product_count=F('product_count') - 1)
+    if new:
+        Category.objects.filter(pk__in=_ancestor_ids(new[0])).update(product_count=F('product_count') + 1)
+    # The navigation tree shows the counts
+    transaction.on_commit(clear_category_tree)
+
+
+def refresh_category_counts():
+    """Recount every category, returns how many counts changed"""
+    from .models import Category, Product
+
+    direct = (
+        Product.objects.filter(is_active=True).order_by()
+        .values_list('category_id').annotate(count=Count('pk'))
+    )
+    categories = list(Category.objects.only('path', 'product_count'))
+    paths = {category.pk: category.path for category in categories}
+    totals = Counter()
+    for category_id, count in direct:
+        for ancestor_id in paths[category_id].split('/'):
+            if ancestor_id:
+                totals[int(ancestor_id)] += count
+
+    changed = []
+    for category in categories:
+        if category.product_count != totals[category.pk]:
+            category.product_count = totals[category.pk]
+            changed.append(category)
+    Category.objects.bulk_update(changed, ['product_count'], batch_size=500)
+    transaction.on_commit(clear_category_tree)
+    return len(changed)
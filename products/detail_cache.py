@@ -0,0 +1,89 @@
+"""
+Cache for the vehicle-independent part of the product detail page.
+
+Two layers: a slug pointer holding (product id, last_updated), and the page
+data itself (product, specifications, documents, fitment summary) keyed by id
+and last_updated. Signals drop the pointer and touch last_updated whenever the
+product or one of its children changes, or a category, manufacturer, make,
+model or vehicle whose name the page shows, so a stale entry is never read
+again and simply expires. Whether the part fits the shopper's vehicle is not cached
+here, the view asks the catalog index for that.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+
+POINTER_KEY = 'product_detail:slug:{}'
+DETAIL_KEY = 'product_detail:{}:{}'
+TIMEOUT = 60 * 60
+
+
+def _version(last_updated):
+    return int(last_updated.timestamp() * 1_000_000)
+
+
+def _build(product):
+    fitments = [
+        {
+            'year': fitment.vehicle.year,
+            'make': fitment.vehicle.model.make.name,
+            'model': fitment.vehicle.model.name,
+            'trim': fitment.vehicle.trim,
+            'position': fitment.position,
+            'notes': fitment.fitment_notes,
+        }
+        for fitment in product.fitments.select_related('vehicle__model__make').order_by(
+            'vehicle__model__make__name', 'vehicle__model__name', '-vehicle__year', 'vehicle__trim'
+        )
+    ]
+    return {
+        'product': product,
+        'specifications': list(product.specifications.all()),
+        'documents': list(product.documents.all()),
+        'fitments': fitments,
+        'version': _version(product.last_updated),
+    }
+
+
+def get_product_detail(slug):
+    """Cached detail page data for an active product, or None"""
+    from .models import Product
+
+    pointer = cache.get(POINTER_KEY.format(slug))
+    if pointer is not None:
+        detail = cache.get(DETAIL_KEY.format(*pointer))
+        if detail is not None and detail['product'].slug == slug:
+            return detail
+
+    product = (
+        Product.objects.filter(slug=slug, is_active=True)
+        .select_related('category', 'manufacturer')
+        .first()
+    )
+    if product is None:
+        return None
+    pointer = (product.pk, _version(product.last_updated))
+    detail = _build(product)
+    cache.set_many({
+        POINTER_KEY.format(slug): pointer,
+        DETAIL_KEY.format(*pointer): detail,
+    }, TIMEOUT)
+    return detail
+
+
+def forget_slug(*slugs):
+    cache.delete_many([POINTER_KEY.format(slug) for slug in slugs if slug])
+
+
+def invalidate_product(product_id):
+    """Forget a product's detail page after one of its children changed"""
+    invalidate_products([product_id])
+
+
+def invalidate_products(product_ids):
+    """Bulk form of invalidate_product, for writes that skip the signals"""
+    from .models import Product
+
+    products = Product.objects.filter(pk__in=product_ids)
+    # Touching last_updated retires the data key, whichever slug points at it
+    products.update(last_updated=timezone.now())
+    forget_slug(*products.values_list('slug', flat=True))
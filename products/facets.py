@@ -0,0 +1,228 @@
+"""
+Faceted navigation for the catalog listing.
+
+Turns the listing query string into facet selections for the catalog index
+and its counts back into sidebar groups. Category names and subtrees come
+from the cached category tree and manufacturer names from a small cached
+label table, so a fully faceted page only queries the database for the
+products on the page.
+
+Specification ranges (``spec=diameter:300:330:mm``) are the exception: each
+one is an indexed range query on the typed specification columns, and the
+matching ids restrict the index search.
+"""
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+
+from .catalog_index import PRICE_BUCKETS
+from .category_tree import get_category_tree
+from .models import Manufacturer, Product, ProductSpecification
+from .units import normalize_attribute, to_base
+
+LABELS_KEY = 'facet_labels'
+LABELS_TIMEOUT = 60 * 60
+
+FACET_TITLES = [
+    ('category', 'Categories'),
+    ('manufacturer', 'Manufacturer'),
+    ('product_type', 'Type'),
+    ('price', 'Price'),
+    ('in_stock', 'Availability'),
+]
+
+# Cursor parameters are dropped whenever the filters change
+PAGE_PARAMS = ('after', 'before')
+
+SpecFilter = namedtuple('SpecFilter', ['param', 'attribute', 'low', 'high', 'unit'])
+
+
+def price_label(bucket):
+    low = PRICE_BUCKETS[bucket]
+    if bucket + 1 == len(PRICE_BUCKETS):
+        return f"${low}+"
+    return f"${low} - ${PRICE_BUCKETS[bucket + 1]}"
+
+
+def get_labels():
+    """Slug and name lookups for manufacturers"""
+    labels = cache.get(LABELS_KEY)
+    if labels is None:
+        labels = {
+            'manufacturer': {pk: (slug, name) for pk, slug, name in Manufacturer.objects.values_list('pk', 'slug', 'name')},
+        }
+        cache.set(LABELS_KEY, labels, LABELS_TIMEOUT)
+    return labels
+
+
+def clear_labels():
+    cache.delete(LABELS_KEY)
+
+
+def _decimal(value):
+    try:
+        return float(Decimal(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+
+
+def parse_spec_filter(param):
+    """'diameter:300:330:mm' -> SpecFilter, None if malformed (either bound may be empty)"""
+    parts = param.split(':')
+    if not 2 <= len(parts) <= 4:
+        return None
+    name, low, high, unit = (parts + ['', ''])[:4]
+    low, high = _decimal(low), _decimal(high)
+    if (low is None and high is None) or to_base(0, unit) is None:
+        return None
+    return SpecFilter(param, normalize_attribute(name), low, high, unit)
+
+
+class FacetQuery:
+    """Facet selections parsed from the listing query string"""
+
+    def __init__(self, params, labels=None, tree=None):
+        self.params = params
+        self.labels = labels or get_labels()
+        self.tree = tree or get_category_tree()
+        self.selected = {}
+
+        # A category selects its whole subtree
+        slugs = set(params.getlist('category'))
+        self.category_nodes = [self.tree.by_slug[slug] for slug in slugs if slug in self.tree.by_slug]
+        self.unknown = len(self.category_nodes) < len(slugs)
+        self.selected['category'] = {
+            pk for node in self.category_nodes for pk in self.tree.descendant_ids(node['id'])
+        }
+
+        slugs = set(params.getlist('manufacturer'))
+        self.selected['manufacturer'] = {pk for pk, (slug, _) in self.labels['manufacturer'].items() if slug in slugs}
+        self.unknown = self.unknown or len(self.selected['manufacturer']) < len(slugs)
+
+        types = dict(Product.PRODUCT_TYPE_CHOICES)
+        self.selected['product_type'] = {value for value in params.getlist('type') if value in types}
+        self.selected['price'] = {
+            int(value) for value in params.getlist('price')
+            if value.isdigit() and int(value) < len(PRICE_BUCKETS)
+        }
+        self.selected['in_stock'] = {True} if params.get('in_stock') else set()
+
+        self.min_price = _decimal(params.get('min_price'))
+        self.max_price = _decimal(params.get('max_price'))
+        self.all_vehicles = params.get('fit') == 'all'
+        self.specs = [spec for spec in map(parse_spec_filter, params.getlist('spec')) if spec]
+
+    @property
+    def categories(self):
+        return [node['name'] for node in self.category_nodes]
+
+    def spec_product_ids(self):
+        """Ids of products inside every spec range, None when there are none"""
+        product_ids = None
+        for spec in self.specs:
+            rows = ProductSpecification.objects.filter(attribute=spec.attribute)
+            if spec.low is not None:
+                rows = rows.filter(numeric_value__gte=to_base(spec.low, spec.unit)[0])
+            if spec.high is not None:
+                rows = rows.filter(numeric_value__lte=to_base(spec.high, spec.unit)[0])
+            if spec.unit:
+                # Without a unit the bounds are taken to be in the attribute's base unit
+                rows = rows.filter(normalized_unit=to_base(0, spec.unit)[1])
+            ids = set(rows.values_list('product_id', flat=True))
+            product_ids = ids if product_ids is None else product_ids & ids
+        return product_ids
+
+    def spec_options(self):
+        """Active spec ranges with links that remove them"""
+        options = []
+        for spec in self.specs:
+            low = '' if spec.low is None else f"{spec.low:g}"
+            high = '' if spec.high is None else f"{spec.high:g}"
+            label = f"{spec.attribute.replace('-', ' ').capitalize()} {low}–{high} {spec.unit}".strip()
+            options.append({'label': label, 'selected': True, 'url': self._url('spec', spec.param, True)})
+        return options
+
+    def other_params(self, *exclude):
+        """(name, value) pairs of the current filters, minus ``exclude`` and the cursor"""
+        return [
+            (name, value)
+            for name, values in self.params.lists()
+            if name not in exclude and name not in PAGE_PARAMS
+            for value in values
+        ]
+
+    def _url(self, param, value, selected):
+        params = self.params.copy()
+        for name in PAGE_PARAMS:
+            params.pop(name, None)
+        values = [v for v in params.getlist(param) if v != value]
+        if not selected:
+            values.append(value)
+        params.setlist(param, values)
+        return f"?{params.urlencode()}"
+
+    def _cleared_url(self, param):
+        params = self.params.copy()
+        for name in (param, *PAGE_PARAMS):
+            params.pop(name, None)
+        return f"?{params.urlencode()}"
+
+    def _option(self, param, value, label, count, selected):
+        return {
+            'label': label,
+            'count': count,
+            'selected': selected,
+            'url': self._url(param, str(value), selected),
+        }
+
+    def _category_options(self, counts):
+        """Categories in menu order, each counting its whole subtree"""
+        selected = {node['id'] for node in self.category_nodes}
+        options = [{
+            'label': 'All Categories',
+            'count': sum(counts.values()),
+            'selected': not selected,
+            'url': self._cleared_url('category'),
+        }]
+        for node in self.tree.walk():
+            count = sum(counts.get(pk, 0) for pk in self.tree.descendant_ids(node['id']))
+            is_selected = node['id'] in selected
+            if count or is_selected:
+                option = self._option('category', node['slug'], node['name'], count, is_selected)
+                option['depth'] = node['depth']
+                options.append(option)
+        return options
+
+    def groups(self, counts):
+        """Sidebar facet groups with counts and toggle links"""
+        types = dict(Product.PRODUCT_TYPE_CHOICES)
+        groups = []
+        for name, title in FACET_TITLES:
+            if name == 'category':
+                options = self._category_options(counts[name])
+                if len(options) > 1:
+                    groups.append({'name': name, 'title': title, 'options': options})
+                continue
+            options = []
+            selected = self.selected[name]
+            for value, count in counts[name].items():
+                is_selected = value in selected
+                if not count and not is_selected:
+                    continue
+                if name == 'manufacturer':
+                    if value not in self.labels[name]:
+                        continue
+                    slug, label = self.labels[name][value]
+                    options.append((label, self._option(name, slug, label, count, is_selected)))
+                elif name == 'product_type':
+                    label = types.get(value, value)
+                    options.append((label, self._option('type', value, label, count, is_selected)))
+                elif name == 'price':
+                    options.append((value, self._option('price', value, price_label(value), count, is_selected)))
+                elif name == 'in_stock' and value:
+                    options.append((value, self._option('in_stock', 1, 'In stock', count, is_selected)))
+            if options:
+                options.sort(key=lambda option: option[0])
+                groups.append({'name': name, 'title': title, 'options': [option for _, option in options]})
+        return groups
@@ -0,0 +1,55 @@
+"""
+Reading supplier feeds for the import commands.
+
+Feeds are CSV files with a header row or JSON Lines (one object per line),
+read lazily so a file of any size is processed in constant memory.
+"""
+import csv
+import json
+import sys
+
+from django.core.management.base import CommandError
+
+
+class RowError(ValueError):
+    """A feed row that cannot be imported, it is reported and skipped"""
+
+
+def feed_format(path):
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_feed(path, fmt=None, columns=('sku',)):
+    """
+    (line number, row dict) for each record of a CSV or JSONL feed, '-' reads stdin.
+
+    A CSV feed must name ``columns`` in its header row, otherwise every row
+    would fail (or import nothing) for the same reason. A JSONL line that is
+    not a JSON object comes as a RowError in place of the row, for the caller
+    to report and skip like any other bad row.
+    """
+    fmt = fmt or feed_format(path)
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(stream)
+            missing = [name for name in columns if name not in (reader.fieldnames or ())]
+            if missing:
+                raise CommandError(f"CSV feed needs a header row with {', '.join(map(repr, missing))} columns")
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line, text in enumerate(stream, 1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except json.JSONDecodeError as exc:
+                    yield line, RowError(f'invalid JSON ({exc})')
+                    continue
+                if not isinstance(row, dict):
+                    row = RowError(f'expected a JSON object, got {type(row).__name__}')
+                yield line, row
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
@@ -0,0 +1,55 @@
+"""
+Part-number cross-reference lookups for the parts counter.
+
+Part numbers are compared in a normalized form (no dashes, spaces or other
+punctuation, upper case), stored next to the raw values on Product in indexed
+columns. Products that share an OEM number belong to one InterchangeGroup, so
+"everything interchangeable with OEM 12345-ABC" is one indexed query.
+"""
+import re
+
+from django.db.models import Q
+
+NON_ALNUM_RE = re.compile(r'[^0-9A-Za-z]')
+
+PREFIX_LIMIT = 20
+
+
+def normalize_part_number(value):
+    """'12345-abc ' -> '12345ABC'"""
+    return NON_ALNUM_RE.sub('', value or '').upper()
+
+
+def interchangeable_products(number):
+    """Products interchangeable with an OEM or aftermarket part number"""
+    from .models import InterchangeGroup, Product
+
+    key = normalize_part_number(number)
+    if not key:
+        return Product.objects.none()
+    oem_group = InterchangeGroup.objects.filter(oem_number=key).values('pk')
+    aftermarket_group = Product.objects.filter(part_number_key=key).exclude(interchange_group=None)
+    return Product.objects.filter(
+        Q(interchange_group__in=oem_group)
+        | Q(interchange_group__in=aftermarket_group.values('interchange_group'))
+        | Q(part_number_key=key)
+    ).select_related('manufacturer', 'interchange_group')
+
+
+def _prefix_range(field, key):
+    # A range on the normalized column can use its index, LIKE on SQLite cannot
+    return Q(**{f'{field}__gte': key, f'{field}__lt': key + '~'})
+
+
+def products_by_prefix(prefix, limit=PREFIX_LIMIT):
+    """Products whose own or OEM part number starts with the prefix"""
+    from .models import Product
+
+    key = normalize_part_number(prefix)
+    if not key:
+        return Product.objects.none()
+    return (
+        Product.objects.filter(_prefix_range('part_number_key', key) | _prefix_range('oem_part_number_key', key))
+        .select_related('manufacturer')
+        .order_by('part_number_key')[:limit]
+    )
@@ -0,0 +1,75 @@
+# products/management/commands/benchmark_fitment_index.py
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from products.catalog_index import catalog_index
+from products.models import Category, Product, ProductFitment
+
+
+class Command(BaseCommand):
+    help = 'Compares product_list vehicle filtering through the ORM with the catalog index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=50, help='Number of vehicles to sample')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per vehicle')
+        parser.add_argument('--category', help='Also filter by this category slug')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        vehicle_ids = list(
+            ProductFitment.objects.order_by().values_list('vehicle_id', flat=True).distinct()
+        )
+        if not vehicle_ids:
+            self.stdout.write(self.style.ERROR("No fitments found! Run 'seed_products' first."))
+            return
+
+        random.Random(options['seed']).shuffle(vehicle_ids)
+        vehicle_ids = vehicle_ids[:options['vehicles']]
+        repeat = options['repeat']
+
+        category = None
+        if options['category']:
+            category = Category.objects.get(slug=options['category'])
+
+        def orm_path(vehicle_id):
+            products = Product.objects.filter(is_active=True)
+            if category:
+                products = products.filter(category=category)
+            return list(products.filter(fitments__vehicle_id=vehicle_id).distinct().values_list('id', flat=True))
+
+        def index_path(vehicle_id):
+            return catalog_index.product_ids(vehicle_id, category_ids={category.id} if category else None)
+
+        # Cold index: first lookup per vehicle loads its fitment array
+        catalog_index.reset()
+        start = time.perf_counter()
+        for vehicle_id in vehicle_ids:
+            index_path(vehicle_id)
+        cold = time.perf_counter() - start
+
+        results = {}
+        for name, path in (('orm', orm_path), ('index', index_path)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                for vehicle_id in vehicle_ids:
+                    results[name, vehicle_id] = path(vehicle_id)
+            results[name] = time.perf_counter() - start
+
+        mismatches = sum(
+            1 for vehicle_id in vehicle_ids
+            if results['orm', vehicle_id] != results['index', vehicle_id]
+        )
+        lookups = len(vehicle_ids) * repeat
+
+        self.stdout.write(f"Vehicles: {len(vehicle_ids)}, runs per vehicle: {repeat}")
+        self.stdout.write(f"ORM (JOIN + DISTINCT): {results['orm'] / lookups * 1000:.3f} ms/lookup")
+        self.stdout.write(f"Index (cold load):     {cold / len(vehicle_ids) * 1000:.3f} ms/lookup")
+        self.stdout.write(f"Index (warm):          {results['index'] / lookups * 1000:.3f} ms/lookup")
+        if results['index']:
+            self.stdout.write(f"Speedup (warm):        {results['orm'] / results['index']:.1f}x")
+
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f'{mismatches} vehicles returned different results!'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Index results match the ORM path.'))
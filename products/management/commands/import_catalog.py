@@ -0,0 +1,317 @@
+# products/management/commands/import_catalog.py
+import json
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from cars.bulk import delete_rows
+from products import search
+from products.catalog_index import catalog_index
+from products.counters import refresh_category_counts
+from products.detail_cache import forget_slug
+from products.feeds import RowError, read_feed
+from products.interchange import normalize_part_number
+from products.models import (
+    INTERCHANGE_KEY_FIELDS, Category, InterchangeGroup, Manufacturer, Product, ProductSpecification,
+)
+
+# Feed column -> the Product fields it sets. A new product gets defaults for
+# the columns its row leaves out, an existing one keeps what it has
+COLUMN_FIELDS = {
+    'title': ['title'],
+    'description': ['description'],
+    'unit_price': ['unit_price'],
+    'cost_price': ['cost_price'],
+    'inventory': ['inventory'],
+    'category': ['category'],
+    'manufacturer': ['manufacturer'],
+    'part_number': ['part_number', 'part_number_key'],
+    'oem_part_number': ['oem_part_number', 'oem_part_number_key'],
+    'product_type': ['product_type'],
+    'is_universal': ['is_universal'],
+    'warranty_months': ['warranty_months'],
+    'is_active': ['is_active'],
+}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+PRODUCT_SLUG_LENGTH = Product._meta.get_field('slug').max_length
+MANUFACTURER_SLUG_LENGTH = Manufacturer._meta.get_field('slug').max_length
+
+
+def _numbered(slug, number, max_length):
+    """slug-2, slug-3... still within max_length; slugify() maps different names to one slug"""
+    suffix = f'-{number}'
+    return slug[:max_length - len(suffix)] + suffix
+
+
+def _decimal(row, name, required=False):
+    value = row.get(name)
+    if value in (None, ''):
+        if required:
+            raise RowError(f'{name} is required')
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f'{name} is not a number: {value!r}')
+
+
+def _int(row, name, default):
+    value = row.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{name} is not a whole number: {value!r}')
+
+
+def _bool(row, name, default):
+    value = row.get(name)
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+class Command(BaseCommand):
+    help = 'Imports or updates products from a CSV or JSON Lines supplier feed, matched on SKU'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows written per transaction (default: 1000)')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        self.verbosity = options['verbosity']
+
+        # ===== LOOKUP MAPS (loaded once) =====
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        names = {}
+        for name, pk in Category.objects.values_list('name', 'pk'):
+            names.setdefault(name.lower(), []).append(pk)
+        # A name only resolves when it is unambiguous
+        self.category_names = {name: pks[0] for name, pks in names.items() if len(pks) == 1}
+        self.manufacturers = {}
+        for pk, name, slug in Manufacturer.objects.values_list('pk', 'name', 'slug'):
+            self.manufacturers[name.lower()] = pk
+            self.manufacturers[slug] = pk
+        self.types = dict(Product.PRODUCT_TYPE_CHOICES)
+
+        self.created = self.updated = self.skipped = 0
+        start = time.perf_counter()
+        batch = []
+        for line, row in read_feed(options['path'], options['format']):
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                batch.append(self._build(row))
+            except RowError as exc:
+                self.skipped += 1
+                self.stderr.write(f'Line {line}: {exc}')
+                continue
+            if len(batch) >= batch_size:
+                self._write(batch)
+                batch = []
+                self._progress(start)
+        if batch:
+            self._write(batch)
+        if self.created or self.updated:
+            # The bulk upserts skip the Product signals that keep the category counters
+            refresh_category_counts()
+
+        elapsed = time.perf_counter() - start
+        total = self.created + self.updated
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} products ({self.created} new, {self.updated} updated, '
+            f'{self.skipped} skipped) in {elapsed:.1f}s, {total / elapsed if elapsed else 0:.0f} rows/s'
+        ))
+
+    # ==================== READING ====================
+    def _build(self, row):
+        """Unsaved Product, its specifications (if given) and the fields the row sets"""
+        sku = str(row.get('sku') or '').strip()
+        if not sku:
+            raise RowError('sku is required')
+        title = str(row.get('title') or '').strip()
+        if not title:
+            raise RowError('title is required')
+
+        category = str(row.get('category') or '').strip()
+        category_id = self.categories.get(category) or self.category_names.get(category.lower())
+        if category_id is None:
+            raise RowError(f'unknown category {category!r}')
+
+        product_type = row.get('product_type') or 'AFT'
+        if product_type not in self.types:
+            raise RowError(f'unknown product type {product_type!r}')
+
+        product = Product(
+            sku=sku,
+            title=title,
+            slug=slugify(f'{title} {sku}')[:PRODUCT_SLUG_LENGTH],
+            description=row.get('description') or '',
+            unit_price=_decimal(row, 'unit_price', required=True),
+            cost_price=_decimal(row, 'cost_price'),
+            inventory=_int(row, 'inventory', 0),
+            category_id=category_id,
+            manufacturer_id=self._manufacturer(row.get('manufacturer')),
+            part_number=row.get('part_number') or '',
+            oem_part_number=row.get('oem_part_number') or '',
+            product_type=product_type,
+            is_universal=_bool(row, 'is_universal', False),
+            warranty_months=_int(row, 'warranty_months', 12),
+            is_active=_bool(row, 'is_active', True),
+        )
+        # bulk_create skips save(), so fill in what it would have
+        product.part_number_key = normalize_part_number(product.part_number)
+        product.oem_part_number_key = normalize_part_number(product.oem_part_number)
+        fields = [name for column, names in COLUMN_FIELDS.items() if column in row for name in names]
+        return product, self._specifications(row.get('specifications')), fields
+
+    def _manufacturer(self, name):
+        name = str(name or '').strip()
+        if not name:
+            return None
+        pk = self.manufacturers.get(name.lower())
+        if pk is None:
+            base = slugify(name)[:MANUFACTURER_SLUG_LENGTH] or 'manufacturer'
+            slug, number = base, 1
+            while Manufacturer.objects.filter(slug=slug).exists():
+                number += 1
+                slug = _numbered(base, number, MANUFACTURER_SLUG_LENGTH)
+            manufacturer, _ = Manufacturer.objects.get_or_create(name=name, defaults={'slug': slug})
+            pk = self.manufacturers[name.lower()] = manufacturer.pk
+        return pk
+
+    def _specifications(self, value):
+        """List of (name, value, unit), or None when the row does not mention specifications"""
+        if value in (None, ''):
+            return None
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError:
+                raise RowError('specifications must be JSON')
+        if isinstance(value, dict):
+            return [(str(name), str(spec), '') for name, spec in value.items()]
+        try:
+            return [(spec['name'], str(spec['value']), spec.get('unit') or '') for spec in value]
+        except (KeyError, TypeError):
+            raise RowError('specifications must be a list of {name, value, unit} objects')
+
+    # ==================== WRITING ====================
+    def _write(self, batch):
+        # The last row wins if a SKU repeats within a batch
+        batch = list({product.sku: (product, specs, fields) for product, specs, fields in batch}.values())
+        skus = [product.sku for product, _, _ in batch]
+
+        with transaction.atomic():
+            existing = {
+                product.sku: product
+                for product in Product.objects.filter(sku__in=skus).only('pk', 'sku', 'slug', *INTERCHANGE_KEY_FIELDS)
+            }
+            now = timezone.now()
+            new = [product for product, _, _ in batch if product.sku not in existing]
+            self._assign_groups(new)
+            self._assign_slugs(new)
+            for product in new:
+                product.last_updated = now
+            Product.objects.bulk_create(new)
+            self._update(existing, batch, now)
+            ids = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'pk'))
+
+            with_specs = {ids[product.sku]: specs for product, specs, _ in batch if specs is not None}
+            if with_specs:
+                # Plain DELETEs, the per-row signals would reindex each product once per spec
+                delete_rows(ProductSpecification.objects.filter(product_id__in=with_specs))
+                rows = [
+                    ProductSpecification(product_id=product_id, name=name, value=value, unit=unit)
+                    for product_id, specs in with_specs.items()
+                    for name, value, unit in specs
+                ]
+                for spec in rows:
+                    spec.normalize()
+                ProductSpecification.objects.bulk_create(rows)
+
+            # Bulk writes skip the model signals
+            product_ids = list(ids.values())
+            catalog_index.invalidate(products=product_ids)
+            transaction.on_commit(lambda: search.index_products(product_ids))
+            transaction.on_commit(lambda: forget_slug(*(product.slug for product in existing.values())))
+
+        self.updated += len(existing)
+        self.created += len(new)
+
+    def _update(self, existing, batch, now):
+        """Copy the columns each row has onto its stored product, one bulk_update per set of columns"""
+        by_fields = {}
+        for built, _, fields in batch:
+            product = existing.get(built.sku)
+            if product is None:
+                continue
+            for name in fields:
+                attname = Product._meta.get_field(name).attname
+                setattr(product, attname, getattr(built, attname))
+            fields = [*fields, 'last_updated']
+            product.last_updated = now
+            # Like Product.save(), the group only follows a changed key so one picked by hand stays
+            if product.interchange_key != product._stored_interchange_key:
+                fields.append('interchange_group')
+            by_fields.setdefault(tuple(fields), []).append(product)
+
+        changed = [product for fields, products in by_fields.items() if 'interchange_group' in fields
+                   for product in products]
+        for product in changed:
+            product.interchange_group_id = None
+        self._assign_groups(changed)
+        for fields, products in by_fields.items():
+            Product.objects.bulk_update(products, fields)
+
+    def _assign_slugs(self, products):
+        """Number the slugs of new products that another product (or row of the batch) already has"""
+        claimed = set()
+        pending = [(product, product.slug) for product in products]
+        number = 1
+        while pending:
+            taken = set(
+                Product.objects.filter(slug__in=[product.slug for product, _ in pending])
+                .values_list('slug', flat=True)
+            )
+            clashing = []
+            for product, base in pending:
+                if product.slug in taken or product.slug in claimed:
+                    clashing.append((product, base))
+                else:
+                    claimed.add(product.slug)
+            number += 1
+            for product, base in clashing:
+                product.slug = _numbered(base, number, PRODUCT_SLUG_LENGTH)
+            pending = clashing
+
+    def _assign_groups(self, products):
+        """Interchange group ids for the batch, creating missing groups in one insert"""
+        keys = {product.interchange_key for product in products} - {''}
+        if not keys:
+            return
+        InterchangeGroup.objects.bulk_create(
+            [InterchangeGroup(oem_number=key) for key in keys], ignore_conflicts=True,
+        )
+        groups = dict(InterchangeGroup.objects.filter(oem_number__in=keys).values_list('oem_number', 'pk'))
+        for product in products:
+            product.interchange_group_id = groups.get(product.interchange_key)
+
+    def _progress(self, start):
+        if self.verbosity > 1:
+            total = self.created + self.updated
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{total} rows, {total / elapsed:.0f} rows/s')
@@ -0,0 +1,173 @@
+# products/management/commands/import_fitments.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cars.bulk import delete_rows
+from products.catalog_index import catalog_index
+from products.detail_cache import invalidate_products
+from products.feeds import RowError, read_feed
+from products.models import Product, ProductFitment
+from vehicles.counters import refresh_parts_counts
+from vehicles.models import Vehicle
+
+
+def _year(row, name):
+    value = row.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{name} is not a year: {value!r}')
+
+
+class Command(BaseCommand):
+    help = ('Loads vehicle fitments from a CSV or JSON Lines feed (sku, make, model, year range, '
+            'optional engine/trim). The feed replaces the fitments of every product it mentions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Products synced per transaction (default: 500)')
+        parser.add_argument('--keep-existing', action='store_true',
+                            help='Only add and update fitments, never delete ones missing from the feed')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        self.keep_existing = options['keep_existing']
+        self.verbosity = options['verbosity']
+
+        # ===== LOOKUP TABLES (loaded once) =====
+        self.products = dict(Product.objects.values_list('sku', 'pk'))
+        # (make, model) -> [(year, trim, engine, vehicle id)], names lower-cased
+        self.vehicles = {}
+        rows = Vehicle.objects.values_list(
+            'model__make__name', 'model__make__slug', 'model__name', 'model__slug',
+            'year', 'trim', 'engine', 'pk',
+        )
+        for make, make_slug, model, model_slug, year, trim, engine, pk in rows.iterator(chunk_size=5000):
+            entry = (year, trim.lower(), engine.lower(), pk)
+            for key in {(make.lower(), model.lower()), (make_slug, model_slug)}:
+                self.vehicles.setdefault(key, []).append(entry)
+
+        self.inserted = self.deleted = self.updated = 0
+        self.rows = self.skipped = 0
+        # Products already written, a later block for one of them is merged instead of replacing
+        self.synced = set()
+        pending = {}
+        current = None
+        start = time.perf_counter()
+
+        for line, row in read_feed(options['path'], options['format'], columns=('sku', 'make', 'model')):
+            self.rows += 1
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                product_id, fitments = self._expand(row)
+            except RowError as exc:
+                self.skipped += 1
+                self.stderr.write(f'Line {line}: {exc}')
+                continue
+            # Flush only between products, so each one is diffed against its complete set
+            if product_id != current and len(pending) >= batch_size:
+                self._sync(pending)
+                pending = {}
+                if self.verbosity > 1:
+                    elapsed = time.perf_counter() - start
+                    self.stdout.write(f'{self.rows} rows, {self.rows / elapsed:.0f} rows/s')
+            current = product_id
+            pending.setdefault(product_id, {}).update(fitments)
+        if pending:
+            self._sync(pending)
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {self.rows} rows ({self.skipped} skipped) in {elapsed:.1f}s, '
+            f'{self.rows / elapsed if elapsed else 0:.0f} rows/s: {self.inserted} fitments added, '
+            f'{self.updated} updated, {self.deleted} removed'
+        ))
+
+    def _expand(self, row):
+        """Product id and {vehicle id: (position, notes)} for one feed row"""
+        sku = str(row.get('sku') or '').strip()
+        product_id = self.products.get(sku)
+        if product_id is None:
+            raise RowError(f'unknown sku {sku!r}')
+
+        make = str(row.get('make') or '').strip().lower()
+        model = str(row.get('model') or '').strip().lower()
+        candidates = self.vehicles.get((make, model))
+        if candidates is None:
+            raise RowError(f'unknown vehicle {row.get("make")!r} {row.get("model")!r}')
+
+        year = _year(row, 'year')
+        year_from = _year(row, 'year_from') or year
+        year_to = _year(row, 'year_to') or year or year_from
+        if year_from and year_to and year_from > year_to:
+            raise RowError(f'year range {year_from}-{year_to} is reversed')
+        trim = str(row.get('trim') or '').strip().lower()
+        engine = str(row.get('engine') or '').strip().lower()
+
+        fitment = (str(row.get('position') or '').strip()[:50], str(row.get('notes') or '').strip())
+        fitments = {
+            pk: fitment
+            for vehicle_year, vehicle_trim, vehicle_engine, pk in candidates
+            if (year_from is None or vehicle_year >= year_from)
+            and (year_to is None or vehicle_year <= year_to)
+            and (not trim or vehicle_trim == trim)
+            and (not engine or vehicle_engine == engine)
+        }
+        if not fitments:
+            raise RowError(f'no {row.get("make")} {row.get("model")} vehicles match')
+        return product_id, fitments
+
+    def _sync(self, pending):
+        """Diff the pending products' fitments against the table and apply the changes in bulk"""
+        existing = {}
+        for pk, product_id, vehicle_id, position, notes in (
+            ProductFitment.objects.filter(product_id__in=pending)
+            .values_list('pk', 'product_id', 'vehicle_id', 'position', 'fitment_notes')
+        ):
+            existing.setdefault(product_id, {})[vehicle_id] = (pk, position, notes)
+
+        inserts, updates, deletes = [], [], []
+        products, vehicles = set(), set()
+        for product_id, wanted in pending.items():
+            current = existing.get(product_id, {})
+            for vehicle_id, (position, notes) in wanted.items():
+                if vehicle_id not in current:
+                    inserts.append(ProductFitment(product_id=product_id, vehicle_id=vehicle_id,
+                                                  position=position, fitment_notes=notes))
+                    products.add(product_id)
+                    vehicles.add(vehicle_id)
+                elif current[vehicle_id][1:] != (position, notes):
+                    updates.append(ProductFitment(pk=current[vehicle_id][0], position=position, fitment_notes=notes))
+                    products.add(product_id)
+            if self.keep_existing or product_id in self.synced:
+                continue
+            for vehicle_id, (pk, _, _) in current.items():
+                if vehicle_id not in wanted:
+                    deletes.append(pk)
+                    products.add(product_id)
+                    vehicles.add(vehicle_id)
+
+        with transaction.atomic():
+            if deletes:
+                # A plain DELETE instead of one post_delete signal per row
+                delete_rows(ProductFitment.objects.filter(pk__in=deletes))
+            ProductFitment.objects.bulk_create(inserts, batch_size=1000, ignore_conflicts=True)
+            ProductFitment.objects.bulk_update(updates, ['position', 'fitment_notes'], batch_size=1000)
+            if products:
+                # Bulk writes skip the model signals
+                catalog_index.invalidate(vehicles=vehicles)
+                invalidate_products(products)
+                refresh_parts_counts(vehicles)
+
+        self.synced.update(pending)
+        self.inserted += len(inserts)
+        self.updated += len(updates)
+        self.deleted += len(deletes)
@@ -0,0 +1,33 @@
+# products/management/commands/recount_counters.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.counters import refresh_category_counts
+from products.models import Category
+from vehicles.counters import refresh_models_counts, refresh_parts_counts, refresh_vehicles_counts
+from vehicles.models import Make, Model, Vehicle
+
+COUNTERS = [
+    (Make, 'models_count', refresh_models_counts),
+    (Model, 'vehicles_count', refresh_vehicles_counts),
+    (Vehicle, 'parts_count', refresh_parts_counts),
+    (Category, 'product_count', refresh_category_counts),
+]
+
+
+class Command(BaseCommand):
+    help = ('Recounts the stored make, model, vehicle and category counters from scratch '
+            'and reports how many had drifted')
+
+    def handle(self, *args, **options):
+        for model, field, refresh in COUNTERS:
+            with transaction.atomic():
+                before = dict(model.objects.values_list('pk', field))
+                refresh()
+                after = dict(model.objects.values_list('pk', field))
+            drifted = sum(1 for pk, count in after.items() if before.get(pk) != count)
+            label = f'{model._meta.verbose_name_plural}.{field}'
+            if drifted:
+                self.stdout.write(self.style.WARNING(f'{label}: corrected {drifted} of {len(after)}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{label}: all {len(after)} correct'))
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:40
+
+from django.db import migrations
+
+# Frozen copies of products.search.CREATE_TABLE / DROP_TABLE as of this migration
+CREATE_TABLE = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_search USING fts5(
+    title, description, sku, part_numbers, manufacturer, specifications,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+DROP_TABLE = "DROP TABLE IF EXISTS products_search"
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_TABLE)
+
+    # Index the existing catalog
+    Product = apps.get_model('products', 'Product')
+    rows = []
+    for product in Product.objects.filter(is_active=True).select_related('manufacturer').prefetch_related('specifications'):
+        rows.append((
+            product.pk,
+            product.title,
+            product.description,
+            product.sku,
+            ' '.join(filter(None, [product.part_number, product.oem_part_number])),
+            product.manufacturer.name if product.manufacturer else '',
+            ' '.join(f"{spec.name} {spec.value} {spec.unit}".strip() for spec in product.specifications.all()),
+        ))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO products_search (rowid, title, description, sku, part_numbers, manufacturer, specifications) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
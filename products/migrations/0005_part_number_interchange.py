@@ -0,0 +1,75 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:05
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+NON_ALNUM_RE = re.compile(r'[^0-9A-Za-z]')
+
+
+def normalize_part_number(value):
+    """Frozen copy of products.interchange.normalize_part_number as of this migration"""
+    return NON_ALNUM_RE.sub('', value or '').upper()
+
+
+def backfill_part_number_keys(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    InterchangeGroup = apps.get_model('products', 'InterchangeGroup')
+
+    products = list(Product.objects.only('part_number', 'oem_part_number', 'product_type'))
+    for product in products:
+        product.part_number_key = normalize_part_number(product.part_number)
+        product.oem_part_number_key = normalize_part_number(product.oem_part_number)
+
+    def group_key(product):
+        if product.oem_part_number_key:
+            return product.oem_part_number_key
+        return product.part_number_key if product.product_type == 'OEM' else ''
+
+    keys = {group_key(product) for product in products} - {''}
+    InterchangeGroup.objects.bulk_create([InterchangeGroup(oem_number=key) for key in keys], ignore_conflicts=True)
+    groups = dict(InterchangeGroup.objects.values_list('oem_number', 'pk'))
+    for product in products:
+        product.interchange_group_id = groups.get(group_key(product))
+
+    Product.objects.bulk_update(
+        products, ['part_number_key', 'oem_part_number_key', 'interchange_group'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InterchangeGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('oem_number', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+            ],
+            options={
+                'ordering': ['oem_number'],
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='oem_part_number_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='part_number_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='interchange_group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='products', to='products.interchangegroup'),
+        ),
+        migrations.RunPython(backfill_part_number_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    categories = {category.pk: category for category in Category.objects.all()}
+
+    def path_of(category):
+        if not category.path:
+            parent = categories.get(category.parent_id)
+            category.path = (path_of(parent) if parent else '') + f"{category.pk:06d}/"
+            category.depth = category.path.count('/') - 1
+        return category.path
+
+    for category in categories.values():
+        path_of(category)
+    Category.objects.bulk_update(categories.values(), ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_part_number_interchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:55
+
+import re
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+# Frozen copy of the parsing in products/units.py as of this migration
+UNITS = {
+    'mm': ('mm', 1.0),
+    'cm': ('mm', 10.0),
+    'm': ('mm', 1000.0),
+    'in': ('mm', 25.4),
+    'inch': ('mm', 25.4),
+    'inches': ('mm', 25.4),
+    '"': ('mm', 25.4),
+    'ft': ('mm', 304.8),
+    'km': ('km', 1.0),
+    'mi': ('km', 1.609344),
+    'mile': ('km', 1.609344),
+    'miles': ('km', 1.609344),
+    'g': ('g', 1.0),
+    'kg': ('g', 1000.0),
+    'oz': ('g', 28.349523125),
+    'lb': ('g', 453.59237),
+    'lbs': ('g', 453.59237),
+    'ml': ('ml', 1.0),
+    'l': ('ml', 1000.0),
+    'qt': ('ml', 946.352946),
+    'gal': ('ml', 3785.411784),
+    'w': ('W', 1.0),
+    'kw': ('W', 1000.0),
+    'v': ('V', 1.0),
+    'a': ('A', 1.0),
+    'ah': ('Ah', 1.0),
+    'kpa': ('kPa', 1.0),
+    'bar': ('kPa', 100.0),
+    'psi': ('kPa', 6.894757),
+    'nm': ('Nm', 1.0),
+    'lb-ft': ('Nm', 1.3558179),
+    'ft-lb': ('Nm', 1.3558179),
+}
+VALUE_RE = re.compile(r'^\s*([-+]?\d+(?:[.,]\d+)?)\s*([^\d\s].*?)?\s*$')
+
+
+def normalize_attribute(name):
+    return slugify(name)[:100]
+
+
+def parse_value(value, unit=''):
+    match = VALUE_RE.match(value or '')
+    if match is None:
+        return None, ''
+    number = float(match.group(1).replace(',', '.'))
+    inline_unit = match.group(2) or ''
+    if inline_unit and unit:
+        return None, ''
+    unit = (inline_unit or unit).strip()
+    if not unit:
+        return number, ''
+    known = UNITS.get(unit.lower())
+    if known is None:
+        return None, ''
+    base, factor = known
+    return number * factor, base
+
+
+def backfill_typed_values(apps, schema_editor):
+    ProductSpecification = apps.get_model('products', 'ProductSpecification')
+
+    specs = list(ProductSpecification.objects.only('name', 'value', 'unit'))
+    for spec in specs:
+        spec.attribute = normalize_attribute(spec.name)
+        spec.numeric_value, spec.normalized_unit = parse_value(spec.value, spec.unit)
+    ProductSpecification.objects.bulk_update(
+        specs, ['attribute', 'numeric_value', 'normalized_unit'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_category_materialized_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productspecification',
+            name='attribute',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='productspecification',
+            name='normalized_unit',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='productspecification',
+            name='numeric_value',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='productspecification',
+            index=models.Index(fields=['attribute', 'numeric_value'], name='spec_attribute_value_idx'),
+        ),
+        migrations.RunPython(backfill_typed_values, migrations.RunPython.noop),
+    ]
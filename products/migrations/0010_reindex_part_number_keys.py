@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:40
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def index_part_number_keys(apps, schema_editor):
+    """
+    Add the keys 0005 backfilled to the search rows, so existing products are
+    found by unpunctuated part numbers without running rebuild_search_index
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Product = apps.get_model('products', 'Product')
+    products = Product.objects.filter(is_active=True).order_by('pk').values_list(
+        'pk', 'part_number', 'oem_part_number', 'part_number_key', 'oem_part_number_key',
+    )
+    rows = []
+    with schema_editor.connection.cursor() as cursor:
+        for pk, *numbers in products.iterator(chunk_size=BATCH_SIZE):
+            rows.append((' '.join(filter(None, numbers)), pk))
+            if len(rows) >= BATCH_SIZE:
+                cursor.executemany("UPDATE products_search SET part_numbers = %s WHERE rowid = %s", rows)
+                rows = []
+        if rows:
+            cursor.executemany("UPDATE products_search SET part_numbers = %s WHERE rowid = %s", rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_catalog_index_generation'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_part_number_keys, migrations.RunPython.noop),
+    ]
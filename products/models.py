@@ -1,6 +1,13 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
+from django.urls import reverse
 from django.utils.text import slugify
 
+from .interchange import normalize_part_number
+from .units import normalize_attribute, parse_value
+
 class Category(models.Model):
     """Product categories with hierarchy"""
     name = models.CharField(max_length=100)
@@ -10,12 +17,66 @@ class Category(models.Model):
     description = models.TextField(blank=True)
     # image = models.ImageField(upload_to='categories/', blank=True)
     
+    # Materialized path of zero-padded ids ("000001/000004/"), maintained on save
+    path = models.CharField(max_length=255, blank=True, editable=False, db_index=True)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Active products in this category and below it (see counters.py)
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ['name']
     
     def __str__(self):
         return self.name
+    
+    def clean(self):
+        if self.parent_id and self.pk:
+            parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id)
+            if parent_path.startswith(self.path):
+                raise ValidationError({'parent': 'A category cannot be moved under itself.'})
+    
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        parent_path = ''
+        if self.parent_id:
+            # Read the parent's current path, it may have moved since it was loaded
+            parent_path = Category.objects.values_list('path', flat=True).get(pk=self.parent_id)
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError('A category cannot be moved under itself.')
+        super().save(*args, **kwargs)
+        
+        new_path = f"{parent_path}{self.pk:06d}/"
+        if new_path != old_path:
+            self.path = new_path
+            self.depth = new_path.count('/') - 1
+            Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            if old_path:
+                # Move the whole subtree with one UPDATE
+                Category.objects.filter(Category.subtree_filter(old_path)).exclude(pk=self.pk).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (self.depth - (old_path.count('/') - 1)),
+                )
+                # The old and new ancestors now count different products
+                from .counters import refresh_category_counts
+                refresh_category_counts()
+    
+    @staticmethod
+    def subtree_filter(path, prefix='path'):
+        """Q for a path and everything under it, as an index-friendly range"""
+        # '/' sorts right before '0', so every descendant path falls in [path, path[:-1] + '0')
+        return Q(**{f'{prefix}__gte': path, f'{prefix}__lt': path[:-1] + '0'})
+    
+    def get_descendants(self, include_self=True):
+        """This category and everything below it, in one indexed query"""
+        descendants = Category.objects.filter(Category.subtree_filter(self.path))
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+    
+    def get_ancestor_ids(self):
+        """Ids from the root down to this category, read off the path"""
+        return [int(part) for part in self.path.split('/') if part]
 
 
 class Manufacturer(models.Model):
@@ -29,6 +90,22 @@ class Manufacturer(models.Model):
         return self.name
 
 
+class InterchangeGroup(models.Model):
+    """Parts that replace one another, anchored on a normalized OEM part number"""
+    oem_number = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=255, blank=True)
+    
+    class Meta:
+        ordering = ['oem_number']
+    
+    def __str__(self):
+        return f"{self.oem_number} {self.name}".strip()
+
+
+# What Product.interchange_key is computed from
+INTERCHANGE_KEY_FIELDS = ('part_number_key', 'oem_part_number_key', 'product_type')
+
+
 class Product(models.Model):
     PRODUCT_TYPE_CHOICES = [
         ('OEM', 'OEM Original'),
@@ -60,6 +137,12 @@ class Product(models.Model):
     product_type = models.CharField(max_length=3, choices=PRODUCT_TYPE_CHOICES, default='AFT')
     is_universal = models.BooleanField(default=False)
     
+    # Cross-reference (normalized copies of the part numbers, see interchange.py)
+    part_number_key = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+    oem_part_number_key = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
+    interchange_group = models.ForeignKey(InterchangeGroup, on_delete=models.SET_NULL,
+                                          null=True, blank=True, related_name='products')
+    
     # # Physical Properties
     # weight = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     # length = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
@@ -79,14 +162,54 @@ class Product(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the listing (see pagination.py)
+            models.Index(fields=['created_at', 'id'], name='product_listing_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_category_listing_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
+    def get_absolute_url(self):
+        return reverse('products:product_detail', args=[self.slug])
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        self.part_number_key = normalize_part_number(self.part_number)
+        self.oem_part_number_key = normalize_part_number(self.oem_part_number)
+        
+        # Everything sharing an OEM number is interchangeable. The group follows
+        # the key only when the key changes, so a group picked by hand stays
+        group_key = self.interchange_key
+        stored_key = getattr(self, '_stored_interchange_key', None)
+        if stored_key is None:
+            # New, or loaded without the key fields: only fill in a missing group
+            if group_key and self.interchange_group_id is None:
+                self.interchange_group, _ = InterchangeGroup.objects.get_or_create(oem_number=group_key)
+        elif group_key != stored_key:
+            self.interchange_group = (
+                InterchangeGroup.objects.get_or_create(oem_number=group_key)[0] if group_key else None
+            )
         super().save(*args, **kwargs)
+        self._stored_interchange_key = group_key
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if all(name in field_names for name in INTERCHANGE_KEY_FIELDS):
+            instance._stored_interchange_key = instance.interchange_key
+        return instance
+    
+    @property
+    def interchange_key(self):
+        """Normalized OEM number this part is (or replaces)"""
+        if self.oem_part_number_key:
+            return self.oem_part_number_key
+        if self.product_type == 'OEM':
+            return self.part_number_key
+        return ''
 
 
 # class ProductImage(models.Model):
@@ -111,6 +234,25 @@ class ProductSpecification(models.Model):
     value = models.CharField(max_length=255)
     unit = models.CharField(max_length=50, blank=True)
     
+    # Typed copy for range filters (see units.py), maintained on save
+    attribute = models.CharField(max_length=100, blank=True, editable=False)
+    numeric_value = models.FloatField(null=True, blank=True, editable=False)
+    normalized_unit = models.CharField(max_length=20, blank=True, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['attribute', 'numeric_value'], name='spec_attribute_value_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        self.normalize()
+        super().save(*args, **kwargs)
+    
+    def normalize(self):
+        """Fill in the typed columns, bulk writers call this themselves"""
+        self.attribute = normalize_attribute(self.name)
+        self.numeric_value, self.normalized_unit = parse_value(self.value, self.unit)
+    
     def __str__(self):
         unit_text = f" {self.unit}" if self.unit else ""
         return f"{self.name}: {self.value}{unit_text}"
@@ -148,4 +290,21 @@ class ProductDocument(models.Model):
     # url = models.URLField(blank=True)
     
     def __str__(self):
-        return f"{self.product.title} - {self.title}"
\ No newline at end of file
+        return f"{self.product.title} - {self.title}"
+
+
+class CatalogIndexGeneration(models.Model):
+    """Single-row counter numbering the changes catalog_index.py publishes to other processes"""
+    value = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def next(cls):
+        """Increment and return the counter; concurrent callers each get their own number"""
+        with transaction.atomic():
+            cls.objects.get_or_create(pk=1)
+            cls.objects.filter(pk=1).update(value=F('value') + 1)
+            return cls.objects.values_list('value', flat=True).get(pk=1)
+
+    @classmethod
+    def current(cls):
+        return cls.objects.filter(pk=1).values_list('value', flat=True).first() or 0
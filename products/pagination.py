@@ -0,0 +1,119 @@
+"""
+Keyset (cursor) pagination for the catalog listing.
+
+Pages follow Product.Meta.ordering (newest first) with id as a tiebreaker, so
+a cursor is the (created_at, id) of the row at the edge of the page. Fetching
+the next page is a range condition on an index instead of an OFFSET, so page
+1000 costs the same as page 1.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .catalog_index import EPOCH, sort_key
+
+PER_PAGE = 24
+
+# Totals for SQL listings are cached instead of counted on every request
+COUNT_TIMEOUT = 5 * 60
+
+
+def encode_cursor(key):
+    return f"{key[0]}-{key[1]}"
+
+
+def decode_cursor(value):
+    """(microseconds, id) from a cursor string, or None if it is malformed"""
+    try:
+        micros, pk = value.split('-')
+        return int(micros), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing"""
+
+    def __init__(self, object_list, next_key, previous_key, total_count):
+        self.object_list = object_list
+        self.next_cursor = encode_cursor(next_key) if next_key else None
+        self.previous_cursor = encode_cursor(previous_key) if previous_key else None
+        self.total_count = total_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _key(product):
+    return sort_key(product.created_at, product.pk)
+
+
+def cached_count(queryset, cache_key):
+    """COUNT(*) for a listing, reused for COUNT_TIMEOUT seconds"""
+    return cache.get_or_set(f'product_count:{cache_key}', queryset.count, COUNT_TIMEOUT)
+
+
+def paginate_queryset(queryset, after=None, before=None, per_page=PER_PAGE, count_key=None, total_count=None):
+    """Page of a Product queryset after (or before) the given cursor"""
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before:
+        created_at = EPOCH + timedelta(microseconds=before[0])
+        rows = list(
+            queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=before[1]))
+            .order_by('created_at', 'id')[:per_page + 1]
+        )
+        more_before = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        next_key = _key(rows[-1]) if rows else None
+        previous_key = _key(rows[0]) if rows and more_before else None
+    else:
+        page = queryset
+        if after:
+            created_at = EPOCH + timedelta(microseconds=after[0])
+            page = page.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=after[1]))
+        rows = list(page.order_by('-created_at', '-id')[:per_page + 1])
+        more_after = len(rows) > per_page
+        rows = rows[:per_page]
+        next_key = _key(rows[-1]) if more_after else None
+        previous_key = _key(rows[0]) if rows and after else None
+
+    if total_count is None and count_key:
+        total_count = cached_count(queryset.order_by(), count_key)
+    return KeysetPage(rows, next_key, previous_key, total_count)
+
+
+def _descending(key):
+    return (-key[0], -key[1])
+
+
+def paginate_keys(keys, queryset, after=None, before=None, per_page=PER_PAGE):
+    """Page of sort keys already ordered newest first (catalog index results)"""
+    after, before = decode_cursor(after), decode_cursor(before)
+    if before:
+        end = bisect_left(keys, _descending(before), key=_descending)
+        start = max(end - per_page, 0)
+    elif after:
+        start = bisect_right(keys, _descending(after), key=_descending)
+        end = start + per_page
+    else:
+        start, end = 0, per_page
+
+    page_keys = keys[start:end]
+    products = queryset.in_bulk([pk for _, pk in page_keys])
+    rows = [products[pk] for _, pk in page_keys if pk in products]
+    next_key = page_keys[-1] if page_keys and end < len(keys) else None
+    previous_key = page_keys[0] if page_keys and start > 0 else None
+    return KeysetPage(rows, next_key, previous_key, len(keys))
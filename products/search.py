@@ -0,0 +1,129 @@
+"""
+Storefront full-text search on an SQLite FTS5 table.
+
+products_search holds one row per active product (rowid = product id) with
+the title, description, SKU, part numbers, manufacturer name and
+specification values. Signals keep it in sync; results are ranked with BM25
+so a match in the title or a part number beats one buried in a description.
+On other databases search falls back to icontains on the product table.
+"""
+import re
+
+from django.db import connection, transaction
+
+TABLE = 'products_search'
+
+CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(
+    title, description, sku, part_numbers, manufacturer, specifications,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+DROP_TABLE = f"DROP TABLE IF EXISTS {TABLE}"
+
+# BM25 column weights, in CREATE_TABLE column order
+WEIGHTS = (10.0, 1.0, 8.0, 8.0, 3.0, 2.0)
+
+BATCH_SIZE = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """FTS5 MATCH string: every word must appear, as a word or a word prefix"""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+def _documents(product_ids):
+    from .models import Product
+
+    products = (
+        Product.objects.filter(pk__in=product_ids, is_active=True)
+        .select_related('manufacturer')
+        .prefetch_related('specifications')
+    )
+    for product in products:
+        yield (
+            product.pk,
+            product.title,
+            product.description,
+            product.sku,
+            ' '.join(filter(None, [
+                product.part_number, product.oem_part_number,
+                product.part_number_key, product.oem_part_number_key,
+            ])),
+            product.manufacturer.name if product.manufacturer else '',
+            ' '.join(f"{spec.name} {spec.value} {spec.unit}".strip() for spec in product.specifications.all()),
+        )
+
+
+def index_products(product_ids):
+    """(Re)index the given products; inactive or missing ones are removed"""
+    if not is_available():
+        return
+    product_ids = list(product_ids)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({placeholders})", batch)
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, title, description, sku, part_numbers, manufacturer, specifications) "
+                f"VALUES (%s, %s, %s, %s, %s, %s, %s)",
+                list(_documents(batch)),
+            )
+
+
+def remove_products(product_ids):
+    if not is_available():
+        return
+    product_ids = list(product_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({placeholders})", batch)
+
+
+def rebuild():
+    """Reindex the whole catalog, returns the number of products indexed"""
+    from .models import Product
+
+    if not is_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+    product_ids = list(Product.objects.filter(is_active=True).values_list('pk', flat=True))
+    index_products(product_ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+    return len(product_ids)
+
+
+def search(query, limit=24, offset=0):
+    """Best-ranked product ids for the query and the total number of matches"""
+    from .models import Product
+
+    if not is_available():
+        products = Product.objects.filter(is_active=True, title__icontains=query.strip())
+        return list(products.values_list('pk', flat=True)[offset:offset + limit]), products.count()
+
+    expression = match_expression(query)
+    if not expression:
+        return [], 0
+    weights = ', '.join(str(weight) for weight in WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s "
+            f"ORDER BY bm25({TABLE}, {weights}) LIMIT %s OFFSET %s",
+            [expression, limit, offset],
+        )
+        product_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f"SELECT count(*) FROM {TABLE} WHERE {TABLE} MATCH %s", [expression])
+        total = cursor.fetchone()[0]
+    return product_ids, total
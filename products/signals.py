@@ -0,0 +1,174 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from vehicles.counters import adjust, refresh_parts_counts
+from vehicles.models import Make, Model, Vehicle
+
+from . import search
+from .catalog_index import catalog_index
+from .category_tree import clear_category_tree
+from .counters import move_product, refresh_category_counts
+from .detail_cache import forget_slug, invalidate_product, invalidate_products
+from .facets import clear_labels
+from .models import Category, Manufacturer, Product, ProductDocument, ProductFitment, ProductSpecification
+
+
+# ==================== CATALOG INDEX ====================
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    catalog_index.product_saved(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    catalog_index.product_deleted(instance.pk)
+
+
+@receiver(pre_save, sender=ProductFitment)
+def remember_fitment_vehicle(sender, instance, **kwargs):
+    """Keep the old product/vehicle pair so a moved fitment leaves its old vehicle"""
+    instance._indexed_pair = None
+    if instance.pk:
+        instance._indexed_pair = (
+            ProductFitment.objects.filter(pk=instance.pk)
+            .values_list('product_id', 'vehicle_id').first()
+        )
+
+
+@receiver(post_save, sender=ProductFitment)
+def index_fitment(sender, instance, **kwargs):
+    previous = getattr(instance, '_indexed_pair', None)
+    if previous and previous != (instance.product_id, instance.vehicle_id):
+        catalog_index.fitment_removed(*previous)
+    catalog_index.fitment_added(instance.product_id, instance.vehicle_id)
+
+
+@receiver(post_delete, sender=ProductFitment)
+def unindex_fitment(sender, instance, **kwargs):
+    catalog_index.fitment_removed(instance.product_id, instance.vehicle_id)
+
+
+# ==================== FACET LABELS / CATEGORY TREE ====================
+@receiver([post_save, post_delete], sender=Manufacturer)
+def refresh_facet_labels(sender, **kwargs):
+    clear_labels()
+
+
+@receiver([post_save, post_delete], sender=Category)
+def refresh_category_tree(sender, **kwargs):
+    clear_category_tree()
+
+
+# ==================== SEARCH INDEX ====================
+@receiver(post_save, sender=Product)
+def index_product_text(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index_products([instance.pk]))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_text(sender, instance, **kwargs):
+    # delete() clears instance.pk before the transaction commits
+    product_id = instance.pk
+    transaction.on_commit(lambda: search.remove_products([product_id]))
+
+
+@receiver([post_save, post_delete], sender=ProductSpecification)
+def index_specification_text(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index_products([instance.product_id]))
+
+
+@receiver(post_save, sender=Manufacturer)
+def index_manufacturer_text(sender, instance, created, **kwargs):
+    if not created:
+        product_ids = list(instance.products.values_list('pk', flat=True))
+        transaction.on_commit(lambda: search.index_products(product_ids))
+
+
+@receiver(pre_delete, sender=Manufacturer)
+def reindex_orphaned_products(sender, instance, **kwargs):
+    """Deleting a manufacturer nulls Product.manufacturer with a plain UPDATE"""
+    product_ids = list(instance.products.values_list('pk', flat=True))
+    catalog_index.invalidate(products=product_ids)
+    transaction.on_commit(lambda: search.index_products(product_ids))
+    transaction.on_commit(lambda: invalidate_products(product_ids))
+
+
+# ==================== DETAIL PAGE CACHE ====================
+@receiver(pre_save, sender=Product)
+def remember_product_state(sender, instance, **kwargs):
+    """
+    Keep the old slug so a renamed product stops answering on its old URL,
+    and the old category and active flag for the category counters
+    """
+    instance._cached_slug = None
+    instance._counted = None
+    if instance.pk:
+        old = Product.objects.filter(pk=instance.pk).values_list('slug', 'category_id', 'is_active').first()
+        if old:
+            instance._cached_slug, instance._counted = old[0], old[1:]
+
+
+@receiver([post_save, post_delete], sender=Product)
+def expire_product_detail(sender, instance, **kwargs):
+    # save() already bumped last_updated, only the slug pointers have to go
+    forget_slug(instance.slug, getattr(instance, '_cached_slug', None))
+
+
+@receiver([post_save, post_delete], sender=ProductSpecification)
+@receiver([post_save, post_delete], sender=ProductFitment)
+@receiver([post_save, post_delete], sender=ProductDocument)
+def expire_parent_detail(sender, instance, **kwargs):
+    invalidate_product(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Manufacturer)
+def expire_named_details(sender, instance, created, **kwargs):
+    """The page shows the names of the product's category and manufacturer"""
+    if not created:
+        invalidate_products(instance.products.values('pk'))
+
+
+# Lookup from ProductFitment to each model the fitment table names
+FITMENT_VEHICLE_PATHS = {Make: 'vehicle__model__make', Model: 'vehicle__model', Vehicle: 'vehicle'}
+
+
+@receiver(post_save, sender=Make)
+@receiver(post_save, sender=Model)
+@receiver(post_save, sender=Vehicle)
+def expire_fitting_details(sender, instance, created, **kwargs):
+    """The fitment table shows the make, model, year and trim of each vehicle"""
+    if not created:
+        fitting = ProductFitment.objects.filter(**{FITMENT_VEHICLE_PATHS[sender]: instance})
+        invalidate_products(fitting.values('product_id'))
+
+
+# ==================== COUNTERS ====================
+@receiver(post_save, sender=Product)
+def count_product(sender, instance, **kwargs):
+    move_product(getattr(instance, '_counted', None), (instance.category_id, instance.is_active))
+
+
+@receiver(post_delete, sender=Product)
+def uncount_product(sender, instance, **kwargs):
+    move_product((instance.category_id, instance.is_active), None)
+
+
+@receiver(post_delete, sender=Category)
+def recount_deleted_category(sender, instance, **kwargs):
+    refresh_category_counts()
+
+
+@receiver(post_save, sender=ProductFitment)
+def count_fitment(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_indexed_pair', None)
+    if created:
+        adjust(Vehicle, instance.vehicle_id, 'parts_count', 1)
+    elif previous and previous[1] != instance.vehicle_id:
+        refresh_parts_counts([previous[1], instance.vehicle_id])
+
+
+@receiver(post_delete, sender=ProductFitment)
+def uncount_fitment(sender, instance, **kwargs):
+    adjust(Vehicle, instance.vehicle_id, 'parts_count', -1)
@@ -1,3 +1,893 @@
+import tempfile
+import textwrap
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.http import QueryDict
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from cars.testing import CatalogTestCase, ChangelistQueryBudgetMixin, make_category, make_product, make_vehicle
+from vehicles.models import Vehicle
+
+from . import search
+from .catalog_index import CHANGE_KEY, GENERATION_KEY, CatalogIndex, catalog_index, sort_key
+from .category_tree import get_category_tree
+from .counters import refresh_category_counts
+from .detail_cache import get_product_detail
+from .facets import FacetQuery, parse_spec_filter
+from .interchange import interchangeable_products, normalize_part_number, products_by_prefix
+from .models import (
+    CatalogIndexGeneration, Category, InterchangeGroup, Manufacturer, Product, ProductDocument, ProductFitment,
+    ProductSpecification,
+)
+from .pagination import decode_cursor, encode_cursor, paginate_keys, paginate_queryset
+from .units import parse_value
+
+
+class ChangelistQueryBudgetTests(ChangelistQueryBudgetMixin, TestCase):
+    app_label = 'products'
+
+
+# ==================== CATALOG INDEX ====================
+class CatalogIndexSyncTests(CatalogTestCase):
+    """Separate CatalogIndex instances stand in for worker processes sharing the cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = make_category('Brakes')
+        cls.pad = make_product('Pad', category, inventory=5)
+        cls.rotor = make_product('Rotor', category, inventory=5)
+
+    def in_stock(self, index):
+        return dict(index.facet_search({}).counts['in_stock'])
+
+    def sell_out(self, worker, product):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=product.pk).update(inventory=0)
+            worker.invalidate(products=[product.pk])
+
+    def test_back_to_back_changes_reach_another_worker(self):
+        reader = CatalogIndex()
+        self.assertEqual(self.in_stock(reader), {True: 2})
+
+        first, second = CatalogIndex(), CatalogIndex()
+        self.sell_out(first, self.pad)
+        published = cache.get(GENERATION_KEY)
+        self.sell_out(second, self.rotor)
+        self.assertNotEqual(cache.get(GENERATION_KEY), published)
+        # The first worker's hint landing last must not hide the second change
+        cache.set(GENERATION_KEY, published, None)
+        self.assertEqual(self.in_stock(reader), {False: 2})
+
+    def test_nothing_changed_costs_no_query(self):
+        reader = CatalogIndex()
+        self.in_stock(reader)
+        with self.assertNumQueries(0):
+            self.in_stock(reader)
+
+
+class CatalogIndexTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.camry = make_vehicle()
+        cls.civic = make_vehicle(make='Honda', model='Civic')
+        cls.brakes = make_category('Brakes')
+        cls.filters = make_category('Filters')
+        cls.pad = make_product('Pad', cls.brakes)
+        cls.rotor = make_product('Rotor', cls.brakes, is_universal=True)
+        cls.filter = make_product('Filter', cls.filters)
+        cls.retired = make_product('Retired', cls.brakes, is_active=False)
+        for product in (cls.pad, cls.rotor, cls.filter, cls.retired):
+            ProductFitment.objects.create(product=product, vehicle=cls.camry)
+        # Oldest first, so the listing order is the reverse
+        now = timezone.now()
+        for n, product in enumerate((cls.retired, cls.filter, cls.rotor, cls.pad)):
+            Product.objects.filter(pk=product.pk).update(created_at=now + timedelta(seconds=n))
+
+    def test_product_ids_filter_like_the_listing(self):
+        index = catalog_index
+        self.assertEqual(index.product_ids(self.camry.pk), [self.pad.pk, self.rotor.pk, self.filter.pk])
+        self.assertEqual(index.product_ids(self.camry.pk, category_ids={self.brakes.pk}), [self.pad.pk, self.rotor.pk])
+        self.assertEqual(index.product_ids(self.camry.pk, is_universal=True), [self.rotor.pk])
+        self.assertEqual(index.product_ids(self.civic.pk), [])
+        keys = index.product_keys(self.camry.pk)
+        self.assertEqual(keys, sorted(keys, reverse=True))
+        self.assertTrue(index.fits(self.pad.pk, self.camry.pk))
+        self.assertFalse(index.fits(self.pad.pk, self.civic.pk))
+
+    def test_matches_the_orm(self):
+        expected = list(
+            Product.objects.filter(is_active=True, fitments__vehicle=self.camry).values_list('pk', flat=True)
+        )
+        self.assertEqual(catalog_index.product_ids(self.camry.pk), expected)
+
+    def test_saves_and_deletes_patch_the_index_after_commit(self):
+        catalog_index.product_ids(self.camry.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pad.is_active = False
+            self.pad.save()
+            self.assertIn(self.pad.pk, catalog_index.product_ids(self.camry.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.filter.delete()
+        self.assertEqual(catalog_index.product_ids(self.camry.pk), [self.rotor.pk])
+
+    def test_moved_and_deleted_fitments(self):
+        catalog_index.product_ids(self.camry.pk)
+        catalog_index.product_ids(self.civic.pk)
+        fitment = ProductFitment.objects.get(product=self.pad)
+        with self.captureOnCommitCallbacks(execute=True):
+            fitment.vehicle = self.civic
+            fitment.save()
+        # Patched in place: the only query reads the change counter once
+        with self.assertNumQueries(1):
+            self.assertFalse(catalog_index.fits(self.pad.pk, self.camry.pk))
+            self.assertTrue(catalog_index.fits(self.pad.pk, self.civic.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fitment.delete()
+        self.assertEqual(catalog_index.product_ids(self.civic.pk), [])
+
+    def test_another_worker_replays_published_changes(self):
+        worker = CatalogIndex()
+        self.assertEqual(worker.product_ids(self.civic.pk), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductFitment.objects.create(product=self.filter, vehicle=self.civic)
+            Product.objects.filter(pk=self.rotor.pk).update(is_active=False)
+            catalog_index.invalidate(products=[self.rotor.pk])
+        self.assertEqual(worker.product_ids(self.civic.pk), [self.filter.pk])
+        self.assertEqual(worker.product_ids(self.camry.pk), [self.pad.pk, self.filter.pk])
+
+    def test_unreplayable_changes_rebuild_the_index(self):
+        worker = CatalogIndex()
+        worker.product_ids(self.camry.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.pad.pk).update(is_active=False)
+            catalog_index.invalidate_all()
+        self.assertEqual(worker.product_ids(self.camry.pk), [self.rotor.pk, self.filter.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.rotor.pk).update(is_active=False)
+            catalog_index.invalidate(products=[self.rotor.pk])
+        cache.delete(CHANGE_KEY.format(CatalogIndexGeneration.current()))
+        self.assertEqual(worker.product_ids(self.camry.pk), [self.filter.pk])
+
+    def test_benchmark_command(self):
+        stdout = StringIO()
+        call_command('benchmark_fitment_index', '--repeat', '1', '--category', 'brakes', stdout=stdout)
+        self.assertIn('Vehicles: 1, runs per vehicle: 1', stdout.getvalue())
+        self.assertIn('Index results match the ORM path.', stdout.getvalue())
+
+
+# ==================== PAGINATION ====================
+class KeysetPaginationTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = make_category('Brakes')
+        cls.products = [make_product(f'Part {n}', category) for n in range(7)]
+        # Two products created in the same microsecond, only the id tells them apart
+        now = timezone.now()
+        for n, product in enumerate(cls.products):
+            Product.objects.filter(pk=product.pk).update(created_at=now - timedelta(seconds=min(n, 5)))
+        cls.newest_first = list(Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def pages(self, paginate, *args, per_page=3):
+        """pks of every page, following next_cursor from the first"""
+        pages = []
+        after = None
+        while True:
+            page = paginate(*args, after=after, per_page=per_page)
+            pages.append([product.pk for product in page])
+            if not page.has_next:
+                return pages, page
+            after = page.next_cursor
+
+    def test_cursors_walk_the_listing_without_gaps_or_repeats(self):
+        pages, last = self.pages(paginate_queryset, Product.objects.all())
+        self.assertEqual([pk for page in pages for pk in page], self.newest_first)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertTrue(last.has_previous)
+
+    def test_before_returns_the_previous_page(self):
+        first = paginate_queryset(Product.objects.all(), per_page=3)
+        second = paginate_queryset(Product.objects.all(), after=first.next_cursor, per_page=3)
+        back = paginate_queryset(Product.objects.all(), before=second.previous_cursor, per_page=3)
+        self.assertEqual([product.pk for product in back], [product.pk for product in first])
+        self.assertFalse(back.has_previous)
+        self.assertEqual(back.next_cursor, first.next_cursor)
+
+    def test_index_keys_page_like_the_queryset(self):
+        keys = [sort_key(product.created_at, product.pk) for product in Product.objects.order_by('-created_at', '-id')]
+        pages, last = self.pages(paginate_keys, keys, Product.objects.all())
+        self.assertEqual([pk for page in pages for pk in page], self.newest_first)
+        self.assertEqual(last.total_count, 7)
+        back = paginate_keys(keys, Product.objects.all(), before=last.previous_cursor, per_page=3)
+        self.assertEqual([product.pk for product in back], pages[1])
+
+    def test_count_is_cached_under_its_key(self):
+        page = paginate_queryset(Product.objects.all(), per_page=3, count_key='all')
+        self.assertEqual(page.total_count, 7)
+        make_product('Part 8', self.products[0].category)
+        with self.assertNumQueries(1):
+            page = paginate_queryset(Product.objects.all(), per_page=3, count_key='all')
+        self.assertEqual(page.total_count, 7)
+
+    def test_malformed_cursor_starts_from_the_top(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        self.assertIsNone(decode_cursor(None))
+        self.assertEqual(decode_cursor(encode_cursor((12, 34))), (12, 34))
+        page = paginate_queryset(Product.objects.all(), after='garbage', per_page=3)
+        self.assertEqual([product.pk for product in page], self.newest_first[:3])
+
+    def test_listing_view_follows_the_cursor(self):
+        cursor = paginate_queryset(Product.objects.all(), per_page=3).next_cursor
+        page = self.client.get(reverse('products:product_list'), {'after': cursor}).context['page']
+        self.assertEqual([product.pk for product in page], self.newest_first[3:])
+        self.assertEqual(page.total_count, 7)
+        self.assertFalse(page.has_next)
+        self.assertTrue(page.has_previous)
+
+
+# ==================== FACETS ====================
+class FacetSearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = make_vehicle()
+        brakes = make_category('Brakes')
+        pads = make_category('Brake Pads', parent=brakes)
+        filters = make_category('Filters')
+        acme = Manufacturer.objects.create(name='Acme', slug='acme')
+        bosch = Manufacturer.objects.create(name='Bosch', slug='bosch')
+        cls.pad = make_product('Ceramic Pad', pads, price='20.00', manufacturer=acme)
+        cls.rotor = make_product('Vented Rotor', brakes, price='60.00', manufacturer=bosch)
+        cls.filter = make_product('Oil Filter', filters, price='8.00', inventory=0, manufacturer=acme)
+        retired = make_product('Old Rotor', brakes, is_active=False)
+        for product in (cls.pad, cls.rotor, retired):
+            ProductFitment.objects.create(product=product, vehicle=cls.vehicle)
+
+    def search(self, params='', **kwargs):
+        facets = FacetQuery(QueryDict(params))
+        return facets, catalog_index.facet_search(
+            facets.selected, min_price=facets.min_price, max_price=facets.max_price,
+            all_vehicles=facets.all_vehicles, **kwargs,
+        )
+
+    def pks(self, search):
+        return [pk for _, pk in search.keys]
+
+    def test_nothing_selected_pages_the_table(self):
+        _, search = self.search()
+        self.assertIsNone(search.keys)
+        self.assertEqual(search.total, 3)
+        self.assertEqual(search.counts['manufacturer'], {self.pad.manufacturer_id: 2, self.rotor.manufacturer_id: 1})
+        self.assertEqual(search.counts['in_stock'], {True: 2, False: 1})
+
+    def test_category_selects_its_subtree_and_counts_ignore_it(self):
+        _, search = self.search('category=brakes')
+        self.assertEqual(sorted(self.pks(search)), sorted([self.pad.pk, self.rotor.pk]))
+        self.assertEqual(sum(search.counts['category'].values()), 3)
+        self.assertEqual(sum(search.counts['manufacturer'].values()), 2)
+
+    def test_facets_intersect(self):
+        _, search = self.search('category=brakes&manufacturer=acme')
+        self.assertEqual(self.pks(search), [self.pad.pk])
+        _, search = self.search('min_price=10&max_price=30')
+        self.assertEqual(self.pks(search), [self.pad.pk])
+        _, search = self.search('in_stock=1&type=AFT')
+        self.assertEqual(sorted(self.pks(search)), sorted([self.pad.pk, self.rotor.pk]))
+
+    def test_vehicle_filters_active_fitting_parts(self):
+        _, search = self.search(vehicle_id=self.vehicle.pk)
+        self.assertEqual(sorted(self.pks(search)), sorted([self.pad.pk, self.rotor.pk]))
+        self.assertEqual(search.counts['fit'], {'vehicle': 2, 'all': 3})
+        self.assertTrue(catalog_index.fits(self.pad.pk, self.vehicle.pk))
+        self.assertFalse(catalog_index.fits(self.filter.pk, self.vehicle.pk))
+
+    def test_all_vehicles_keeps_the_fit_counts(self):
+        _, search = self.search('fit=all', vehicle_id=self.vehicle.pk)
+        self.assertIsNone(search.keys)
+        self.assertEqual(search.total, 3)
+        self.assertEqual(search.counts['fit'], {'vehicle': 2, 'all': 3})
+
+    def test_index_follows_committed_changes(self):
+        self.search(vehicle_id=self.vehicle.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductFitment.objects.create(product=self.filter, vehicle=self.vehicle)
+            self.rotor.is_active = False
+            self.rotor.save()
+        _, search = self.search(vehicle_id=self.vehicle.pk)
+        self.assertEqual(sorted(self.pks(search)), sorted([self.pad.pk, self.filter.pk]))
+        self.assertEqual(search.counts['fit'], {'vehicle': 2, 'all': 2})
+
+    def test_all_categories_option_clears_the_category(self):
+        facets, search = self.search('category=brake-pads&manufacturer=acme')
+        options = next(group for group in facets.groups(search.counts) if group['name'] == 'category')['options']
+        self.assertEqual(options[0]['label'], 'All Categories')
+        self.assertFalse(options[0]['selected'])
+        self.assertEqual(options[0]['url'], '?manufacturer=acme')
+        self.assertEqual(options[0]['count'], 2)
+        self.assertEqual({option['label'] for option in options if option['selected']}, {'Brake Pads'})
+
+        facets, search = self.search()
+        options = next(group for group in facets.groups(search.counts) if group['name'] == 'category')['options']
+        self.assertTrue(options[0]['selected'])
+        self.assertEqual(options[0]['count'], 3)
+
+    def test_listing_offers_the_fit_toggle_both_ways(self):
+        session = self.client.session
+        session['selected_vehicle_id'] = self.vehicle.pk
+        session['selected_vehicle_name'] = self.vehicle.label
+        session.save()
+        url = reverse('products:product_list')
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['page']), 2)
+        self.assertEqual(response.context['fit_counts'], {'vehicle': 2, 'all': 3})
+
+        response = self.client.get(url, {'fit': 'all'})
+        self.assertEqual(len(response.context['page']), 3)
+        self.assertEqual(response.context['fit_counts'], {'vehicle': 2, 'all': 3})
+        self.assertContains(response, self.vehicle.label)
+
+    def test_unknown_category_is_a_404(self):
+        response = self.client.get(reverse('products:product_list'), {'category': 'nope'})
+        self.assertEqual(response.status_code, 404)
+
+
+# ==================== SEARCH ====================
+class SearchTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brakes = make_category('Brakes')
+        bosch = Manufacturer.objects.create(name='Bosch', slug='bosch')
+        cls.pad = make_product('Ceramic Brake Pad', brakes, part_number='BP-1042', manufacturer=bosch)
+        cls.rotor = make_product(
+            'Vented Rotor', brakes, description='Pairs well with a ceramic pad.', oem_part_number='43512-33130',
+        )
+        cls.retired = make_product('Ceramic Rotor', brakes, is_active=False)
+        ProductSpecification.objects.create(product=cls.rotor, name='Diameter', value='296', unit='mm')
+        search.rebuild()
+
+    def test_title_match_ranks_above_description(self):
+        product_ids, total = search.search('ceramic')
+        self.assertEqual(product_ids, [self.pad.pk, self.rotor.pk])
+        self.assertEqual(total, 2)
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(search.search('cera pa')[0], [self.pad.pk, self.rotor.pk])
+        self.assertEqual(search.search('vent')[0], [self.rotor.pk])
+
+    def test_part_numbers_match_with_or_without_punctuation(self):
+        self.assertEqual(search.search('BP-1042')[0], [self.pad.pk])
+        self.assertEqual(search.search('bp1042')[0], [self.pad.pk])
+        self.assertEqual(search.search('4351233130')[0], [self.rotor.pk])
+
+    def test_manufacturer_and_specifications_are_searchable(self):
+        self.assertEqual(search.search('bosch')[0], [self.pad.pk])
+        self.assertEqual(search.search('diameter 296')[0], [self.rotor.pk])
+
+    def test_query_without_words_matches_nothing(self):
+        self.assertEqual(search.search('"*-'), ([], 0))
+
+    def test_signals_keep_the_index_in_step(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.retired.is_active = True
+            self.retired.save()
+            self.pad.is_active = False
+            self.pad.save()
+        self.assertEqual(search.search('ceramic')[0], [self.retired.pk, self.rotor.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.retired.delete()
+        self.assertEqual(search.search('ceramic')[0], [self.rotor.pk])
+
+    def test_search_page_lists_matches_in_rank_order(self):
+        response = self.client.get(reverse('products:search'), {'q': 'ceramic'})
+        self.assertEqual(list(response.context['products']), [self.pad, self.rotor])
+        self.assertEqual(response.context['total'], 2)
+        self.assertIsNone(response.context['next_page'])
+
+
+# ==================== INTERCHANGE ====================
+class InterchangeTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = make_category('Filters')
+        cls.oem = make_product('OEM Oil Filter', cls.category, product_type='OEM', part_number='90915-YZZD4')
+        cls.copy = make_product('Oil Filter', cls.category, part_number='PH-4967', oem_part_number='90915 yzzd4')
+        cls.other = make_product('Cabin Filter', cls.category, part_number='CF-10285')
+
+    def test_part_numbers_are_normalized(self):
+        self.assertEqual(normalize_part_number(' 90915-yzzd4 '), '90915YZZD4')
+        self.assertEqual(normalize_part_number(None), '')
+        self.assertEqual(self.copy.oem_part_number_key, '90915YZZD4')
+
+    def test_products_sharing_an_oem_number_share_a_group(self):
+        self.assertIsNotNone(self.oem.interchange_group)
+        self.assertEqual(self.copy.interchange_group, self.oem.interchange_group)
+        self.assertIsNone(self.other.interchange_group)
+
+    def test_lookup_by_oem_or_aftermarket_number(self):
+        both = {self.oem, self.copy}
+        self.assertEqual(set(interchangeable_products('90915-YZZD4')), both)
+        self.assertEqual(set(interchangeable_products('ph4967')), both)
+        self.assertEqual(set(interchangeable_products('CF 10285')), {self.other})
+        self.assertFalse(interchangeable_products('--').exists())
+
+    def test_prefix_lookup(self):
+        self.assertEqual(list(products_by_prefix('9091')), [self.oem, self.copy])
+        self.assertEqual(list(products_by_prefix('ph-49')), [self.copy])
+
+    def test_group_follows_a_changed_oem_number(self):
+        self.copy.oem_part_number = '04152-YZZA1'
+        self.copy.save()
+        self.assertEqual(self.copy.interchange_group.oem_number, '04152YZZA1')
+        self.copy.oem_part_number = ''
+        self.copy.save()
+        self.assertIsNone(Product.objects.get(pk=self.copy.pk).interchange_group)
+
+    def test_group_picked_by_hand_survives_other_edits(self):
+        group = InterchangeGroup.objects.create(oem_number='HAND-PICKED')
+        Product.objects.filter(pk=self.copy.pk).update(interchange_group=group)
+        product = Product.objects.get(pk=self.copy.pk)
+        product.unit_price = Decimal('12.50')
+        product.save()
+        self.assertEqual(Product.objects.get(pk=self.copy.pk).interchange_group, group)
+
+        # Loaded without the key fields, a save must not guess the old key
+        product = Product.objects.only('title', 'interchange_group').get(pk=self.copy.pk)
+        product.title = 'Oil Filter (renamed)'
+        product.save()
+        self.assertEqual(Product.objects.get(pk=self.copy.pk).interchange_group, group)
+
+    def test_part_lookup_endpoint(self):
+        response = self.client.get(reverse('products:part_lookup'), {'q': '90915YZZD4', 'prefix': '1'})
+        data = response.json()
+        self.assertEqual({part['sku'] for part in data['interchangeable']}, {self.oem.sku, self.copy.sku})
+        self.assertEqual([part['sku'] for part in data['prefix_matches']], [self.oem.sku, self.copy.sku])
+
+
+# ==================== CATEGORY TREE ====================
+class CategoryPathTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brakes = make_category('Brakes')
+        cls.pads = make_category('Pads', parent=cls.brakes)
+        cls.ceramic = make_category('Ceramic', parent=cls.pads)
+        cls.engine = make_category('Engine')
+
+    def refresh(self, *categories):
+        for category in categories:
+            category.refresh_from_db()
+
+    def test_paths_and_depths(self):
+        self.assertEqual(self.brakes.path, f'{self.brakes.pk:06d}/')
+        self.assertEqual(self.ceramic.path, f'{self.brakes.pk:06d}/{self.pads.pk:06d}/{self.ceramic.pk:06d}/')
+        self.assertEqual([self.brakes.depth, self.pads.depth, self.ceramic.depth], [0, 1, 2])
+        self.assertEqual(self.ceramic.get_ancestor_ids(), [self.brakes.pk, self.pads.pk, self.ceramic.pk])
+
+    def test_descendants_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(set(self.brakes.get_descendants()), {self.brakes, self.pads, self.ceramic})
+        self.assertEqual(set(self.pads.get_descendants(include_self=False)), {self.ceramic})
+
+    def test_moving_a_category_moves_its_subtree(self):
+        self.pads.parent = self.engine
+        self.pads.save()
+        self.refresh(self.ceramic)
+        self.assertEqual(self.ceramic.path, f'{self.engine.pk:06d}/{self.pads.pk:06d}/{self.ceramic.pk:06d}/')
+        self.assertEqual(self.ceramic.depth, 2)
+        self.assertEqual(set(self.brakes.get_descendants()), {self.brakes})
+
+        self.pads.parent = None
+        self.pads.save()
+        self.refresh(self.ceramic)
+        self.assertEqual(self.ceramic.path, f'{self.pads.pk:06d}/{self.ceramic.pk:06d}/')
+        self.assertEqual(self.ceramic.depth, 1)
+
+    def test_category_cannot_move_under_itself(self):
+        self.brakes.parent = self.ceramic
+        with self.assertRaises(ValidationError):
+            self.brakes.clean()
+        with self.assertRaises(ValueError):
+            self.brakes.save()
+
+    def test_cached_tree_walks_in_menu_order(self):
+        tree = get_category_tree()
+        self.assertEqual([node['name'] for node in tree.walk()], ['Brakes', 'Pads', 'Ceramic', 'Engine'])
+        self.assertEqual(set(tree.descendant_ids(self.pads.pk)), {self.pads.pk, self.ceramic.pk})
+        make_category('Wipers')
+        self.assertIn('wipers', get_category_tree().by_slug)
+
+
+# ==================== DETAIL CACHE ====================
+class ProductDetailCacheTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = make_vehicle()
+        cls.product = make_product('Strut Mount', make_category('Suspension'))
+        ProductFitment.objects.create(product=cls.product, vehicle=cls.vehicle, position='Front')
+
+    def test_second_read_comes_from_the_cache(self):
+        detail = get_product_detail(self.product.slug)
+        self.assertEqual(detail['fitments'][0]['model'], 'Camry')
+        with self.assertNumQueries(0):
+            self.assertEqual(get_product_detail(self.product.slug)['product'], self.product)
+
+    def test_child_changes_expire_the_page(self):
+        get_product_detail(self.product.slug)
+        ProductSpecification.objects.create(product=self.product, name='Weight', value='1.2', unit='kg')
+        self.assertEqual(len(get_product_detail(self.product.slug)['specifications']), 1)
+        ProductDocument.objects.create(product=self.product, document_type='INSTALL', title='Guide')
+        self.assertEqual(len(get_product_detail(self.product.slug)['documents']), 1)
+        ProductFitment.objects.filter(product=self.product).delete()
+        self.assertEqual(get_product_detail(self.product.slug)['fitments'], [])
+
+    def test_renamed_or_retired_product_leaves_its_old_url(self):
+        old_slug = self.product.slug
+        get_product_detail(old_slug)
+        self.product.slug = 'strut-mount-kit'
+        self.product.save()
+        self.assertIsNone(get_product_detail(old_slug))
+        self.assertEqual(get_product_detail('strut-mount-kit')['product'].pk, self.product.pk)
+
+        self.product.is_active = False
+        self.product.save()
+        response = self.client.get(reverse('products:product_detail', args=['strut-mount-kit']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_renamed_names_on_the_page_expire_it(self):
+        acme = Manufacturer.objects.create(name='Acme', slug='acme')
+        Product.objects.filter(pk=self.product.pk).update(manufacturer=acme)
+        get_product_detail(self.product.slug)
+
+        acme.name = 'Acme Parts'
+        acme.save()
+        self.assertEqual(get_product_detail(self.product.slug)['product'].manufacturer.name, 'Acme Parts')
+        category = self.product.category
+        category.name = 'Struts & Suspension'
+        category.save()
+        self.assertEqual(get_product_detail(self.product.slug)['product'].category.name, 'Struts & Suspension')
+
+        make, model = self.vehicle.model.make, self.vehicle.model
+        make.name = 'Toyota Motor'
+        make.save()
+        model.name = 'Camry Hybrid'
+        model.save()
+        self.vehicle.refresh_from_db()
+        self.vehicle.trim = 'XLE'
+        self.vehicle.save()
+        [fitment] = get_product_detail(self.product.slug)['fitments']
+        self.assertEqual((fitment['make'], fitment['model'], fitment['trim']), ('Toyota Motor', 'Camry Hybrid', 'XLE'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            acme.delete()
+        self.assertIsNone(get_product_detail(self.product.slug)['product'].manufacturer)
+
+    def test_fit_badge_follows_the_session_not_the_cache(self):
+        url = self.product.get_absolute_url()
+        self.assertFalse(self.client.get(url).context['fits_vehicle'])
+        session = self.client.session
+        session['selected_vehicle_id'] = self.vehicle.pk
+        session.save()
+        self.assertTrue(self.client.get(url).context['fits_vehicle'])
+
+
+# ==================== IMPORT ====================
+class FeedTestMixin:
+    """Writes feeds to a temporary directory and runs an import command on them"""
+    command = None
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def run_import(self, text, name='feed.csv', *args):
+        path = self.directory / name
+        path.write_text(textwrap.dedent(text).lstrip(), encoding='utf-8')
+        stdout, stderr = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(self.command, str(path), *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+
+class ImportCatalogTests(FeedTestMixin, CatalogTestCase):
+    command = 'import_catalog'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brakes = make_category('Brakes')
+        cls.pads = make_category('Pads', parent=cls.brakes)
+
+    def test_creates_products_and_skips_bad_rows(self):
+        stdout, stderr = self.run_import("""
+            sku,title,category,unit_price,manufacturer,oem_part_number,specifications
+            BP-1,Ceramic Pad,pads,24.99,Acme Co,04465-33450,"{""Thickness"": ""17 mm""}"
+            BP-2,Metallic Pad,Pads,19.99,acme co,04465 33450,
+            BP-3,Lost Pad,wipers,9.99,,,
+            BP-4,Free Pad,pads,,,,
+        """)
+        self.assertIn('2 new, 0 updated, 2 skipped', stdout)
+        self.assertIn("Line 4: unknown category 'wipers'", stderr)
+        self.assertIn('Line 5: unit_price is required', stderr)
+
+        ceramic, metallic = Product.objects.filter(sku__in=['BP-1', 'BP-2']).order_by('sku')
+        self.assertEqual(ceramic.manufacturer, metallic.manufacturer)
+        self.assertEqual(Manufacturer.objects.get().slug, 'acme-co')
+        self.assertEqual(ceramic.interchange_group, metallic.interchange_group)
+        spec = ceramic.specifications.get()
+        self.assertEqual((spec.attribute, spec.numeric_value, spec.normalized_unit), ('thickness', 17.0, 'mm'))
+        self.brakes.refresh_from_db()
+        self.assertEqual(self.brakes.product_count, 2)
+        self.assertEqual(search.search('ceramic')[0], [ceramic.pk])
+
+    def test_known_skus_are_updated_in_place(self):
+        self.run_import("""
+            {"sku": "BP-1", "title": "Ceramic Pad", "category": "pads", "unit_price": "24.99", "specifications": [{"name": "Thickness", "value": "17", "unit": "mm"}]}
+        """, 'feed.jsonl')
+        product = Product.objects.get(sku='BP-1')
+        get_product_detail(product.slug)
+
+        stdout, _ = self.run_import("""
+            {"sku": "BP-1", "title": "Ceramic Pad", "category": "pads", "unit_price": "22.50", "inventory": 4, "specifications": {"Thickness": "0.7 in"}}
+        """, 'feed.jsonl')
+        self.assertIn('0 new, 1 updated', stdout)
+        updated = Product.objects.get(sku='BP-1')
+        self.assertEqual((updated.pk, updated.slug), (product.pk, product.slug))
+        self.assertEqual((updated.unit_price, updated.inventory), (Decimal('22.50'), 4))
+        self.assertEqual(list(updated.specifications.values_list('value', flat=True)), ['0.7 in'])
+        self.assertEqual(get_product_detail(product.slug)['product'].unit_price, Decimal('22.50'))
+
+    def test_columns_missing_from_the_feed_are_kept(self):
+        acme = Manufacturer.objects.create(name='Acme', slug='acme')
+        group = InterchangeGroup.objects.create(oem_number='PICKED')
+        product = make_product('Pad', self.pads, sku='BP-1', inventory=40, manufacturer=acme, part_number='AC-1',
+                               oem_part_number='04465-33450', description='Quiet', is_active=False)
+        Product.objects.filter(pk=product.pk).update(interchange_group=group)
+
+        stdout, _ = self.run_import("""
+            sku,title,category,unit_price
+            BP-1,Pad,pads,30
+        """)
+        self.assertIn('0 new, 1 updated', stdout)
+        product = Product.objects.get(pk=product.pk)
+        self.assertEqual(product.unit_price, Decimal('30'))
+        self.assertEqual(
+            (product.inventory, product.manufacturer, product.part_number, product.oem_part_number,
+             product.description, product.is_active, product.interchange_group),
+            (40, acme, 'AC-1', '04465-33450', 'Quiet', False, group),
+        )
+
+        self.run_import("""
+            {"sku": "BP-1", "title": "Pad", "category": "pads", "unit_price": "30", "oem_part_number": "04465 33450"}
+        """, 'feed.jsonl')
+        self.assertEqual(Product.objects.get(pk=product.pk).interchange_group, group)
+        self.run_import("""
+            {"sku": "BP-1", "title": "Pad", "category": "pads", "unit_price": "30", "oem_part_number": "04465-99999"}
+        """, 'feed.jsonl')
+        self.assertEqual(Product.objects.get(pk=product.pk).interchange_group.oem_number, '0446599999')
+
+    def test_bad_json_lines_are_skipped(self):
+        stdout, stderr = self.run_import("""
+            {"sku": "BP-1", "title": "Pad", "category": "pads", "unit_price": "1"}
+            [1, 2]
+            {"sku": "BP-2",
+            {"sku": "BP-3", "title": "Pad", "category": "pads", "unit_price": "1"}
+        """, 'feed.jsonl')
+        self.assertIn('2 new, 0 updated, 2 skipped', stdout)
+        self.assertIn('Line 2: expected a JSON object, got list', stderr)
+        self.assertIn('Line 3: invalid JSON', stderr)
+
+    def test_clashing_slugs_are_numbered(self):
+        make_product('Pad', self.pads, sku='X', slug='pad-x')
+        Manufacturer.objects.create(name='Acme', slug='acme-co')
+        self.run_import("""
+            sku,title,category,unit_price,manufacturer
+            x,Pad,pads,1,Acme Co
+            x-1,Pad,pads,1,
+            1,Pad x,pads,1,
+        """)
+        slugs = dict(Product.objects.values_list('sku', 'slug'))
+        self.assertEqual(slugs, {'X': 'pad-x', 'x': 'pad-x-2', 'x-1': 'pad-x-1', '1': 'pad-x-1-2'})
+        self.assertEqual(Manufacturer.objects.get(name='Acme Co').slug, 'acme-co-2')
+
+    def test_csv_without_a_sku_column_is_refused(self):
+        with self.assertRaisesMessage(CommandError, "'sku'"):
+            self.run_import("""
+                part,title,category,unit_price
+                BP-1,Ceramic Pad,pads,24.99
+            """)
+
+
+class ImportFitmentsTests(FeedTestMixin, CatalogTestCase):
+    command = 'import_fitments'
+
+    @classmethod
+    def setUpTestData(cls):
+        trims = [(2015, 'LE', '2.5L'), (2016, 'LE', '2.5L'), (2017, 'LE', '2.5L'), (2017, 'XSE', '3.5L V6')]
+        cls.camry = {(year, trim): make_vehicle(year=year, trim=trim, engine=engine) for year, trim, engine in trims}
+        category = make_category('Brakes')
+        cls.pad = make_product('Pad', category, sku='PAD')
+        cls.rotor = make_product('Rotor', category, sku='ROTOR')
+
+    def fitted(self, product):
+        return {(fitment.vehicle.year, fitment.vehicle.trim) for fitment in product.fitments.select_related('vehicle')}
+
+    def test_year_ranges_trims_and_engines_expand_to_vehicles(self):
+        stdout, stderr = self.run_import("""
+            sku,make,model,year_from,year_to,trim,engine,position
+            PAD,Toyota,Camry,2015,2016,,,Front
+            PAD,toyota,camry,2016,2017,le,,Front
+            ROTOR,Toyota,Camry,2017,,,3.5l v6,Rear
+            ROTOR,Toyota,Camry,2018,2016,,,
+            NOPE,Toyota,Camry,2017,,,,
+            PAD,Honda,Civic,2017,,,,
+        """)
+        self.assertEqual(self.fitted(self.pad), {(2015, 'LE'), (2016, 'LE'), (2017, 'LE')})
+        self.assertEqual(self.fitted(self.rotor), {(2017, 'XSE')})
+        self.assertIn('Read 6 rows (3 skipped)', stdout)
+        self.assertIn('4 fitments added', stdout)
+        self.assertIn('Line 5: year range 2018-2016 is reversed', stderr)
+        self.assertIn("Line 6: unknown sku 'NOPE'", stderr)
+        self.assertIn("Line 7: unknown vehicle 'Honda' 'Civic'", stderr)
+
+        vehicle = self.camry[2016, 'LE']
+        vehicle.refresh_from_db()
+        self.assertEqual(vehicle.parts_count, 1)
+        self.assertTrue(catalog_index.fits(self.pad.pk, vehicle.pk))
+
+    def test_feed_replaces_the_fitments_of_the_products_it_lists(self):
+        for vehicle in self.camry.values():
+            ProductFitment.objects.create(product=self.pad, vehicle=vehicle)
+        ProductFitment.objects.create(product=self.rotor, vehicle=self.camry[2015, 'LE'])
+        catalog_index.fits(self.pad.pk, self.camry[2017, 'XSE'].pk)
+
+        stdout, _ = self.run_import("""
+            sku,make,model,year,position
+            PAD,Toyota,Camry,2015,Rear
+            PAD,Toyota,Camry,2016,
+        """)
+        self.assertIn('0 fitments added, 1 updated, 2 removed', stdout)
+        self.assertEqual(self.fitted(self.pad), {(2015, 'LE'), (2016, 'LE')})
+        self.assertEqual(self.fitted(self.rotor), {(2015, 'LE')})
+        self.assertFalse(catalog_index.fits(self.pad.pk, self.camry[2017, 'XSE'].pk))
+        vehicle = self.camry[2017, 'XSE']
+        vehicle.refresh_from_db()
+        self.assertEqual(vehicle.parts_count, 0)
+
+    def test_keep_existing_only_adds(self):
+        ProductFitment.objects.create(product=self.pad, vehicle=self.camry[2017, 'XSE'])
+        self.run_import("""
+            sku,make,model,year
+            PAD,Toyota,Camry,2015
+        """, 'feed.csv', '--keep-existing')
+        self.assertEqual(self.fitted(self.pad), {(2015, 'LE'), (2017, 'XSE')})
+
+    def test_product_split_across_batches_is_merged_not_replaced(self):
+        self.run_import("""
+            {"sku": "PAD", "make": "Toyota", "model": "Camry", "year": 2015}
+            {"sku": "ROTOR", "make": "Toyota", "model": "Camry", "year": 2015}
+            {"sku": "PAD", "make": "Toyota", "model": "Camry", "year": 2016}
+        """, 'feed.jsonl', '--batch-size', '1')
+        self.assertEqual(self.fitted(self.pad), {(2015, 'LE'), (2016, 'LE')})
+
+    def test_csv_needs_sku_make_and_model_columns(self):
+        with self.assertRaisesMessage(CommandError, "'make'"):
+            self.run_import("""
+                sku,brand,model,year
+                PAD,Toyota,Camry,2015
+            """)
+
+
+# ==================== SPECIFICATIONS ====================
+class SpecificationRangeTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = make_category('Rotors')
+        cls.small = make_product('Small Rotor', category)
+        cls.large = make_product('Large Rotor', category)
+        cls.odd = make_product('Odd Rotor', category)
+        ProductSpecification.objects.create(product=cls.small, name='Diameter', value='280', unit='mm')
+        ProductSpecification.objects.create(product=cls.large, name='diameter', value='12.6"')
+        ProductSpecification.objects.create(product=cls.odd, name='Diameter', value='280x22')
+
+    def test_values_are_parsed_into_base_units(self):
+        self.assertEqual(parse_value('320', 'mm'), (320.0, 'mm'))
+        self.assertEqual(parse_value('14mm'), (14.0, 'mm'))
+        self.assertEqual(parse_value('2,5', 'kg'), (2500.0, 'g'))
+        number, unit = parse_value('35', 'lb-ft')
+        self.assertAlmostEqual(number, 47.4536, places=3)
+        self.assertEqual(unit, 'Nm')
+        self.assertEqual(parse_value('5'), (5.0, ''))
+        for value, unit in [('Ceramic', ''), ('55/60', ''), ('12 mm', 'in'), ('3', 'furlong')]:
+            with self.subTest(value=value, unit=unit):
+                self.assertEqual(parse_value(value, unit), (None, ''))
+
+    def test_specifications_store_the_typed_copy(self):
+        spec = self.large.specifications.get()
+        self.assertEqual(spec.attribute, 'diameter')
+        self.assertAlmostEqual(spec.numeric_value, 320.04)
+        self.assertEqual(spec.normalized_unit, 'mm')
+        self.assertIsNone(self.odd.specifications.get().numeric_value)
+
+    def test_spec_filters_compare_across_units(self):
+        self.assertEqual(parse_spec_filter('Diameter:12:13:in').attribute, 'diameter')
+        self.assertIsNone(parse_spec_filter('diameter::'))
+        self.assertIsNone(parse_spec_filter('diameter:1:2:parsecs'))
+
+        cases = {
+            'diameter:300:330:mm': {self.large.pk},
+            'diameter:10:12:in': {self.small.pk},
+            'diameter:270:': {self.small.pk, self.large.pk},
+            'diameter:300:330:kg': set(),
+        }
+        for param, expected in cases.items():
+            with self.subTest(param=param):
+                self.assertEqual(FacetQuery(QueryDict(f'spec={param}')).spec_product_ids(), expected)
+
+    def test_listing_filters_on_spec_ranges(self):
+        response = self.client.get(reverse('products:product_list'), {'spec': 'diameter:300::mm'})
+        self.assertEqual([product.pk for product in response.context['page']], [self.large.pk])
+        self.assertEqual(response.context['spec_filters'][0]['label'], 'Diameter 300– mm')
+
+
+# ==================== COUNTERS ====================
+class CategoryCounterTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.brakes = make_category('Brakes')
+        cls.pads = make_category('Pads', parent=cls.brakes)
+        cls.engine = make_category('Engine')
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'product_count'))
+
+    def test_counts_include_subcategories(self):
+        make_product('Pad', self.pads)
+        make_product('Rotor', self.brakes)
+        make_product('Old Pad', self.pads, is_active=False)
+        self.assertEqual(self.counts(), {'Brakes': 2, 'Pads': 1, 'Engine': 0})
+
+    def test_counts_follow_product_changes(self):
+        pad = make_product('Pad', self.pads)
+        rotor = make_product('Rotor', self.brakes)
+        pad.category = self.engine
+        pad.save()
+        rotor.is_active = False
+        rotor.save()
+        self.assertEqual(self.counts(), {'Brakes': 0, 'Pads': 0, 'Engine': 1})
+        pad.delete()
+        self.assertEqual(self.counts(), {'Brakes': 0, 'Pads': 0, 'Engine': 0})
+
+    def test_moving_a_category_moves_its_counts(self):
+        make_product('Pad', self.pads)
+        self.pads.parent = self.engine
+        self.pads.save()
+        self.assertEqual(self.counts(), {'Brakes': 0, 'Pads': 1, 'Engine': 1})
+        self.assertEqual(get_category_tree().nodes[self.engine.pk]['product_count'], 1)
+
+    def test_refresh_updates_only_drifted_categories(self):
+        make_product('Pad', self.pads)
+        Category.objects.filter(pk=self.brakes.pk).update(product_count=9)
+        self.assertEqual(refresh_category_counts(), 1)
+        self.assertEqual(self.counts(), {'Brakes': 1, 'Pads': 1, 'Engine': 0})
+        self.assertEqual(refresh_category_counts(), 0)
 
-# Create your tests here.
+    def test_recount_command_reports_drift(self):
+        vehicle = make_vehicle()
+        ProductFitment.objects.create(product=make_product('Pad', self.pads), vehicle=vehicle)
+        Vehicle.objects.update(parts_count=0)
+        stdout = StringIO()
+        call_command('recount_counters', stdout=stdout)
+        self.assertIn('vehicles.parts_count: corrected 1 of 1', stdout.getvalue())
+        self.assertIn('Categories.product_count: all 3 correct', stdout.getvalue())
+        vehicle.refresh_from_db()
+        self.assertEqual(vehicle.parts_count, 1)
@@ -0,0 +1,90 @@
+"""
+Parsing specification values into numbers in a base unit.
+
+ProductSpecification keeps the value and unit as entered ("320" "mm",
+"0.044" "in", "14mm" ""). For range filters each value is also stored as a
+number converted to the base unit of its dimension, so "12.6 in" and
+"320 mm" compare directly. Values that are not a single number (sizes like
+"250x180x30", "55/60", "Ceramic") get no numeric value.
+"""
+import re
+
+from django.utils.text import slugify
+
+# Unit spelling -> (base unit, factor to the base unit)
+UNITS = {
+    # length
+    'mm': ('mm', 1.0),
+    'cm': ('mm', 10.0),
+    'm': ('mm', 1000.0),
+    'in': ('mm', 25.4),
+    'inch': ('mm', 25.4),
+    'inches': ('mm', 25.4),
+    '"': ('mm', 25.4),
+    'ft': ('mm', 304.8),
+    # distance (service intervals)
+    'km': ('km', 1.0),
+    'mi': ('km', 1.609344),
+    'mile': ('km', 1.609344),
+    'miles': ('km', 1.609344),
+    # mass
+    'g': ('g', 1.0),
+    'kg': ('g', 1000.0),
+    'oz': ('g', 28.349523125),
+    'lb': ('g', 453.59237),
+    'lbs': ('g', 453.59237),
+    # volume
+    'ml': ('ml', 1.0),
+    'l': ('ml', 1000.0),
+    'qt': ('ml', 946.352946),
+    'gal': ('ml', 3785.411784),
+    # electrical
+    'w': ('W', 1.0),
+    'kw': ('W', 1000.0),
+    'v': ('V', 1.0),
+    'a': ('A', 1.0),
+    'ah': ('Ah', 1.0),
+    # pressure
+    'kpa': ('kPa', 1.0),
+    'bar': ('kPa', 100.0),
+    'psi': ('kPa', 6.894757),
+    # torque
+    'nm': ('Nm', 1.0),
+    'lb-ft': ('Nm', 1.3558179),
+    'ft-lb': ('Nm', 1.3558179),
+}
+
+# "320", "0.044", "-5", "14mm", "12.5 in"
+VALUE_RE = re.compile(r'^\s*([-+]?\d+(?:[.,]\d+)?)\s*([^\d\s].*?)?\s*$')
+
+
+def normalize_attribute(name):
+    """'Hat Height' -> 'hat-height', the key range filters are written against"""
+    return slugify(name)[:100]
+
+
+def to_base(number, unit):
+    """(number in the base unit, base unit), or None if the unit is unknown"""
+    unit = (unit or '').strip()
+    if not unit:
+        return number, ''
+    known = UNITS.get(unit.lower())
+    if known is None:
+        return None
+    base, factor = known
+    return number * factor, base
+
+
+def parse_value(value, unit=''):
+    """(number, base unit) for a spec value and unit, or (None, '') if it is not numeric"""
+    match = VALUE_RE.match(value or '')
+    if match is None:
+        return None, ''
+    number = float(match.group(1).replace(',', '.'))
+    inline_unit = match.group(2) or ''
+    if inline_unit and unit:
+        return None, ''
+    converted = to_base(number, inline_unit or unit)
+    if converted is None:
+        return None, ''
+    return converted
@@ -6,6 +6,8 @@ app_name = 'products'
 urlpatterns = [
     path('', views.home, name='home'),
     path('products/', views.product_list, name='product_list'),
+    path('search/', views.product_search, name='search'),
+    path('parts/lookup/', views.part_lookup, name='part_lookup'),
     path('products/<slug:slug>/', views.product_detail, name='product_detail'),
     # path('categories/<slug:slug>/', views.category_products, name='category_products'),
 ]
\ No newline at end of file
@@ -1,10 +1,26 @@
-from django.shortcuts import render, get_object_or_404
-from .models import Product, Category
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from .catalog_index import catalog_index
+from .category_tree import get_category_tree
+from .detail_cache import get_product_detail
+from .facets import FacetQuery
+from .models import Product
+from .pagination import PER_PAGE, paginate_keys, paginate_queryset
+from . import search
+from .interchange import interchangeable_products, products_by_prefix
+
+
+def selected_vehicle_id(request):
+    """Vehicle picked in select_vehicle, as an int (or None)"""
+    try:
+        return int(request.session.get('selected_vehicle_id'))
+    except (TypeError, ValueError):
+        return None
 
 def home(request):
     """Homepage with featured products"""
-    featured_products = Product.objects.filter(is_featured=True, is_active=True)[:8]
-    categories = Category.objects.filter(parent=None)
+    featured_products = Product.objects.filter(is_featured=True, is_active=True).select_related('category')[:8]
+    categories = get_category_tree().roots
     
     context = {
         'featured_products': featured_products,
@@ -13,39 +29,111 @@ def home(request):
     return render(request, 'products/home.html', context)
 
 def product_list(request):
-    """All products with filtering"""
-    products = Product.objects.filter(is_active=True)
+    """All products with faceted filtering, one keyset page at a time"""
+    products = Product.objects.filter(is_active=True).select_related('category', 'manufacturer')
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    
+    facets = FacetQuery(request.GET)
+    if facets.unknown:
+        raise Http404("No such category or manufacturer")
     
-    # Filter by category
-    category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+    # Filter by vehicle (if customer has selected one) unless they asked for everything
+    vehicle_id = selected_vehicle_id(request)
+    search = catalog_index.facet_search(
+        facets.selected,
+        vehicle_id=vehicle_id,
+        min_price=facets.min_price,
+        max_price=facets.max_price,
+        product_ids=facets.spec_product_ids(),
+        all_vehicles=facets.all_vehicles,
+    )
     
-    # Filter by vehicle (if customer has selected one)
-    if request.session.get('selected_vehicle_id'):
-        vehicle_id = request.session['selected_vehicle_id']
-        products = products.filter(fitments__vehicle_id=vehicle_id).distinct()
+    if search.keys is None:
+        # Nothing filtered: page straight through the listing index
+        page = paginate_queryset(products, after=after, before=before, total_count=search.total)
+    else:
+        page = paginate_keys(search.keys, products, after=after, before=before)
     
+    categories = facets.categories
     context = {
-        'products': products,
+        'page': page,
+        'facet_groups': facets.groups(search.counts),
+        'spec_filters': facets.spec_options(),
+        'fit_counts': search.counts.get('fit'),
+        'price_form_params': facets.other_params('min_price', 'max_price'),
+        'current_category': categories[0] if len(categories) == 1 else None,
     }
     return render(request, 'products/product_list.html', context)
 
-def product_detail(request, slug):
-    """Product detail page"""
-    product = get_object_or_404(Product, slug=slug, is_active=True)
+def product_search(request):
+    """Full-text search over the catalog, best matches first"""
+    query = request.GET.get('q', '').strip()
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page_number = 1
     
-    # Check if fits customer's vehicle
-    fits_vehicle = False
-    if request.session.get('selected_vehicle_id'):
-        vehicle_id = request.session['selected_vehicle_id']
-        fits_vehicle = product.fitments.filter(vehicle_id=vehicle_id).exists()
+    products = []
+    total = 0
+    if query:
+        product_ids, total = search.search(query, limit=PER_PAGE, offset=(page_number - 1) * PER_PAGE)
+        found = Product.objects.select_related('category', 'manufacturer').in_bulk(product_ids)
+        products = [found[pk] for pk in product_ids if pk in found]
     
+    context = {
+        'query': query,
+        'products': products,
+        'total': total,
+        'page_number': page_number,
+        'previous_page': page_number - 1 if page_number > 1 else None,
+        'next_page': page_number + 1 if page_number * PER_PAGE < total else None,
+    }
+    return render(request, 'products/search.html', context)
+
+def _part_json(product):
+    return {
+        'id': product.id,
+        'sku': product.sku,
+        'title': product.title,
+        'part_number': product.part_number,
+        'oem_part_number': product.oem_part_number,
+        'manufacturer': product.manufacturer.name if product.manufacturer else None,
+        'product_type': product.product_type,
+        'unit_price': str(product.unit_price),
+        'inventory': product.inventory,
+        'url': product.get_absolute_url(),
+    }
+
+def part_lookup(request):
+    """Counter lookup: parts interchangeable with a part number, plus prefix matches"""
+    number = request.GET.get('q', '')
+    interchangeable = interchangeable_products(number)
+    data = {
+        'query': number,
+        'interchangeable': [_part_json(product) for product in interchangeable],
+    }
+    if request.GET.get('prefix'):
+        data['prefix_matches'] = [_part_json(product) for product in products_by_prefix(number)]
+    return JsonResponse(data)
+
+def product_detail(request, slug):
+    """Product detail page"""
+    detail = get_product_detail(slug)
+    if detail is None:
+        raise Http404("No product matches the given query.")
+    product = detail['product']
+
+    # Only the compatibility badge depends on the session
+    vehicle_id = selected_vehicle_id(request)
+    fits_vehicle = bool(vehicle_id) and catalog_index.fits(product.pk, vehicle_id)
+
     context = {
         'product': product,
         'fits_vehicle': fits_vehicle,
-        'specifications': product.specifications.all(),
-        'images': product.images.all(),
+        'specifications': detail['specifications'],
+        'documents': detail['documents'],
+        'fitments': detail['fitments'],
+        'detail_version': detail['version'],
     }
     return render(request, 'products/product_detail.html', context)
\ No newline at end of file
@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from django.db.models import Count
 from .models import Make, Model, Vehicle
 
 
@@ -14,42 +13,39 @@ class MakeAdmin(admin.ModelAdmin):
     
     
     def model_count(self, obj):
-        count = obj.models.count()
-        return format_html('<b style="color: #007bff;">{}</b> models', count)
+        return format_html('<b style="color: #007bff;">{}</b> models', obj.models_count)
     model_count.short_description = 'Total Models'
-    
-    def get_queryset(self, request):
-        """Optimize queries"""
-        qs = super().get_queryset(request)
-        return qs.annotate(models_count=Count('models'))
+    model_count.admin_order_field = 'models_count'
 
 
 @admin.register(Model)
 class ModelAdmin(admin.ModelAdmin):
     list_display = ['name', 'make_link', 'slug', 'vehicle_count']
     list_filter = ['make']
-    search_fields = ['name', 'make__name']
+    search_fields = ['label']
     prepopulated_fields = {'slug': ('name',)}
     autocomplete_fields = ['make']
     ordering = ['make__name', 'name']
+    list_select_related = ['make']
     
     def make_link(self, obj):
         """Clickable make name"""
         return format_html(
             '<a href="/admin/vehicles/make/{}/change/">{}</a>',
-            obj.make.id,
+            obj.make_id,
             obj.make.name
         )
     make_link.short_description = 'Make'
     
     def vehicle_count(self, obj):
-        count = obj.vehicles.count()
+        count = obj.vehicles_count
         color = 'green' if count > 0 else 'gray'
         return format_html(
             '<span style="color: {}; font-weight: bold;">{} years</span>',
             color, count
         )
     vehicle_count.short_description = 'Years Available'
+    vehicle_count.admin_order_field = 'vehicles_count'
 
 
 @admin.register(Vehicle)
@@ -62,7 +58,7 @@ class VehicleAdmin(admin.ModelAdmin):
         'trim',
         'engine',
         'body_type',
-        # 'parts_count'
+        'parts_count'
     ]
     
     list_filter = [
@@ -72,11 +68,9 @@ class VehicleAdmin(admin.ModelAdmin):
         'trim'
     ]
     
+    # label holds year, make, model and trim, so searching it needs no joins
     search_fields = [
-        'model__name',
-        'model__make__name',
-        'year',
-        'trim',
+        'label',
         'engine'
     ]
     
@@ -94,6 +88,7 @@ class VehicleAdmin(admin.ModelAdmin):
     
     ordering = ['-year', 'model__make__name', 'model__name', 'trim']
     list_per_page = 50
+    list_select_related = ['model__make']
     
     def display_name(self, obj):
         icon = '🚗'
@@ -114,24 +109,18 @@ class VehicleAdmin(admin.ModelAdmin):
     get_model_name.short_description = 'Model'
     get_model_name.admin_order_field = 'model__name'
     
-    # def parts_count(self, obj):
-    #     count = obj.compatible_products.count()
-    #     if count > 20:
-    #         color = 'green'
-    #     elif count > 0:
-    #         color = 'orange'
-    #     else:
-    #         color = 'red'
+    def parts_count(self, obj):
+        count = obj.parts_count
+        if count > 20:
+            color = 'green'
+        elif count > 0:
+            color = 'orange'
+        else:
+            color = 'red'
         
-    #     return format_html(
-    #         '<span style="color: {}; font-weight: bold;">{}</span>',
-    #         color, count
-    #     )
-    # parts_count.short_description = 'Parts'
-    
-    # def get_queryset(self, request):
-    #     """Optimize database queries"""
-    #     qs = super().get_queryset(request)
-    #     return qs.select_related('model', 'model__make').annotate(
-    #         parts_count=Count('compatible_products')
-    #     )
+        return format_html(
+            '<span style="color: {}; font-weight: bold;">{}</span>',
+            color, count
+        )
+    parts_count.short_description = 'Parts'
+    parts_count.admin_order_field = 'parts_count'
@@ -0,0 +1,53 @@
+"""
+Stored counters for the vehicle catalog.
+
+Make.models_count, Model.vehicles_count and Vehicle.parts_count let admin
+lists and navigation show sizes without aggregating over the child tables.
+Signals move them by one with an F() UPDATE as rows are added, moved or
+deleted; bulk writers call the refresh_* functions, which recount the
+given rows (or all of them) with one UPDATE and a correlated subquery.
+The recount_counters command runs every refresh to correct any drift.
+"""
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def adjust(model, pk, field, delta):
+    """Add delta to one row's counter without reading it"""
+    if pk is not None and delta:
+        model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def count_of(queryset):
+    """COUNT(*) of a correlated queryset, usable as an UPDATE value"""
+    counted = queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count')
+    return Coalesce(Subquery(counted), Value(0), output_field=IntegerField())
+
+
+def _scope(queryset, pks):
+    return queryset if pks is None else queryset.filter(pk__in=pks)
+
+
+def refresh_parts_counts(vehicle_ids=None):
+    from products.models import ProductFitment
+    from .models import Vehicle
+
+    return _scope(Vehicle.objects.all(), vehicle_ids).update(
+        parts_count=count_of(ProductFitment.objects.filter(vehicle_id=OuterRef('pk'))),
+    )
+
+
+def refresh_vehicles_counts(model_ids=None):
+    from .models import Model, Vehicle
+
+    return _scope(Model.objects.all(), model_ids).update(
+        vehicles_count=count_of(Vehicle.objects.filter(model_id=OuterRef('pk'))),
+    )
+
+
+def refresh_models_counts(make_ids=None):
+    from .models import Make, Model
+
+    return _scope(Make.objects.all(), make_ids).update(
+        models_count=count_of(Model.objects.filter(make_id=OuterRef('pk'))),
+    )
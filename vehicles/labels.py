@@ -0,0 +1,38 @@
+"""
+Stored display labels for models and vehicles.
+
+Model.label ("Toyota Camry") and Vehicle.label ("2018 Toyota Camry LE") are
+written by save() so rendering a vehicle never walks vehicle -> model ->
+make. Renaming a Make or Model rewrites the labels below it with
+refresh_labels(), two UPDATEs computed in SQL however many vehicles there
+are.
+"""
+from django.db.models import Case, CharField, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Concat
+
+
+def model_label(make_name, model_name):
+    return f"{make_name} {model_name}"
+
+
+def vehicle_label(year, model_label, trim=''):
+    trim_text = f" {trim}" if trim else ""
+    return f"{year} {model_label}{trim_text}"
+
+
+def refresh_labels(makes=(), models=()):
+    """Rewrite the labels of the given makes' and models' models and vehicles"""
+    from .models import Make, Model, Vehicle
+
+    make_name = Subquery(Make.objects.filter(pk=OuterRef('make_id')).values('name')[:1])
+    Model.objects.filter(Q(make_id__in=makes) | Q(pk__in=models)).update(
+        label=Concat(make_name, Value(' '), F('name'), output_field=CharField()),
+    )
+    label = Subquery(Model.objects.filter(pk=OuterRef('model_id')).values('label')[:1])
+    return Vehicle.objects.filter(Q(model__make_id__in=makes) | Q(model_id__in=models)).update(
+        label=Concat(
+            Cast('year', CharField()), Value(' '), label,
+            Case(When(trim='', then=Value('')), default=Concat(Value(' '), F('trim'))),
+            output_field=CharField(),
+        ),
+    )
@@ -0,0 +1,78 @@
+# vehicles/management/commands/decode_vins.py
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from customers.models import Customer, CustomerVehicle
+from vehicles.vin import resolve_vins
+
+
+class Command(BaseCommand):
+    help = ('Decodes a list of VINs (one per line, or the first column of a CSV) offline, matches them '
+            'to vehicles and writes the result as CSV. With --customer the matches go into their garage.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File of VINs, '-' for stdin")
+        parser.add_argument('--customer', help='Username whose garage the matched vehicles are added to')
+
+    def handle(self, *args, **options):
+        customer = None
+        if options['customer']:
+            customer = Customer.objects.filter(user__username=options['customer']).first()
+            if customer is None:
+                raise CommandError(f"No customer with username {options['customer']!r}")
+
+        vins = self._read(options['path'])
+        start = time.perf_counter()
+        results = resolve_vins(vins)
+        elapsed = time.perf_counter() - start
+
+        writer = csv.writer(self.stdout)
+        writer.writerow(['vin', 'status', 'make', 'model', 'year', 'vehicle_id', 'vehicle'])
+        counts = {'matched': 0, 'ambiguous': 0, 'unknown': 0, 'invalid': 0}
+        garage = []
+        for vin, decoded, vehicles, error in results:
+            if decoded is None:
+                status = 'invalid'
+                writer.writerow([vin, status, '', '', '', '', error])
+            else:
+                status = 'matched' if len(vehicles) == 1 else 'ambiguous' if vehicles else 'unknown'
+                vehicle = vehicles[0] if len(vehicles) == 1 else None
+                writer.writerow([
+                    decoded.vin, status, decoded.make or '', decoded.model or '', decoded.year or '',
+                    vehicle['id'] if vehicle else '',
+                    vehicle['label'] if vehicle else ' | '.join(candidate['label'] for candidate in vehicles),
+                ])
+                if vehicle and customer:
+                    garage.append(CustomerVehicle(customer=customer, vehicle_id=vehicle['id'], vin=decoded.vin))
+            counts[status] += 1
+
+        if customer and garage:
+            # A garage holds each vehicle once, the first VIN for it wins
+            existing = set(customer.vehicles.values_list('vehicle_id', flat=True))
+            new = {}
+            for customer_vehicle in garage:
+                if customer_vehicle.vehicle_id not in existing:
+                    new.setdefault(customer_vehicle.vehicle_id, customer_vehicle)
+            garage = list(new.values())
+            CustomerVehicle.objects.bulk_create(garage, ignore_conflicts=True, batch_size=1000)
+
+        self.stderr.write(self.style.SUCCESS(
+            f"Decoded {len(results)} VINs in {elapsed * 1000:.0f}ms: {counts['matched']} matched, "
+            f"{counts['ambiguous']} ambiguous, {counts['unknown']} unknown, {counts['invalid']} invalid"
+            + (f", {len(garage)} added to {options['customer']}'s garage" if customer else '')
+        ))
+
+    def _read(self, path):
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            vins = []
+            for row in csv.reader(stream):
+                if not row or not row[0].strip() or row[0].strip().lower() == 'vin':
+                    continue
+                vins.append(row[0].strip())
+            return vins
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:25
+
+from django.db import migrations, models
+
+from vehicles.labels import model_label, vehicle_label
+
+
+def backfill_labels(apps, schema_editor):
+    Model = apps.get_model('vehicles', 'Model')
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+
+    models_ = list(Model.objects.select_related('make'))
+    for model in models_:
+        model.label = model_label(model.make.name, model.name)
+    Model.objects.bulk_update(models_, ['label'], batch_size=1000)
+
+    labels = {model.pk: model.label for model in models_}
+    vehicles = list(Vehicle.objects.only('model_id', 'year', 'trim'))
+    for vehicle in vehicles:
+        vehicle.label = vehicle_label(vehicle.year, labels[vehicle.model_id], vehicle.trim)
+    Vehicle.objects.bulk_update(vehicles, ['label'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='model',
+            name='label',
+            field=models.CharField(blank=True, editable=False, max_length=201),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='label',
+            field=models.CharField(blank=True, editable=False, max_length=320),
+        ),
+        migrations.RunPython(backfill_labels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count(queryset):
+    counted = queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count')
+    return Coalesce(Subquery(counted), Value(0), output_field=IntegerField())
+
+
+def backfill_counters(apps, schema_editor):
+    Make = apps.get_model('vehicles', 'Make')
+    Model = apps.get_model('vehicles', 'Model')
+    Vehicle = apps.get_model('vehicles', 'Vehicle')
+    ProductFitment = apps.get_model('products', 'ProductFitment')
+
+    Make.objects.update(models_count=_count(Model.objects.filter(make_id=OuterRef('pk'))))
+    Model.objects.update(vehicles_count=_count(Vehicle.objects.filter(model_id=OuterRef('pk'))))
+    Vehicle.objects.update(parts_count=_count(ProductFitment.objects.filter(vehicle_id=OuterRef('pk'))))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0002_stored_labels'),
+        ('products', '0008_category_product_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='make',
+            name='models_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='model',
+            name='vehicles_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='parts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,27 @@
 from django.db import models
+from .labels import model_label, refresh_labels, vehicle_label
 
 class Make(models.Model):
     """Car manufacturers"""
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True)    
+    # Maintained by signals (see counters.py)
+    models_count = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         ordering = ['name']
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        renamed = False
+        if self.pk:
+            old_name = Make.objects.filter(pk=self.pk).values_list('name', flat=True).first()
+            renamed = old_name is not None and old_name != self.name
+        super().save(*args, **kwargs)
+        if renamed:
+            refresh_labels(makes=[self.pk])
 
 
 class Model(models.Model):
@@ -16,13 +29,23 @@ class Model(models.Model):
     make = models.ForeignKey(Make, on_delete=models.CASCADE, related_name='models')
     name = models.CharField(max_length=100)
     slug = models.SlugField()
+    # "Toyota Camry", kept in step with the make's name (see labels.py)
+    label = models.CharField(max_length=201, blank=True, editable=False)
+    vehicles_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['name']
         unique_together = ['make', 'name']
     
     def __str__(self):
-        return f"{self.make.name} {self.name}"
+        return self.label or model_label(self.make.name, self.name)
+    
+    def save(self, *args, **kwargs):
+        old_label = self.label
+        self.label = model_label(self.make.name, self.name)
+        super().save(*args, **kwargs)
+        if old_label and old_label != self.label:
+            refresh_labels(models=[self.pk])
 
 
 class Vehicle(models.Model):
@@ -32,11 +55,18 @@ class Vehicle(models.Model):
     trim = models.CharField(max_length=100, blank=True)
     engine = models.CharField(max_length=100, blank=True)
     body_type = models.CharField(max_length=50, blank=True)
+    # "2018 Toyota Camry LE", so rendering a vehicle needs no make/model lookups
+    label = models.CharField(max_length=320, blank=True, editable=False)
+    # Products with a fitment for this vehicle
+    parts_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['-year', 'trim']
         unique_together = ['model', 'year', 'trim']
     
     def __str__(self):
-        trim_text = f" {self.trim}" if self.trim else ""
-        return f"{self.year} {self.model.make.name} {self.model.name}{trim_text}"
\ No newline at end of file
+        return self.label or vehicle_label(self.year, str(self.model), self.trim)
+    
+    def save(self, *args, **kwargs):
+        self.label = vehicle_label(self.year, str(self.model), self.trim)
+        super().save(*args, **kwargs)
\ No newline at end of file
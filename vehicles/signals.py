@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Make, Model, Vehicle
+from .counters import adjust, refresh_models_counts, refresh_vehicles_counts
+from .vehicle_tree import invalidate_vehicle_tree
+
+
+# ==================== SELECTOR TREE ====================
+@receiver([post_save, post_delete], sender=Make)
+@receiver([post_save, post_delete], sender=Model)
+@receiver([post_save, post_delete], sender=Vehicle)
+def refresh_vehicle_tree(sender, **kwargs):
+    invalidate_vehicle_tree()
+
+
+# ==================== COUNTERS ====================
+@receiver(pre_save, sender=Model)
+@receiver(pre_save, sender=Vehicle)
+def remember_parent(sender, instance, **kwargs):
+    """The make (or model) the row belonged to, in case the save moves it"""
+    parent = 'make_id' if sender is Model else 'model_id'
+    instance._counted_parent = None
+    if instance.pk:
+        instance._counted_parent = sender.objects.filter(pk=instance.pk).values_list(parent, flat=True).first()
+
+
+@receiver(post_save, sender=Model)
+def count_model(sender, instance, created, **kwargs):
+    if created:
+        adjust(Make, instance.make_id, 'models_count', 1)
+    elif instance._counted_parent not in (None, instance.make_id):
+        refresh_models_counts([instance._counted_parent, instance.make_id])
+
+
+@receiver(post_delete, sender=Model)
+def uncount_model(sender, instance, **kwargs):
+    adjust(Make, instance.make_id, 'models_count', -1)
+
+
+@receiver(post_save, sender=Vehicle)
+def count_vehicle(sender, instance, created, **kwargs):
+    if created:
+        adjust(Model, instance.model_id, 'vehicles_count', 1)
+    elif instance._counted_parent not in (None, instance.model_id):
+        refresh_vehicles_counts([instance._counted_parent, instance.model_id])
+
+
+@receiver(post_delete, sender=Vehicle)
+def uncount_vehicle(sender, instance, **kwargs):
+    adjust(Model, instance.model_id, 'vehicles_count', -1)
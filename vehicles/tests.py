@@ -1,3 +1,304 @@
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from cars.testing import (
+    CatalogTestCase, ChangelistQueryBudgetMixin, make_category, make_customer, make_product, make_vehicle,
+)
+from customers.models import CustomerVehicle
+from products.catalog_index import catalog_index
+from products.models import ProductFitment
+
+from . import vin
+from .counters import refresh_models_counts, refresh_parts_counts, refresh_vehicles_counts
+from .labels import refresh_labels
+from .models import Make, Model, Vehicle
+from .vehicle_tree import MAX_AGE, get_vehicle_tree
+from .vin import DecodedVin, InvalidVin, check_digit, decode_vin, normalize_vin, resolve_vin, resolve_vins
+
+
+class ChangelistQueryBudgetTests(ChangelistQueryBudgetMixin, TestCase):
+    app_label = 'vehicles'
+    # Four list_filter columns, each listing its choices with a query
+    query_budgets = {'vehicle': 10}
+
+
+# ==================== SELECTOR API ====================
+class SelectorApiTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.camry_2018 = make_vehicle('Toyota', 'Camry', 2018, 'LE', engine='2.5L')
+        cls.camry_2019 = make_vehicle('Toyota', 'Camry', 2019, 'SE')
+        cls.corolla = make_vehicle('Toyota', 'Corolla', 2019, 'L')
+        cls.civic = make_vehicle('Honda', 'Civic', 2016, 'EX')
+        cls.toyota, cls.camry = cls.camry_2018.model.make, cls.camry_2018.model
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(f'vehicles:{name}', args=args), params)
+
+    def test_years_makes_models_and_vehicles(self):
+        self.assertEqual(self.get('api_years').json(), [2019, 2018, 2016])
+        self.assertEqual(self.get('api_years', make=self.toyota.pk).json(), [2019, 2018])
+        self.assertEqual([make['name'] for make in self.get('api_makes', year=2016).json()], ['Honda'])
+        models = self.get('api_models', self.toyota.pk, year=2018).json()
+        self.assertEqual([(model['name'], model['years']) for model in models], [('Camry', [2019, 2018])])
+        vehicles = self.get('api_vehicles', self.camry.pk, year=2018).json()
+        self.assertEqual(vehicles, [{
+            'id': self.camry_2018.pk, 'year': 2018, 'trim': 'LE', 'engine': '2.5L', 'body_type': '',
+            'label': '2018 Toyota Camry LE',
+        }])
+
+    def test_bad_and_unknown_parameters(self):
+        self.assertEqual(self.get('api_years', make='x').status_code, 400)
+        self.assertEqual(self.get('api_years', model=999999).status_code, 404)
+        self.assertEqual(self.get('api_models', 999999).status_code, 404)
+        self.assertEqual(self.get('api_makes', year='soon').status_code, 400)
+
+    def test_unknown_years_are_not_memoized(self):
+        tree = get_vehicle_tree()
+        for year in range(1900, 1920):
+            self.assertEqual(self.get('api_makes', year=year).status_code, 404)
+            self.assertEqual(self.get('api_vehicles', self.camry.pk, year=year).status_code, 404)
+        self.assertEqual(tree._payloads, {})
+
+    def test_repeat_lookups_are_served_from_memory(self):
+        self.get('api_models', self.toyota.pk)
+        with self.assertNumQueries(0):
+            response = self.get('api_models', self.toyota.pk)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={MAX_AGE}')
+
+        again = self.client.get(
+            reverse('vehicles:api_models', args=[self.toyota.pk]), headers={'if-none-match': response['ETag']},
+        )
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], response['ETag'])
+
+    def test_tree_is_rebuilt_after_vehicles_change(self):
+        etag = self.get('api_years')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            make_vehicle('Honda', 'Civic', 2021, 'Sport')
+        response = self.get('api_years')
+        self.assertEqual(response.json(), [2021, 2019, 2018, 2016])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_selecting_a_vehicle_remembers_it(self):
+        response = self.client.post(reverse('vehicles:select_vehicle'), {'vehicle_id': self.civic.pk})
+        self.assertRedirects(response, reverse('products:product_list'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['selected_vehicle_id'], self.civic.pk)
+        self.assertEqual(self.client.session['selected_vehicle_name'], '2016 Honda Civic EX')
+
+        response = self.client.post(reverse('vehicles:select_vehicle'), {'vehicle_id': 'nope'}, follow=True)
+        self.assertContains(response, 'Please choose a vehicle.')
+        self.assertEqual(self.client.session['selected_vehicle_id'], self.civic.pk)
+
+
+# ==================== LABELS ====================
+class LabelTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.le = make_vehicle('Toyota', 'Camry', 2018, 'LE')
+        cls.base = make_vehicle('Toyota', 'Camry', 2019, '')
+        cls.other = make_vehicle('Honda', 'Civic', 2016, 'EX')
+
+    def labels(self):
+        return dict(Vehicle.objects.values_list('pk', 'label'))
+
+    def test_labels_are_written_on_save(self):
+        self.assertEqual(self.le.model.label, 'Toyota Camry')
+        self.assertEqual(self.labels(), {
+            self.le.pk: '2018 Toyota Camry LE',
+            self.base.pk: '2019 Toyota Camry',
+            self.other.pk: '2016 Honda Civic EX',
+        })
+        vehicle = Vehicle.objects.get(pk=self.le.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(vehicle), '2018 Toyota Camry LE')
+
+    def test_renaming_a_make_rewrites_the_labels_below_it(self):
+        make = self.le.model.make
+        make.name = 'Toyota Motor'
+        make.save()
+        self.assertEqual(Model.objects.get(pk=self.le.model_id).label, 'Toyota Motor Camry')
+        labels = self.labels()
+        self.assertEqual(labels[self.le.pk], '2018 Toyota Motor Camry LE')
+        self.assertEqual(labels[self.base.pk], '2019 Toyota Motor Camry')
+        self.assertEqual(labels[self.other.pk], '2016 Honda Civic EX')
+
+    def test_renaming_a_model_rewrites_its_vehicles(self):
+        model = Model.objects.get(pk=self.le.model_id)
+        model.name = 'Camry Hybrid'
+        model.save()
+        self.assertEqual(self.labels()[self.le.pk], '2018 Toyota Camry Hybrid LE')
+
+    def test_refresh_labels_repairs_stale_rows(self):
+        Vehicle.objects.filter(pk=self.other.pk).update(label='stale')
+        self.assertEqual(refresh_labels(makes=[self.other.model.make_id]), 1)
+        self.assertEqual(self.labels()[self.other.pk], '2016 Honda Civic EX')
+
+
+# ==================== GARAGE ====================
+class GaragePartsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = make_customer()
+        cls.camry = make_vehicle('Toyota', 'Camry', 2018, 'LE')
+        cls.civic = make_vehicle('Honda', 'Civic', 2016, 'EX')
+        CustomerVehicle.objects.create(customer=cls.customer, vehicle=cls.camry, is_primary=True)
+        CustomerVehicle.objects.create(customer=cls.customer, vehicle=cls.civic)
+        brakes, wipers = make_category('Brakes'), make_category('Wipers')
+        cls.pad = make_product('Camry Pad', brakes)
+        cls.blade = make_product('Wiper Blade', wipers)
+        cls.rotor = make_product('Civic Rotor', brakes)
+        retired = make_product('Old Blade', wipers, is_active=False)
+        for product, vehicles in [
+            (cls.pad, [cls.camry]), (cls.blade, [cls.camry, cls.civic]), (cls.rotor, [cls.civic]),
+            (retired, [cls.camry, cls.civic]),
+        ]:
+            for vehicle in vehicles:
+                ProductFitment.objects.create(product=product, vehicle=vehicle)
+        cls.brakes = brakes
+
+    def pks(self, keys):
+        return {pk for _, pk in keys}
+
+    def test_any_and_all_vehicles(self):
+        vehicles = [self.camry.pk, self.civic.pk]
+        found = catalog_index.garage_products(vehicles)
+        self.assertEqual(self.pks(found.keys), {self.pad.pk, self.blade.pk, self.rotor.pk})
+        self.assertEqual(self.pks(found.by_vehicle[self.civic.pk]), {self.blade.pk, self.rotor.pk})
+
+        found = catalog_index.garage_products(vehicles, match='all')
+        self.assertEqual(self.pks(found.keys), {self.blade.pk})
+        self.assertEqual(self.pks(found.by_vehicle[self.camry.pk]), {self.blade.pk})
+
+        found = catalog_index.garage_products(vehicles, category_ids={self.brakes.pk})
+        self.assertEqual(self.pks(found.keys), {self.pad.pk, self.rotor.pk})
+        self.assertEqual(catalog_index.garage_products([]).keys, [])
+
+    def test_vehicles_are_loaded_in_one_query(self):
+        catalog_index.garage_products([])
+        with self.assertNumQueries(1):
+            catalog_index.garage_products([self.camry.pk, self.civic.pk])
+        with self.assertNumQueries(0):
+            catalog_index.garage_products([self.civic.pk, self.camry.pk], match='all')
+
+    def test_garage_parts_page(self):
+        self.client.force_login(self.customer.user)
+        url = reverse('vehicles:garage_parts')
+        response = self.client.get(url)
+        groups = {group['customer_vehicle'].vehicle_id: group for group in response.context['groups']}
+        self.assertEqual(set(groups[self.camry.pk]['products']), {self.pad, self.blade})
+        self.assertEqual(groups[self.civic.pk]['total'], 2)
+        self.assertEqual(response.context['total'], 3)
+
+        response = self.client.get(url, {'match': 'all'})
+        self.assertEqual(list(response.context['page']), [self.blade])
+
+
+# ==================== VIN ====================
+class VinTests(CatalogTestCase):
+    # A 2003 Honda Accord with a valid check digit
+    ACCORD = '1HGCM82633A004352'
+    # A 2018 Toyota Camry, check digit left wrong
+    CAMRY = '4T1B11HK0JU123456'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lx = make_vehicle('Honda', 'Accord', 2003, 'LX')
+        cls.ex = make_vehicle('Honda', 'Accord', 2003, 'EX')
+        make_vehicle('Honda', 'Accord', 2004, 'LX')
+
+    def test_decoding(self):
+        self.assertEqual(decode_vin(self.ACCORD), DecodedVin(self.ACCORD, 'Honda', 'Accord', 2003, True))
+        decoded = decode_vin('4t1b11hk0ju 123-456')
+        self.assertEqual(
+            (decoded.vin, decoded.make, decoded.model, decoded.year), (self.CAMRY, 'Toyota', 'Camry', 2018),
+        )
+        self.assertFalse(decoded.check_digit_ok)
+        self.assertEqual(check_digit(self.CAMRY), 'X')
+
+    def test_invalid_vins(self):
+        for vin in ['', '1HGCM82633A00435', '1HGCM82633A0043521', '1HGCM82633A00435I', None]:
+            with self.subTest(vin=vin):
+                with self.assertRaises(InvalidVin):
+                    normalize_vin(vin)
+
+    def test_fleet_prefixes_are_decoded_once(self):
+        vins = [self.ACCORD[:11] + f'{serial:06d}' for serial in range(50)]
+        vin._decode_prefix.cache_clear()
+        results = resolve_vins(vins + ['bogus'])
+        info = vin._decode_prefix.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 49))
+        self.assertEqual(results[-1][1:3], (None, []))
+        self.assertIn('17 characters', results[-1][3])
+
+    def test_resolving_to_vehicles_without_a_query(self):
+        get_vehicle_tree()
+        with self.assertNumQueries(0):
+            decoded, vehicles = resolve_vin(self.ACCORD)
+        self.assertEqual({vehicle['id'] for vehicle in vehicles}, {self.lx.pk, self.ex.pk})
+        self.assertEqual(resolve_vin(self.CAMRY)[1], [])
+
+    def test_vin_endpoint(self):
+        data = self.client.get(reverse('vehicles:api_vin', args=[self.ACCORD])).json()
+        self.assertEqual((data['make'], data['model'], data['year']), ('Honda', 'Accord', 2003))
+        self.assertEqual(data['model_id'], self.lx.model_id)
+        self.assertEqual(data['make_id'], self.lx.model.make_id)
+        self.assertEqual(len(data['vehicles']), 2)
+
+        response = self.client.get(reverse('vehicles:api_vin', args=['TOO-SHORT']))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+# ==================== COUNTERS ====================
+class VehicleCounterTests(CatalogTestCase):
+    def counts(self):
+        return (
+            dict(Make.objects.values_list('name', 'models_count')),
+            dict(Model.objects.values_list('name', 'vehicles_count')),
+        )
+
+    def test_counters_follow_saves_moves_and_deletes(self):
+        camry = make_vehicle('Toyota', 'Camry', 2018, 'LE')
+        make_vehicle('Toyota', 'Camry', 2019, 'LE')
+        corolla = make_vehicle('Toyota', 'Corolla', 2019, 'L')
+        make_vehicle('Honda', 'Civic', 2016, 'EX')
+        self.assertEqual(self.counts(), (
+            {'Toyota': 2, 'Honda': 1},
+            {'Camry': 2, 'Corolla': 1, 'Civic': 1},
+        ))
+
+        camry.model = corolla.model
+        camry.save()
+        civic = Model.objects.get(name='Civic')
+        civic.make = camry.model.make
+        civic.save()
+        corolla.delete()
+        self.assertEqual(self.counts(), (
+            {'Toyota': 3, 'Honda': 0},
+            {'Camry': 1, 'Corolla': 1, 'Civic': 1},
+        ))
+
+    def test_parts_count_follows_fitments(self):
+        camry = make_vehicle('Toyota', 'Camry', 2018, 'LE')
+        civic = make_vehicle('Honda', 'Civic', 2016, 'EX')
+        category = make_category('Brakes')
+        pad, rotor = make_product('Pad', category), make_product('Rotor', category)
+        ProductFitment.objects.create(product=pad, vehicle=camry)
+        fitment = ProductFitment.objects.create(product=rotor, vehicle=camry)
+        fitment.vehicle = civic
+        fitment.save()
+        rotor.delete()
+        ProductFitment.objects.create(product=pad, vehicle=civic)
+        self.assertEqual(dict(Vehicle.objects.values_list('trim', 'parts_count')), {'LE': 1, 'EX': 1})
+
+    def test_refresh_corrects_drift(self):
+        camry = make_vehicle('Toyota', 'Camry', 2018, 'LE')
+        Make.objects.update(models_count=7)
+        Model.objects.update(vehicles_count=7)
+        Vehicle.objects.update(parts_count=7)
+        refresh_models_counts()
+        refresh_vehicles_counts([camry.model_id])
+        refresh_parts_counts()
+        self.assertEqual(self.counts(), ({'Toyota': 1}, {'Camry': 1}))
+        self.assertEqual(Vehicle.objects.get().parts_count, 0)
@@ -6,4 +6,12 @@ app_name = 'vehicles'
 urlpatterns = [
     path('select/', views.select_vehicle, name='select_vehicle'),
     path('my-garage/', views.my_garage, name='my_garage'),
+    path('my-garage/parts/', views.garage_parts, name='garage_parts'),
+    path('my-garage/<int:pk>/primary/', views.set_primary, name='set_primary'),
+    path('my-garage/<int:pk>/remove/', views.remove_vehicle, name='remove_vehicle'),
+    path('api/years/', views.api_years, name='api_years'),
+    path('api/makes/', views.api_makes, name='api_makes'),
+    path('api/makes/<int:make_id>/models/', views.api_models, name='api_models'),
+    path('api/models/<int:model_id>/vehicles/', views.api_vehicles, name='api_vehicles'),
+    path('api/vin/<str:vin>/', views.api_vin, name='api_vin'),
 ]
\ No newline at end of file
@@ -0,0 +1,139 @@
+"""
+In-process Year / Make / Model / trim tree for the vehicle selector.
+
+Every worker builds the tree from three queries the first time it is asked
+and then answers the selector's JSON endpoints from memory. Each response
+body is serialized once per tree and carries an ETag derived from its
+content, so repeat lookups are a dictionary hit or a 304.
+
+Make, Model and Vehicle signals store a new random generation in the cache
+after commit; a worker whose tree was built for another generation rebuilds
+it on the next request. A plain set() of a value nobody has seen works where
+incr() would not: on the file-based cache incr() is a get and a set, and two
+commits bumping at once could leave a worker on a tree missing the second.
+"""
+import hashlib
+import json
+import secrets
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = 'vehicle_tree:generation'
+
+# Browsers and proxies may reuse a response this long without asking again
+MAX_AGE = 60 * 60
+
+
+class VehicleTree:
+    def __init__(self, generation, makes, models, vehicles):
+        self.generation = generation
+        self.makes = [{'id': pk, 'name': name, 'slug': slug} for pk, name, slug in makes]
+        self.models = {}
+        self.models_by_make = {make['id']: [] for make in self.makes}
+        for pk, make_id, name, slug in models:
+            model = {'id': pk, 'make_id': make_id, 'name': name, 'slug': slug, 'years': []}
+            self.models[pk] = model
+            self.models_by_make[make_id].append(model)
+        self.vehicles_by_model = {pk: [] for pk in self.models}
+        for pk, model_id, year, trim, engine, body_type, label in vehicles:
+            self.vehicles_by_model[model_id].append({
+                'id': pk, 'year': year, 'trim': trim, 'engine': engine, 'body_type': body_type, 'label': label,
+            })
+        for model_id, model in self.models.items():
+            model['years'] = sorted({vehicle['year'] for vehicle in self.vehicles_by_model[model_id]}, reverse=True)
+        self.model_years = {year for model in self.models.values() for year in model['years']}
+        make_names = {make['id']: make['name'].lower() for make in self.makes}
+        self.model_ids_by_name = {
+            (make_names[model['make_id']], model['name'].lower()): pk for pk, model in self.models.items()
+        }
+        self._payloads = {}
+
+    # ==================== LOOKUPS ====================
+    def years(self, make_id=None, model_id=None):
+        if model_id is not None:
+            models = [self.models[model_id]]
+        elif make_id is not None:
+            models = self.models_by_make[make_id]
+        else:
+            models = self.models.values()
+        return sorted({year for model in models for year in model['years']}, reverse=True)
+
+    def makes_for(self, year=None):
+        if year is None:
+            return self.makes
+        return [
+            make for make in self.makes
+            if any(year in model['years'] for model in self.models_by_make[make['id']])
+        ]
+
+    def models_for(self, make_id, year=None):
+        return [
+            {key: value for key, value in model.items() if key != 'make_id'}
+            for model in self.models_by_make[make_id]
+            if year is None or year in model['years']
+        ]
+
+    def vehicles_for(self, model_id, year=None):
+        return [vehicle for vehicle in self.vehicles_by_model[model_id] if year is None or vehicle['year'] == year]
+
+    def find_model(self, make_name, model_name):
+        """Model id by make and model name (any case), or None"""
+        if not make_name or not model_name:
+            return None
+        return self.model_ids_by_name.get((make_name.lower(), model_name.lower()))
+
+    def has_make(self, make_id):
+        return make_id in self.models_by_make
+
+    def has_model(self, model_id):
+        return model_id in self.models
+
+    def has_year(self, year):
+        return year in self.model_years
+
+    # ==================== RESPONSES ====================
+    def payload(self, name, *args):
+        """(JSON body, ETag) of lookup `name` called with args, serialized once per tree"""
+        key = (name, *args)
+        cached = self._payloads.get(key)
+        if cached is None:
+            body = json.dumps(getattr(self, name)(*args), separators=(',', ':')).encode()
+            cached = (body, '"%s"' % hashlib.md5(body, usedforsecurity=False).hexdigest())
+            self._payloads[key] = cached
+        return cached
+
+
+_tree = None
+_lock = threading.Lock()
+
+
+def get_vehicle_tree():
+    """This worker's tree, rebuilt if vehicles changed since it was built"""
+    global _tree
+    generation = cache.get(GENERATION_KEY, 0)
+    tree = _tree
+    if tree is not None and tree.generation == generation:
+        return tree
+    with _lock:
+        if _tree is None or _tree.generation != generation:
+            from .models import Make, Model, Vehicle
+
+            _tree = VehicleTree(
+                generation,
+                Make.objects.order_by('name').values_list('pk', 'name', 'slug'),
+                Model.objects.order_by('name').values_list('pk', 'make_id', 'name', 'slug'),
+                Vehicle.objects.order_by('-year', 'trim')
+                .values_list('pk', 'model_id', 'year', 'trim', 'engine', 'body_type', 'label'),
+            )
+        return _tree
+
+
+def invalidate_vehicle_tree():
+    """Make every worker rebuild its tree once the current transaction commits"""
+    transaction.on_commit(_bump_generation)
+
+
+def _bump_generation():
+    cache.set(GENERATION_KEY, secrets.token_hex(8), None)
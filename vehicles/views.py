@@ -1,37 +1,197 @@
-from django.shortcuts import render, redirect
-from .models import Make, Model, Vehicle
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import render, redirect, get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_GET, require_POST
+from customers.models import CustomerVehicle
+from products.catalog_index import catalog_index
+from products.models import Product
+from products.pagination import paginate_keys
+from .models import Vehicle
+from .vehicle_tree import MAX_AGE, get_vehicle_tree
+from .vin import InvalidVin, resolve_vin
+
+# Parts listed under each vehicle on the garage parts page
+GARAGE_PARTS_PER_VEHICLE = 8
 
 def select_vehicle(request):
     """Vehicle selection wizard"""
     if request.method == 'POST':
-        vehicle_id = request.POST.get('vehicle_id')
-        request.session['selected_vehicle_id'] = vehicle_id
+        try:
+            vehicle = Vehicle.objects.only('label').get(pk=int(request.POST.get('vehicle_id')))
+        except (TypeError, ValueError, Vehicle.DoesNotExist):
+            messages.error(request, "Please choose a vehicle.")
+            return redirect('vehicles:select_vehicle')
+        # The name is what the storefront shows (and what turns on its fits / all toggle)
+        request.session['selected_vehicle_id'] = vehicle.pk
+        request.session['selected_vehicle_name'] = vehicle.label
         return redirect('products:product_list')
     
-    makes = Make.objects.all()
-    
-    # AJAX data for dynamic dropdowns
-    make_id = request.GET.get('make')
-    model_id = request.GET.get('model')
-    
-    models = Model.objects.filter(make_id=make_id) if make_id else []
-    vehicles = Vehicle.objects.filter(model_id=model_id) if model_id else []
-    
+    # Models and vehicles are loaded by the page from the JSON endpoints below
     context = {
-        'makes': makes,
-        'models': models,
-        'vehicles': vehicles,
+        'makes': get_vehicle_tree().makes,
     }
     return render(request, 'vehicles/select_vehicle.html', context)
 
+# ==================== SELECTOR API ====================
+def _tree_response(request, tree, name, *args):
+    """JSON for a tree lookup, or 304 if the client already has it"""
+    body, etag = tree.payload(name, *args)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response.headers['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=MAX_AGE)
+    return response
+
+def _int_param(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+def _year_param(request, tree):
+    """?year= as a number, Http404 if no vehicle is from that year"""
+    # Only years that exist get a payload memoized on the tree
+    year = _int_param(request, 'year')
+    if year is not None and not tree.has_year(year):
+        raise Http404("No vehicles from that year")
+    return year
+
+@require_GET
+def api_years(request):
+    """Years with vehicles, optionally only for ?make= or ?model="""
+    tree = get_vehicle_tree()
+    try:
+        make_id, model_id = _int_param(request, 'make'), _int_param(request, 'model')
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    if (make_id is not None and not tree.has_make(make_id)) or (model_id is not None and not tree.has_model(model_id)):
+        raise Http404("No such make or model")
+    return _tree_response(request, tree, 'years', make_id, model_id)
+
+@require_GET
+def api_makes(request):
+    """Makes, optionally only those with a vehicle in ?year="""
+    tree = get_vehicle_tree()
+    try:
+        year = _year_param(request, tree)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return _tree_response(request, tree, 'makes_for', year)
+
+@require_GET
+def api_models(request, make_id):
+    """Models of a make with their years, optionally only those built in ?year="""
+    tree = get_vehicle_tree()
+    if not tree.has_make(make_id):
+        raise Http404("No such make")
+    try:
+        year = _year_param(request, tree)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return _tree_response(request, tree, 'models_for', make_id, year)
+
+@require_GET
+def api_vehicles(request, model_id):
+    """Year / trim / engine variants of a model, optionally only ?year="""
+    tree = get_vehicle_tree()
+    if not tree.has_model(model_id):
+        raise Http404("No such model")
+    try:
+        year = _year_param(request, tree)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    return _tree_response(request, tree, 'vehicles_for', model_id, year)
+
+@require_GET
+def api_vin(request, vin):
+    """Make, model and year decoded from a VIN, plus the vehicles of that model year"""
+    tree = get_vehicle_tree()
+    try:
+        decoded, vehicles = resolve_vin(vin, tree)
+    except InvalidVin as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    model_id = tree.find_model(decoded.make, decoded.model)
+    data = {
+        'vin': decoded.vin,
+        'make': decoded.make,
+        'make_id': tree.models[model_id]['make_id'] if model_id else None,
+        'model': decoded.model,
+        'model_id': model_id,
+        'year': decoded.year,
+        'check_digit_ok': decoded.check_digit_ok,
+        'vehicles': vehicles,
+    }
+    response = JsonResponse(data)
+    patch_cache_control(response, public=True, max_age=MAX_AGE)
+    return response
+
 def my_garage(request):
     """Customer's saved vehicles"""
     if not request.user.is_authenticated:
         return redirect('customers:login')
     
-    customer_vehicles = request.user.customer.vehicles.all()
+    customer_vehicles = request.user.customer.vehicles.select_related('vehicle')
+    
+    context = {
+        'customer_vehicles': customer_vehicles,
+    }
+    return render(request, 'vehicles/my_garage.html', context)
+
+@login_required
+@require_POST
+def set_primary(request, pk):
+    """Make one saved vehicle the customer's primary vehicle"""
+    customer_vehicle = get_object_or_404(CustomerVehicle, pk=pk, customer=request.user.customer)
+    with transaction.atomic():
+        request.user.customer.vehicles.exclude(pk=pk).update(is_primary=False)
+        CustomerVehicle.objects.filter(pk=customer_vehicle.pk).update(is_primary=True)
+    return redirect('vehicles:my_garage')
+
+@login_required
+@require_POST
+def remove_vehicle(request, pk):
+    """Remove a vehicle from the customer's garage"""
+    get_object_or_404(CustomerVehicle, pk=pk, customer=request.user.customer).delete()
+    messages.info(request, "Vehicle removed from your garage.")
+    return redirect('vehicles:my_garage')
+
+@login_required
+def garage_parts(request):
+    """Parts that fit any (or all) of the customer's saved vehicles, grouped by vehicle"""
+    match = 'all' if request.GET.get('match') == 'all' else 'any'
+    customer_vehicles = list(
+        request.user.customer.vehicles.select_related('vehicle').order_by('-is_primary', 'added_at')
+    )
+    found = catalog_index.garage_products([cv.vehicle_id for cv in customer_vehicles], match=match)
+    products = Product.objects.filter(is_active=True).select_related('category', 'manufacturer')
+    
+    page = None
+    groups = []
+    if match == 'all':
+        # Every vehicle fits the same parts, one paged list
+        page = paginate_keys(found.keys, products, after=request.GET.get('after'), before=request.GET.get('before'))
+    else:
+        shown = {cv.vehicle_id: found.by_vehicle[cv.vehicle_id][:GARAGE_PARTS_PER_VEHICLE] for cv in customer_vehicles}
+        in_bulk = products.in_bulk({pk for keys in shown.values() for _, pk in keys})
+        for cv in customer_vehicles:
+            groups.append({
+                'customer_vehicle': cv,
+                'products': [in_bulk[pk] for _, pk in shown[cv.vehicle_id] if pk in in_bulk],
+                'total': len(found.by_vehicle[cv.vehicle_id]),
+            })
     
     context = {
+        'match': match,
         'customer_vehicles': customer_vehicles,
+        'total': len(found.keys),
+        'page': page,
+        'groups': groups,
     }
-    return render(request, 'vehicles/my_garage.html', context)
\ No newline at end of file
+    return render(request, 'vehicles/garage_parts.html', context)
@@ -0,0 +1,127 @@
+"""
+Offline VIN decoding.
+
+A VIN is read as WMI (positions 1-3, the manufacturer), VDS (4-8, the model
+line), check digit (9), model year (10), plant (11) and serial (12-17).
+Make, model and year come from the tables in data/vin_tables.json, the
+model by the longest VDS prefix listed for the WMI. Everything but the
+check digit depends only on positions 1-8 and 10, so decoded prefixes are
+kept in an LRU cache and a fleet list of the same model decodes each
+prefix once.
+
+resolve_vin() then finds the matching Vehicle rows in the selector tree
+(see vehicle_tree.py) without a query.
+"""
+import json
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+from pathlib import Path
+
+from .vehicle_tree import get_vehicle_tree
+
+TABLES_PATH = Path(__file__).resolve().parent / 'data' / 'vin_tables.json'
+
+# Decoded (WMI, VDS, year code) prefixes kept per process
+PREFIX_CACHE_SIZE = 4096
+
+# Letters and digits a VIN may contain (never I, O or Q), with their check digit values
+TRANSLITERATION = {
+    **{str(digit): digit for digit in range(10)},
+    'A': 1, 'B': 2, 'C': 3, 'D': 4, 'E': 5, 'F': 6, 'G': 7, 'H': 8,
+    'J': 1, 'K': 2, 'L': 3, 'M': 4, 'N': 5, 'P': 7, 'R': 9,
+    'S': 2, 'T': 3, 'U': 4, 'V': 5, 'W': 6, 'X': 7, 'Y': 8, 'Z': 9,
+}
+WEIGHTS = [8, 7, 6, 5, 4, 3, 2, 10, 0, 9, 8, 7, 6, 5, 4, 3, 2]
+
+DecodedVin = namedtuple('DecodedVin', ['vin', 'make', 'model', 'year', 'check_digit_ok'])
+
+
+class InvalidVin(ValueError):
+    pass
+
+
+@lru_cache(maxsize=1)
+def _tables():
+    with open(TABLES_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def normalize_vin(vin):
+    """Upper-cased VIN without spaces or dashes, InvalidVin unless it has 17 valid characters"""
+    vin = ''.join(str(vin or '').split()).replace('-', '').upper()
+    if len(vin) != 17:
+        raise InvalidVin(f'{vin!r} is not 17 characters long')
+    bad = sorted(set(vin) - set(TRANSLITERATION))
+    if bad:
+        raise InvalidVin(f'{vin!r} contains {", ".join(bad)}')
+    return vin
+
+
+def check_digit(vin):
+    total = sum(TRANSLITERATION[char] * weight for char, weight in zip(vin, WEIGHTS))
+    remainder = total % 11
+    return 'X' if remainder == 10 else str(remainder)
+
+
+def _model_year(code, seventh, north_american):
+    """Position 10 repeats every 30 years; pick the cycle"""
+    base = _tables()['years'].get(code)
+    if base is None:
+        return None
+    if north_american:
+        # Passenger vehicles sold in North America: a letter in position 7 means 2010 or later
+        return base + 30 if seventh.isalpha() else base
+    latest = date.today().year + 1
+    return base + 30 if base + 30 <= latest else base
+
+
+@lru_cache(maxsize=PREFIX_CACHE_SIZE)
+def _decode_prefix(wmi, vds, year_code):
+    """(make, model, year) for the parts of a VIN that do not depend on the serial number"""
+    tables = _tables()
+    make = tables['wmi'].get(wmi)
+    model = None
+    prefixes = tables['models'].get(wmi, {})
+    for length in range(len(vds), -1, -1):
+        model = prefixes.get(vds[:length])
+        if model is not None:
+            break
+    year = _model_year(year_code, vds[3], north_american=wmi[0] in '12345')
+    return make, model, year
+
+
+def decode_vin(vin):
+    """DecodedVin for a VIN; make, model or year is None where the tables do not know it"""
+    vin = normalize_vin(vin)
+    make, model, year = _decode_prefix(vin[:3], vin[3:8], vin[9])
+    return DecodedVin(vin, make, model, year, check_digit(vin) == vin[8])
+
+
+def resolve_vin(vin, tree=None):
+    """(DecodedVin, [vehicle dicts of the selector tree]) for a VIN, every trim of the decoded year"""
+    decoded = decode_vin(vin)
+    tree = tree or get_vehicle_tree()
+    model_id = tree.find_model(decoded.make, decoded.model)
+    if model_id is None or decoded.year is None:
+        return decoded, []
+    return decoded, tree.vehicles_for(model_id, decoded.year)
+
+
+def resolve_vins(vins):
+    """
+    Batch resolve_vin(): [(vin as given, DecodedVin or None, vehicles, error)].
+
+    One selector tree is used for the whole list and repeated prefixes come
+    from the LRU cache, so thousands of fleet VINs resolve without a query.
+    """
+    tree = get_vehicle_tree()
+    results = []
+    for vin in vins:
+        try:
+            decoded, vehicles = resolve_vin(vin, tree)
+        except InvalidVin as exc:
+            results.append((vin, None, [], str(exc)))
+        else:
+            results.append((vin, decoded, vehicles, None))
+    return results